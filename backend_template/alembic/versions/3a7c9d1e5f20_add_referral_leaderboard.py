@@ -0,0 +1,41 @@
+"""add referral_leaderboard table
+
+Revision ID: 3a7c9d1e5f20
+Revises: e1f6a3c2b985
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a7c9d1e5f20'
+down_revision: Union[str, None] = 'e1f6a3c2b985'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'referral_leaderboard',
+        sa.Column('period', sa.String(length=20), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('user_name', sa.String(length=255), nullable=True),
+        sa.Column('total_earnings', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('total_referrals', sa.Integer(), nullable=False),
+        sa.Column('active_referrals', sa.Integer(), nullable=False),
+        sa.Column('period_start', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('period', 'rank'),
+    )
+    op.create_index('idx_referral_balances_total_earnings', 'referral_balances', ['total_earnings', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_balances_total_earnings', table_name='referral_balances')
+    op.drop_table('referral_leaderboard')
@@ -0,0 +1,145 @@
+"""partition payment_transactions and referral_earnings by month
+
+Revision ID: 5c1e7d2a9b40
+Revises: 1378acccf36f
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e7d2a9b40'
+down_revision: Union[str, None] = '1378acccf36f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MONTHS_AHEAD = 3
+
+# table -> (partition key, foreign keys, indexes, unique constraints)
+TABLES = {
+    'payment_transactions': (
+        'created_at',
+        [
+            ('payment_transactions_user_id_fkey', 'user_id', 'users_profiles'),
+            ('payment_transactions_order_id_fkey', 'order_id', 'orders'),
+        ],
+        [
+            ('idx_payment_activation', ['activation_type', 'payment_type']),
+            ('idx_payment_commission', ['commission_distributed', 'payment_status']),
+            ('idx_payment_status_created', ['payment_status', 'created_at']),
+            ('idx_payment_user_status', ['user_id', 'payment_status']),
+            ('idx_payment_user_type', ['user_id', 'payment_type']),
+            ('ix_payment_transactions_activation_type', ['activation_type']),
+            ('ix_payment_transactions_commission_distributed', ['commission_distributed']),
+            ('ix_payment_transactions_order_id', ['order_id']),
+            ('ix_payment_transactions_payment_status', ['payment_status']),
+            ('ix_payment_transactions_payment_type', ['payment_type']),
+            ('ix_payment_transactions_razorpay_order_id', ['razorpay_order_id']),
+            ('ix_payment_transactions_razorpay_payment_id', ['razorpay_payment_id']),
+            ('ix_payment_transactions_user_id', ['user_id']),
+        ],
+        [
+            ('uq_payment_razorpay_order', ['razorpay_order_id', 'created_at']),
+        ],
+    ),
+    'referral_earnings': (
+        'earned_at',
+        [
+            ('referral_earnings_user_id_fkey', 'user_id', 'users_profiles'),
+            ('referral_earnings_referred_user_id_fkey', 'referred_user_id', 'users_profiles'),
+            ('referral_earnings_order_id_fkey', 'order_id', 'orders'),
+        ],
+        [],
+        [],
+    ),
+}
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Declarative partitioning is PostgreSQL only; other backends keep plain tables
+        return
+
+    now = datetime.now(timezone.utc)
+    current = datetime(now.year, now.month, 1, tzinfo=timezone.utc)
+
+    for table, (key, foreign_keys, indexes, uniques) in TABLES.items():
+        legacy = f"{table}_legacy"
+
+        op.execute(f"UPDATE {table} SET {key} = now() WHERE {key} IS NULL")
+        op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+            f"PARTITION BY RANGE ({key})"
+        )
+        op.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL")
+
+        # One partition per month from the oldest row up to MONTHS_AHEAD ahead
+        oldest = bind.execute(sa.text(f"SELECT min({key}) FROM {legacy}")).scalar()
+        month = current
+        if oldest is not None:
+            oldest = oldest.astimezone(timezone.utc)
+            month = min(datetime(oldest.year, oldest.month, 1, tzinfo=timezone.utc), current)
+        while month <= _add_months(current, MONTHS_AHEAD):
+            upper = _add_months(month, 1)
+            op.execute(
+                f"CREATE TABLE {_partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            month = upper
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+        op.execute(f"INSERT INTO {table} SELECT * FROM {legacy}")
+
+        # Keep the id sequence alive when the legacy table is dropped
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        op.execute(f"DROP TABLE {legacy}")
+
+        op.create_primary_key(f"{table}_pkey", table, ['id', key])
+        for name, column, target in foreign_keys:
+            op.create_foreign_key(name, table, target, [column], ['id'])
+        for name, columns in uniques:
+            op.create_unique_constraint(name, table, columns)
+        for name, columns in indexes:
+            op.create_index(name, table, columns, unique=False)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    for table, (key, foreign_keys, indexes, uniques) in TABLES.items():
+        partitioned = f"{table}_partitioned"
+
+        op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+        op.execute(f"CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {partitioned}")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+        # Dropping the parent drops every attached partition with it
+        op.execute(f"DROP TABLE {partitioned}")
+
+        op.create_primary_key(f"{table}_pkey", table, ['id'])
+        for name, column, target in foreign_keys:
+            op.create_foreign_key(name, table, target, [column], ['id'])
+        for name, columns in indexes:
+            if name == 'ix_payment_transactions_razorpay_order_id':
+                op.create_index(name, table, columns, unique=True)
+            else:
+                op.create_index(name, table, columns, unique=False)
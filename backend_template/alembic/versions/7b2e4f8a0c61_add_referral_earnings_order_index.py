@@ -0,0 +1,26 @@
+"""add referral_earnings (order_id, level) index
+
+Revision ID: 7b2e4f8a0c61
+Revises: 3a7c9d1e5f20
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e4f8a0c61'
+down_revision: Union[str, None] = '3a7c9d1e5f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Created on the partitioned parent; Postgres builds it on every partition
+    op.create_index('idx_referral_earnings_order_level', 'referral_earnings', ['order_id', 'level'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_earnings_order_level', table_name='referral_earnings')
@@ -0,0 +1,63 @@
+"""add referral_closure table
+
+Revision ID: 8d3f2b6e1a57
+Revises: 5c1e7d2a9b40
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f2b6e1a57'
+down_revision: Union[str, None] = '5c1e7d2a9b40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Guards the recursive backfill against referred_by cycles in legacy data
+MAX_BACKFILL_DEPTH = 50
+
+
+def upgrade() -> None:
+    op.create_table(
+        'referral_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['descendant_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+    )
+    op.create_index('idx_referral_closure_ancestor_depth', 'referral_closure', ['ancestor_id', 'depth'], unique=False)
+    op.create_index('idx_referral_closure_descendant_depth', 'referral_closure', ['descendant_id', 'depth'], unique=False)
+
+    # Backfill every (ancestor, descendant) pair from users_profiles.referred_by.
+    # Rows caught in a cycle are cut at MAX_BACKFILL_DEPTH and the first
+    # (shortest) path wins.
+    op.execute(
+        sa.text(
+            "WITH RECURSIVE chain (ancestor_id, descendant_id, depth) AS ("
+            "    SELECT referred_by, id, 1 FROM users_profiles "
+            "    WHERE referred_by IS NOT NULL AND referred_by <> id "
+            "  UNION ALL "
+            "    SELECT u.referred_by, c.descendant_id, c.depth + 1 "
+            "    FROM chain c JOIN users_profiles u ON u.id = c.ancestor_id "
+            "    WHERE u.referred_by IS NOT NULL "
+            "      AND u.referred_by <> c.descendant_id "
+            "      AND c.depth < :max_depth"
+            ") "
+            "INSERT INTO referral_closure (ancestor_id, descendant_id, depth) "
+            "SELECT ancestor_id, descendant_id, min(depth) FROM chain "
+            "GROUP BY ancestor_id, descendant_id"
+        ).bindparams(max_depth=MAX_BACKFILL_DEPTH)
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_closure_descendant_depth', table_name='referral_closure')
+    op.drop_index('idx_referral_closure_ancestor_depth', table_name='referral_closure')
+    op.drop_table('referral_closure')
@@ -0,0 +1,38 @@
+"""add payment razorpay order keys
+
+Revision ID: a2c6e9f4b817
+Revises: f4b9d2e7a153
+Create Date: 2026-10-21 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2c6e9f4b817'
+down_revision: Union[str, None] = 'f4b9d2e7a153'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Global uniqueness of razorpay_order_id, which the partitioned
+    # payment_transactions table can only enforce per month
+    op.create_table(
+        'payment_razorpay_orders',
+        sa.Column('razorpay_order_id', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('razorpay_order_id')
+    )
+    op.execute(
+        "INSERT INTO payment_razorpay_orders (razorpay_order_id, created_at) "
+        "SELECT razorpay_order_id, MIN(created_at) FROM payment_transactions "
+        "GROUP BY razorpay_order_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('payment_razorpay_orders')
@@ -0,0 +1,38 @@
+"""add referral clicks table
+
+Revision ID: a4e8b2d6c913
+Revises: f2a9c4e7b1d8
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e8b2d6c913'
+down_revision: Union[str, None] = 'f2a9c4e7b1d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'referral_clicks',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('referral_code', sa.String(length=20), nullable=False),
+        sa.Column('ip_address', sa.String(length=50), nullable=True),
+        sa.Column('user_agent', sa.Text(), nullable=True),
+        sa.Column('landing_page', sa.String(length=500), nullable=True),
+        sa.Column('clicked_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_referral_clicks_code_clicked', 'referral_clicks', ['referral_code', 'clicked_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_clicks_code_clicked', table_name='referral_clicks')
+    op.drop_table('referral_clicks')
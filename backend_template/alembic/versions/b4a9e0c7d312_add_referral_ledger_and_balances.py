@@ -0,0 +1,88 @@
+"""add referral_ledger and referral_balances
+
+Revision ID: b4a9e0c7d312
+Revises: 8d3f2b6e1a57
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4a9e0c7d312'
+down_revision: Union[str, None] = '8d3f2b6e1a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'referral_balances',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_earnings', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('pending_payouts', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('withdrawn', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('available_balance', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_table(
+        'referral_ledger',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entry_type', sa.String(length=30), nullable=False),
+        sa.Column('earnings_delta', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('pending_delta', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('withdrawn_delta', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('balance_after', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('earning_id', sa.Integer(), nullable=True),
+        sa.Column('payout_id', sa.Integer(), nullable=True),
+        sa.Column('note', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id']),
+        sa.ForeignKeyConstraint(['payout_id'], ['referral_payouts.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_referral_ledger_user_created', 'referral_ledger', ['user_id', 'created_at'], unique=False)
+
+    # Opening snapshot per user from the raw tables
+    op.execute(
+        "INSERT INTO referral_balances "
+        "(user_id, total_earnings, pending_payouts, withdrawn, available_balance) "
+        "SELECT user_id, sum(earned), sum(pending), sum(withdrawn), "
+        "       sum(earned) - sum(pending) - sum(withdrawn) "
+        "FROM ("
+        "    SELECT user_id, commission_amount AS earned, 0 AS pending, 0 AS withdrawn "
+        "    FROM referral_earnings WHERE status <> 'reversed' "
+        "  UNION ALL "
+        "    SELECT user_id, 0, "
+        "           CASE WHEN status = 'requested' THEN net_amount ELSE 0 END, "
+        "           CASE WHEN status IN ('approved', 'completed') THEN net_amount ELSE 0 END "
+        "    FROM referral_payouts"
+        ") movements "
+        "GROUP BY user_id"
+    )
+    op.execute(
+        "INSERT INTO referral_ledger "
+        "(user_id, entry_type, earnings_delta, pending_delta, withdrawn_delta, balance_after, note) "
+        "SELECT user_id, 'opening_balance', total_earnings, pending_payouts, withdrawn, "
+        "       available_balance, 'Backfilled from referral_earnings and referral_payouts' "
+        "FROM referral_balances"
+    )
+    # Legacy profile columns now mirror the snapshot
+    op.execute(
+        "UPDATE users_profiles SET "
+        "    total_earnings = b.total_earnings, "
+        "    available_balance = b.available_balance "
+        "FROM referral_balances b WHERE b.user_id = users_profiles.id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_referral_ledger_user_created', table_name='referral_ledger')
+    op.drop_table('referral_ledger')
+    op.drop_table('referral_balances')
@@ -0,0 +1,62 @@
+"""add daily rollup tables
+
+Revision ID: b7d3f9a1e264
+Revises: a4e8b2d6c913
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3f9a1e264'
+down_revision: Union[str, None] = 'a4e8b2d6c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _measure_columns():
+    return [
+        sa.Column('referrals', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('direct_referrals', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('commissions', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('commission_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('payout_requests', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('payout_amount', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('referral_earnings', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('referral_withdrawn', sa.Numeric(precision=14, scale=2), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        'affiliate_daily_rollups',
+        sa.Column('affiliate_user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        *_measure_columns(),
+        sa.ForeignKeyConstraint(['affiliate_user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('affiliate_user_id', 'day')
+    )
+    op.create_table(
+        'daily_rollups',
+        sa.Column('day', sa.Date(), nullable=False),
+        *_measure_columns(),
+        sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table(
+        'rollup_watermarks',
+        sa.Column('source', sa.String(length=50), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_watermarks')
+    op.drop_table('daily_rollups')
+    op.drop_table('affiliate_daily_rollups')
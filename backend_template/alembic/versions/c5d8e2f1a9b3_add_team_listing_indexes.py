@@ -0,0 +1,27 @@
+"""add team listing indexes
+
+Revision ID: c5d8e2f1a9b3
+Revises: 7b2e4f8a0c61
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2f1a9b3'
+down_revision: Union[str, None] = '7b2e4f8a0c61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_referral_referrer_level_id', 'referrals', ['referrer_id', 'level', 'id'], unique=False)
+    op.create_index('idx_commission_referral_affiliate', 'commissions', ['referral_id', 'affiliate_user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_commission_referral_affiliate', table_name='commissions')
+    op.drop_index('idx_referral_referrer_level_id', table_name='referrals')
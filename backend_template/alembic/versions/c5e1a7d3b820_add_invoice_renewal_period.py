@@ -0,0 +1,35 @@
+"""add invoice renewal period
+
+Revision ID: c5e1a7d3b820
+Revises: b7d3f9a1e264
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e1a7d3b820'
+down_revision: Union[str, None] = 'b7d3f9a1e264'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('invoices', sa.Column('server_id', sa.Integer(), nullable=True))
+    op.add_column('invoices', sa.Column('billing_period_start', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('invoices', sa.Column('billing_period_end', sa.DateTime(timezone=True), nullable=True))
+    op.create_foreign_key('fk_invoices_server_id', 'invoices', 'servers', ['server_id'], ['id'])
+    # NULLs are distinct, so order invoices (no server_id) are unaffected
+    op.create_index('uq_invoice_server_period', 'invoices', ['server_id', 'billing_period_start'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_invoice_server_period', table_name='invoices')
+    op.drop_constraint('fk_invoices_server_id', 'invoices', type_='foreignkey')
+    op.drop_column('invoices', 'billing_period_end')
+    op.drop_column('invoices', 'billing_period_start')
+    op.drop_column('invoices', 'server_id')
@@ -0,0 +1,45 @@
+"""add invoice dunning events
+
+Revision ID: d9f2b6c4a371
+Revises: c5e1a7d3b820
+Create Date: 2026-10-19 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f2b6c4a371'
+down_revision: Union[str, None] = 'c5e1a7d3b820'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'invoice_dunning_events',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invoice_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('stage', sa.Integer(), nullable=False),
+        sa.Column('days_overdue', sa.Integer(), nullable=False),
+        sa.Column('balance_due', sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column('late_fee', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['invoice_id'], ['invoices.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('invoice_id', 'stage', name='uq_dunning_event_invoice_stage')
+    )
+    op.create_index('idx_dunning_event_pending', 'invoice_dunning_events', ['sent_at', 'id'], unique=False)
+    op.create_index(op.f('ix_invoice_dunning_events_user_id'), 'invoice_dunning_events', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_invoice_dunning_events_user_id'), table_name='invoice_dunning_events')
+    op.drop_index('idx_dunning_event_pending', table_name='invoice_dunning_events')
+    op.drop_table('invoice_dunning_events')
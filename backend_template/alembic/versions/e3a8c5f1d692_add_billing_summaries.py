@@ -0,0 +1,39 @@
+"""add billing summaries
+
+Revision ID: e3a8c5f1d692
+Revises: d9f2b6c4a371
+Create Date: 2026-10-20 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8c5f1d692'
+down_revision: Union[str, None] = 'd9f2b6c4a371'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Rows are built on first read or by scripts/verify_billing_summaries.py --fix
+    op.create_table(
+        'billing_summaries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('outstanding_balance', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('pending_invoices', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('active_servers', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('monthly_cost', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('last_payment_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_payment_amount', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('billing_summaries')
@@ -0,0 +1,25 @@
+"""add commission feed index
+
+Revision ID: f2a9c4e7b1d8
+Revises: c5d8e2f1a9b3
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9c4e7b1d8'
+down_revision: Union[str, None] = 'c5d8e2f1a9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('idx_commission_affiliate_created_id', 'commissions', ['affiliate_user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_commission_affiliate_created_id', table_name='commissions')
@@ -0,0 +1,53 @@
+"""add invoice line items
+
+Revision ID: f4b9d2e7a153
+Revises: e3a8c5f1d692
+Create Date: 2026-10-20 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b9d2e7a153'
+down_revision: Union[str, None] = 'e3a8c5f1d692'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing invoices are converted by scripts/backfill_invoice_line_items.py
+    op.create_table(
+        'invoice_line_items',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('invoice_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('line_no', sa.Integer(), nullable=False),
+        sa.Column('item_type', sa.String(length=20), nullable=False),
+        sa.Column('ref_id', sa.Integer(), nullable=True),
+        sa.Column('description', sa.String(length=500), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('unit_price', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'),
+        sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('discount_amount', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('subtotal', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('tax_amount', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('total_amount', sa.Numeric(precision=12, scale=2), nullable=False, server_default='0'),
+        sa.Column('invoice_date', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['invoice_id'], ['invoices.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users_profiles.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('invoice_id', 'line_no', name='uq_invoice_line_item_line')
+    )
+    op.create_index('idx_invoice_line_item_type_ref_date', 'invoice_line_items', ['item_type', 'ref_id', 'invoice_date'], unique=False)
+    op.create_index('idx_invoice_line_item_date', 'invoice_line_items', ['invoice_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_invoice_line_item_date', table_name='invoice_line_items')
+    op.drop_index('idx_invoice_line_item_type_ref_date', table_name='invoice_line_items')
+    op.drop_table('invoice_line_items')
@@ -2,18 +2,26 @@
 Affiliate API Endpoints
 Handles subscription, referrals, commissions, and payouts
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from datetime import date, timedelta
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.affiliate_service import AffiliateService
+from app.services.affiliate_dashboard_cache import affiliate_dashboard_cache
+from app.services.analytics_rollup_service import AnalyticsRollupService
+from app.services.referral_code_index import referral_code_index
+from app.services.referral_graph import referral_graph_index
+from app.services.referral_tracking_buffer import referral_tracking_buffer
 from app.schemas.affiliate import (
     AffiliateSubscriptionCreate, AffiliateSubscriptionResponse,
     AffiliateStatsResponse, PayoutRequest, PayoutResponse,
     PayoutActionRequest, CommissionDetail, TeamMember,
-    AffiliateDashboard, CommissionRuleResponse
+    AffiliateDashboard, CommissionRuleResponse, CommissionRuleCreate, CommissionRuleUpdate,
+    AnalyticsTimeSeries
 )
 from app.models.users import UserProfile
 
@@ -34,6 +42,16 @@ async def validate_referral_code(
     from sqlalchemy import select
     from app.models.affiliate import AffiliateSubscription
 
+    # Codes are issued upper-case; pasted or typed ones often are not
+    code = code.strip().upper()
+
+    # Unknown codes (typos, bots) are answered without touching the database
+    if not await referral_code_index.might_exist(db, code):
+        return {"valid": False}
+    cached = referral_code_index.get_cached(("validate", code))
+    if cached is not None:
+        return cached
+
     # 1) Try affiliate subscription code (primary)
     result = await db.execute(
         select(AffiliateSubscription).where(AffiliateSubscription.referral_code == code)
@@ -67,7 +85,7 @@ async def validate_referral_code(
     if not inviter:
         return {"valid": False}
 
-    return {
+    response = {
         "valid": True,
         "code": normalized_code or code,
         "inviter": {
@@ -77,6 +95,8 @@ async def validate_referral_code(
         },
         "has_active_affiliate": bool(normalized_code)
     }
+    referral_code_index.remember(("validate", code), response)
+    return response
 
 @router.post("/subscription/create", response_model=AffiliateSubscriptionResponse)
 async def create_affiliate_subscription(
@@ -162,53 +182,48 @@ async def get_affiliate_dashboard(
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
-    """Get complete affiliate dashboard data"""
-    subscription = await affiliate_service.get_user_subscription(db, current_user.id)
-    stats = await affiliate_service.get_affiliate_stats(db, current_user.id)
-    recent_commissions = await affiliate_service.get_recent_commissions(db, current_user.id, limit=10)
-    
-    # Get pending payouts
-    from app.models.affiliate import Payout, PayoutStatus
-    from sqlalchemy import select, and_
-    
-    payout_result = await db.execute(
-        select(Payout).where(
-            and_(
-                Payout.affiliate_user_id == current_user.id,
-                Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-            )
-        )
+    """Get complete affiliate dashboard data (per-user snapshot, rebuilt when the user's stats change)"""
+    return await affiliate_dashboard_cache.get(
+        db, current_user.id, lambda: affiliate_service.get_dashboard(db, current_user.id)
     )
-    pending_payouts = payout_result.scalars().all()
-
-    # Team summary
-    team_summary = {
-        "level1_count": stats.total_referrals_level1,
-        "level2_count": stats.total_referrals_level2,
-        "level3_count": stats.total_referrals_level3,
-        "total_active": stats.active_referrals,
-        "total_commission": stats.total_commission_earned
-    }
 
-    return AffiliateDashboard(
-        subscription=subscription,
-        stats=stats,
-        recent_commissions=recent_commissions,
-        pending_payouts=[PayoutResponse.from_orm(p) for p in pending_payouts],
-        team_summary=team_summary
-    )
+
+@router.get("/analytics/timeseries", response_model=AnalyticsTimeSeries)
+async def get_my_analytics_timeseries(
+    start: Optional[date] = Query(None, description="First day (default: 30 days ago)"),
+    end: Optional[date] = Query(None, description="Last day (default: today)"),
+    granularity: str = Query("day", description="day, week or month"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_user)
+):
+    """Referrals, commissions, payouts and referral earnings over time (from daily rollups)"""
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    points = await AnalyticsRollupService().get_timeseries(db, start, end, granularity, current_user.id)
+    return AnalyticsTimeSeries(granularity=granularity, start=start, end=end, points=points)
 
 
 # ==================== Team Management ====================
 
 @router.get("/team/members", response_model=List[TeamMember])
 async def get_team_members(
+    response: Response,
     level: Optional[int] = Query(None, ge=1, le=3, description="Filter by level (1, 2, or 3)"),
+    has_purchased: Optional[bool] = Query(None, description="Only members who have (not) purchased"),
+    search: Optional[str] = Query(None, min_length=2, description="Match on name or email"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size (default: all members)"),
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
-    """Get team members with detailed info"""
-    return await affiliate_service.get_team_members(db, current_user.id, level)
+    """Get team members with detailed info. The next page's cursor is returned in X-Next-Cursor."""
+    members, next_cursor = await affiliate_service.get_team_members_page(
+        db, current_user.id, level=level, has_purchased=has_purchased,
+        search=search, cursor=cursor, limit=limit
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return members
 
 
 @router.get("/team/hierarchy")
@@ -217,20 +232,20 @@ async def get_team_hierarchy(
     current_user: UserProfile = Depends(get_current_user)
 ):
     """Get complete team hierarchy (3 levels deep)"""
-    # This would build a tree structure - simplified version
-    l1_members = await affiliate_service.get_team_members(db, current_user.id, level=1)
-    l2_members = await affiliate_service.get_team_members(db, current_user.id, level=2)
-    l3_members = await affiliate_service.get_team_members(db, current_user.id, level=3)
+    members = await affiliate_service.get_team_members(db, current_user.id)
+    by_level = {1: [], 2: [], 3: []}
+    for member in members:
+        by_level.setdefault(member.level, []).append(member.dict())
 
     return {
-        "level1": [m.dict() for m in l1_members],
-        "level2": [m.dict() for m in l2_members],
-        "level3": [m.dict() for m in l3_members],
+        "level1": by_level[1],
+        "level2": by_level[2],
+        "level3": by_level[3],
         "totals": {
-            "l1_count": len(l1_members),
-            "l2_count": len(l2_members),
-            "l3_count": len(l3_members),
-            "total_count": len(l1_members) + len(l2_members) + len(l3_members)
+            "l1_count": len(by_level[1]),
+            "l2_count": len(by_level[2]),
+            "l3_count": len(by_level[3]),
+            "total_count": len(members)
         }
     }
 
@@ -239,13 +254,32 @@ async def get_team_hierarchy(
 
 @router.get("/commissions", response_model=List[CommissionDetail])
 async def get_my_commissions(
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
     status_filter: Optional[str] = Query(None, description="Filter by status"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
     db: AsyncSession = Depends(get_db),
     current_user: UserProfile = Depends(get_current_user)
 ):
-    """Get user's commission history"""
-    return await affiliate_service.get_recent_commissions(db, current_user.id, limit)
+    """Get user's commission history. The next page's cursor is returned in X-Next-Cursor."""
+    from app.models.affiliate import CommissionStatus
+
+    commission_status = None
+    if status_filter:
+        try:
+            commission_status = CommissionStatus(status_filter.lower())
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown commission status '{status_filter}'"
+            )
+
+    commissions, next_cursor = await affiliate_service.get_commissions_page(
+        db, current_user.id, status=commission_status, cursor=cursor, limit=limit
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return commissions
 
 
 @router.get("/commissions/{commission_id}", response_model=CommissionDetail)
@@ -255,27 +289,15 @@ async def get_commission_detail(
     current_user: UserProfile = Depends(get_current_user)
 ):
     """Get detailed commission information"""
-    from app.models.affiliate import Commission
-    from sqlalchemy import select, and_
-    
-    result = await db.execute(
-        select(Commission).where(
-            and_(
-                Commission.id == commission_id,
-                Commission.affiliate_user_id == current_user.id
-            )
-        )
-    )
-    commission = result.scalar_one_or_none()
-    
+    commission = await affiliate_service.get_commission_detail(db, current_user.id, commission_id)
+
     if not commission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Commission not found"
         )
-    
-    # Build detailed response (simplified - use service method for full details)
-    return CommissionDetail.from_orm(commission)
+
+    return commission
 
 
 # ==================== Payout Management ====================
@@ -372,6 +394,48 @@ async def get_all_affiliates(
     return [AffiliateSubscriptionResponse.from_orm(a) for a in affiliates]
 
 
+@router.get("/admin/analytics/timeseries", response_model=AnalyticsTimeSeries)
+async def get_platform_analytics_timeseries(
+    start: Optional[date] = Query(None, description="First day (default: 30 days ago)"),
+    end: Optional[date] = Query(None, description="Last day (default: today)"),
+    granularity: str = Query("day", description="day, week or month"),
+    affiliate_user_id: Optional[int] = Query(None, description="One affiliate instead of the whole platform"),
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """Platform-wide (or one affiliate's) activity over time (Admin only)"""
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    points = await AnalyticsRollupService().get_timeseries(db, start, end, granularity, affiliate_user_id)
+    return AnalyticsTimeSeries(granularity=granularity, start=start, end=end, points=points)
+
+
+@router.get("/admin/dashboard-cache")
+async def get_dashboard_cache_metrics(
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """Dashboard snapshot cache metrics for this worker (Admin only)"""
+    return affiliate_dashboard_cache.metrics()
+
+
+@router.get("/admin/referral-graph")
+async def get_referral_graph_metrics(
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """In-process referral graph metrics for this worker, including referral cycles found at load (Admin only)"""
+    await referral_graph_index.get(db)
+    return referral_graph_index.metrics()
+
+
+@router.get("/admin/tracking-buffer")
+async def get_tracking_buffer_metrics(
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """Referral click / signup tracking buffer metrics for this worker (Admin only)"""
+    return referral_tracking_buffer.metrics()
+
+
 @router.get("/admin/payouts/pending")
 async def get_pending_payouts(
     db: AsyncSession = Depends(get_db),
@@ -402,14 +466,20 @@ async def process_payout_admin(
     Process payout (Admin only)
     Actions: approve, complete, reject
     """
-    payout = await affiliate_service.process_payout(
-        db,
-        payout_id,
-        action_request.action,
-        current_user.id,
-        action_request.transaction_id,
-        action_request.admin_notes
-    )
+    try:
+        payout = await affiliate_service.process_payout(
+            db,
+            payout_id,
+            action_request.action,
+            current_user.id,
+            action_request.transaction_id,
+            action_request.admin_notes
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     if not payout:
         raise HTTPException(
@@ -444,6 +514,7 @@ async def approve_commission_admin(
 
 @router.post("/track-referral")
 async def track_referral_signup(
+    request: Request,
     referral_code: str,
     referred_user_id: int,
     signup_ip: Optional[str] = None,
@@ -451,22 +522,51 @@ async def track_referral_signup(
 ):
     """
     Track referral when user signs up with referral code
-    Called during signup process
+    Called during signup process. Signups are written in batches; see
+    REFERRAL_TRACKING_SIGNUP_DURABILITY for when this call returns.
+    Not gated on the existence filter (the batch insert resolves the code),
+    so codes created on another worker since the last sync still attribute.
     """
-    referral = await affiliate_service.track_referral(
-        db, referral_code, referred_user_id, signup_ip
+    referral_id = await referral_tracking_buffer.record_signup(
+        referral_code,
+        referred_user_id,
+        signup_ip or (request.client.host if request.client else None),
+        request.headers.get("user-agent")
     )
-    
-    if not referral:
+
+    if settings.REFERRAL_TRACKING_SIGNUP_DURABILITY != "commit":
+        return {"message": "Referral tracking queued"}
+
+    if not referral_id:
         return {"message": "Invalid or inactive referral code"}
-    
+
     return {
         "message": "Referral tracked successfully",
-        "referral_id": referral.id,
-        "level": referral.level
+        "referral_id": referral_id,
+        "level": 1
     }
 
 
+@router.post("/track-click")
+async def track_referral_click(
+    request: Request,
+    referral_code: str,
+    landing_page: Optional[str] = Query(None, max_length=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """Public: record a referral link click (buffered, written in batches)"""
+    if not await referral_code_index.might_exist(db, referral_code):
+        return {"tracked": False}
+
+    tracked = referral_tracking_buffer.record_click(
+        referral_code,
+        request.client.host if request.client else None,
+        request.headers.get("user-agent"),
+        landing_page
+    )
+    return {"tracked": tracked}
+
+
 # ==================== Commission Rules (Config) ====================
 
 @router.get("/commission-rules", response_model=List[CommissionRuleResponse])
@@ -491,3 +591,33 @@ async def get_commission_rules(
     )
     rules = result.scalars().all()
     return [CommissionRuleResponse.from_orm(r) for r in rules]
+
+
+@router.post("/admin/commission-rules", response_model=CommissionRuleResponse)
+async def create_commission_rule(
+    rule_data: CommissionRuleCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """Create a commission rule (Admin only)"""
+    rule = await affiliate_service.create_commission_rule(db, rule_data.dict())
+    return CommissionRuleResponse.from_orm(rule)
+
+
+@router.put("/admin/commission-rules/{rule_id}", response_model=CommissionRuleResponse)
+async def update_commission_rule(
+    rule_id: int,
+    rule_data: CommissionRuleUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserProfile = Depends(get_current_admin_user)
+):
+    """Update a commission rule (Admin only)"""
+    rule = await affiliate_service.update_commission_rule(
+        db, rule_id, rule_data.dict(exclude_unset=True)
+    )
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Commission rule not found"
+        )
+    return CommissionRuleResponse.from_orm(rule)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from app.core.security import HTTPBearer
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -79,6 +79,7 @@ security = HTTPBearer()
 @router.post("/register", response_model=Token)
 async def register(
     user_data: UserCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user_service: UserService = Depends()
 ):
@@ -96,7 +97,10 @@ async def register(
         
         # Validate referral code if provided (accept both AffiliateSubscription codes and legacy UserProfile codes)
         referrer_code_to_track: str | None = None
+        referrer_user_id: int | None = None
         provided_code = user_data.referral_code
+        # Looked up in the database even on an existence-filter miss: a code
+        # created on another worker since the last sync must still attribute
         if provided_code:
             # 1) Check affiliate subscription codes (primary)
             aff_result = await db.execute(
@@ -107,9 +111,10 @@ async def register(
             aff_sub = aff_result.scalar_one_or_none()
             if aff_sub and aff_sub.is_active:
                 referrer_code_to_track = aff_sub.referral_code
+                referrer_user_id = aff_sub.user_id
             else:
                 # 2) Check legacy user referral codes and map to their affiliate code if active
-                legacy_user = await user_service.get_user_by_referral_code(db, provided_code)
+                legacy_user = await user_service.get_user_by_referral_code(db, provided_code, use_filter=False)
                 if legacy_user:
                     # Try to fetch the user's affiliate subscription to get canonical code
                     aff_result2 = await db.execute(
@@ -120,6 +125,7 @@ async def register(
                     aff_sub2 = aff_result2.scalar_one_or_none()
                     if aff_sub2 and aff_sub2.is_active:
                         referrer_code_to_track = aff_sub2.referral_code
+                        referrer_user_id = aff_sub2.user_id
                     else:
                         # No active affiliate program for this referrer; proceed without blocking signup
                         referrer_code_to_track = None
@@ -161,13 +167,17 @@ async def register(
         # This happens AFTER we've captured all attributes
         if referrer_code_to_track:
             try:
-                from app.services.affiliate_service import AffiliateService
-                affiliate_service = AffiliateService()
-                await affiliate_service.track_referral(
-                    db, referrer_code_to_track, user.id, signup_ip=None
+                # Written in a batch with other signups (referral_tracking_buffer)
+                from app.services.referral_tracking_buffer import referral_tracking_buffer
+                referral_id = await referral_tracking_buffer.record_signup(
+                    referrer_code_to_track,
+                    user.id,
+                    request.client.host if request.client else None,
+                    request.headers.get("user-agent")
                 )
                 # Update the referred_by in our captured dict
-                user_dict_base["referred_by"] = (await user_service.get_user_by_id(db, user.id)).referred_by if await user_service.get_user_by_id(db, user.id) else None
+                if referral_id:
+                    user_dict_base["referred_by"] = referrer_user_id
             except Exception as aff_error:
                 # Log error but don't fail registration
                 print(f"⚠️ Affiliate referral tracking error: {str(aff_error)}")
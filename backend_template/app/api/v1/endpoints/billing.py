@@ -359,16 +359,14 @@ async def get_current_balance(
     billing_service: BillingService = Depends()
 ):
     """Get current account balance"""
-    from app.services.invoice_service import InvoiceService
-    invoice_service = InvoiceService()
+    from app.services.billing_summary_service import BillingSummaryService
+
+    summary = await BillingSummaryService().get_summary(db, current_user.id)
 
-    balance = await invoice_service.get_user_current_balance(db, current_user.id)
-    count = await invoice_service.get_user_pending_invoices_count(db, current_user.id)
-    
     return {
-        "balance": float(balance),
+        "balance": float(summary.outstanding_balance),
         "currency": "INR",
-        "outstanding_invoices": count
+        "outstanding_invoices": summary.pending_invoices
     }
 
 
@@ -10,6 +10,7 @@ from app.services.server_service import ServerService
 from app.services.order_service import OrderService
 from app.services.support_service import SupportService
 from app.services.invoice_service import InvoiceService
+from app.services.billing_summary_service import BillingSummaryService
 from app.schemas.dashboard import DashboardResponse, CustomerDashboard, AdminDashboard
 from app.schemas.users import User
 
@@ -33,8 +34,9 @@ async def get_customer_dashboard(
         support_service = SupportService()
 
         # ✅ Await all async service methods
-        active_servers = await server_service.get_user_active_servers_count(db, current_user.id)
-        monthly_cost = await invoice_service.get_user_monthly_cost(db, current_user.id)
+        billing = await BillingSummaryService().get_summary(db, current_user.id)
+        active_servers = billing.active_servers
+        monthly_cost = billing.monthly_cost
         open_tickets = await support_service.get_user_open_tickets_count(db, current_user.id)
         bandwidth_used = await server_service.get_user_bandwidth_used(db, current_user.id)
 
@@ -145,8 +147,9 @@ async def get_dashboard_stats(
         
         else:
             # Customer stats
-            active_servers = await server_service.get_user_active_servers_count(db, current_user.id)
-            monthly_cost = await invoice_service.get_user_monthly_cost(db, current_user.id)
+            billing = await BillingSummaryService().get_summary(db, current_user.id)
+            active_servers = billing.active_servers
+            monthly_cost = billing.monthly_cost
             open_tickets = await support_service.get_user_open_tickets_count(db, current_user.id)
             bandwidth_used = await server_service.get_user_bandwidth_used(db, current_user.id)
             
@@ -234,16 +234,22 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime
 from sqlalchemy import select
 import logging
 
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.invoice_service import InvoiceService
+from app.services.export_service import ExportService
+from app.services.invoice_archive_service import InvoiceArchiveService
+from app.services.invoice_line_item_service import InvoiceLineItemService
+from app.services.invoice_pdf_service import invoice_pdf_service
+from app.services.invoice_renderer import etag_matches, invoice_renderer
 from app.schemas.invoice import Invoice, InvoiceWithUser
 from app.schemas.users import User
 from app.models.invoice import Invoice as InvoiceModel
@@ -264,6 +270,17 @@ async def get_invoices(
     return await invoice_service.get_user_invoices(db, current_user.id)
 
 
+@router.get("/archive")
+async def download_invoice_archive(
+    format: str = Query("pdf", description="Invoice format inside the ZIP: html or pdf"),
+    date_from: Optional[datetime] = Query(None, description="Include invoices dated on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Include invoices dated before this time"),
+    current_user: User = Depends(get_current_user),
+):
+    """Stream a ZIP of the user's invoices"""
+    return InvoiceArchiveService().streaming_response(format, current_user.id, date_from, date_to)
+
+
 # ---------------- ADMIN INVOICES ----------------
 
 @router.get("/admin", response_model=List[InvoiceWithUser])
@@ -276,6 +293,52 @@ async def get_all_invoices(
     return await invoice_service.get_all_invoices(db)
 
 
+@router.get("/admin/export")
+async def export_invoices(
+    format: str = Query("csv", description="Export format: csv or ndjson"),
+    columns: Optional[str] = Query(None, description="Comma separated list of columns to include"),
+    date_from: Optional[datetime] = Query(None, description="Include invoices dated on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Include invoices dated before this time"),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """Stream all invoices as CSV or NDJSON (Admin only)"""
+    return ExportService().streaming_response("invoices", format, columns, date_from, date_to)
+
+
+@router.get("/admin/archive")
+async def download_invoices_archive_admin(
+    format: str = Query("pdf", description="Invoice format inside the ZIP: html or pdf"),
+    user_id: Optional[int] = Query(None, description="Only this customer's invoices"),
+    date_from: Optional[datetime] = Query(None, description="Include invoices dated on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Include invoices dated before this time"),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """Stream a ZIP of invoices for a customer and/or a date range (Admin only)"""
+    return InvoiceArchiveService().streaming_response(format, user_id, date_from, date_to)
+
+
+@router.get("/admin/revenue-report")
+async def get_revenue_report(
+    start: date = Query(..., description="First day (YYYY-MM-DD)"),
+    end: date = Query(..., description="Last day, inclusive (YYYY-MM-DD)"),
+    item_type: Optional[str] = Query(None, description="plan, addon, service or other"),
+    ref_id: Optional[int] = Query(None, description="Plan / addon / service id"),
+    paid_only: bool = Query(True, description="Only count paid invoices"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """Monthly revenue per plan, addon and service from invoice line items (Admin only)"""
+    return await InvoiceLineItemService().revenue_report(db, start, end, item_type, ref_id, paid_only)
+
+
+@router.get("/admin/pdf-metrics")
+async def get_invoice_pdf_metrics(
+    current_user: User = Depends(get_current_admin_user),
+):
+    """PDF render times and cache hit rate for this worker (Admin only)"""
+    return invoice_pdf_service.metrics()
+
+
 # ---------------- SINGLE INVOICE ----------------
 
 @router.get("/{invoice_id}", response_model=Invoice)
@@ -295,11 +358,12 @@ async def get_invoice(
 @router.get("/{invoice_id}/download")
 async def download_invoice(
     invoice_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
     invoice_service: InvoiceService = Depends()
 ):
-    """Download invoice as HTML"""
+    """Download invoice as HTML. Send the ETag back in If-None-Match to get 304 when unchanged."""
     try:
         logger.info(f"Download invoice request - Invoice ID: {invoice_id}, User ID: {current_user.id}")
         
@@ -308,101 +372,18 @@ async def download_invoice(
             logger.error(f"Invoice not found - Invoice ID: {invoice_id}, User ID: {current_user.id}")
             raise HTTPException(status_code=404, detail="Invoice not found")
 
-        logger.info(f"Invoice found - Number: {invoice.invoice_number}, Status: {invoice.payment_status}")
-
-        # Generate simple HTML invoice
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Invoice {invoice.invoice_number}</title>
-    <style>
-        body {{ font-family: Arial, sans-serif; margin: 40px; }}
-        .header {{ text-align: center; margin-bottom: 30px; }}
-        .company {{ font-size: 24px; font-weight: bold; color: #0891b2; }}
-        .invoice-details {{ margin: 20px 0; }}
-        table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-        th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }}
-        th {{ background-color: #0891b2; color: white; }}
-        .total {{ font-size: 20px; font-weight: bold; text-align: right; margin-top: 20px; }}
-        .status {{ display: inline-block; padding: 5px 15px; border-radius: 20px; font-weight: bold; }}
-        .status.paid {{ background-color: #10b981; color: white; }}
-        .status.pending {{ background-color: #f59e0b; color: white; }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <div class="company">BIDUA INDUSTRIES PVT LTD</div>
-        <p>Office 201, B 158, Sector 63, Noida, UP 201301, India</p>
-        <p>Email: support@bidua.com | Phone: +91 120 416 8464</p>
-    </div>
-    
-    <h2>INVOICE</h2>
-    
-    <div class="invoice-details">
-        <p><strong>Invoice Number:</strong> {invoice.invoice_number}</p>
-        <p><strong>Invoice Date:</strong> {invoice.invoice_date.strftime('%d-%m-%Y')}</p>
-        <p><strong>Due Date:</strong> {invoice.due_date.strftime('%d-%m-%Y')}</p>
-        <p><strong>Status:</strong> <span class="status {invoice.payment_status}">{invoice.payment_status.upper()}</span></p>
-    </div>
-    
-    <h3>Invoice Items</h3>
-    <table>
-        <thead>
-            <tr>
-                <th>Description</th>
-                <th>Quantity</th>
-                <th>Unit Price</th>
-                <th>Amount</th>
-            </tr>
-        </thead>
-        <tbody>"""
-        
-        # Add invoice items
-        if invoice.items:
-            for item in invoice.items:
-                html_content += f"""
-            <tr>
-                <td>{item.get('description', 'N/A')}</td>
-                <td>{item.get('quantity', 1)}</td>
-                <td>₹{float(item.get('unit_price', 0)):,.2f}</td>
-                <td>₹{float(item.get('amount', 0)):,.2f}</td>
-            </tr>"""
-        
-        html_content += f"""
-        </tbody>
-    </table>
-    
-    <div style="text-align: right; margin-top: 30px;">
-        <p><strong>Subtotal:</strong> ₹{float(invoice.subtotal):,.2f}</p>
-        <p><strong>Tax (GST 18%):</strong> ₹{float(invoice.tax_amount):,.2f}</p>
-        <p class="total">Total Amount: ₹{float(invoice.total_amount):,.2f}</p>"""
-        
-        if invoice.payment_status == 'paid':
-            html_content += f"""
-        <p style="color: #10b981;"><strong>Amount Paid:</strong> ₹{float(invoice.amount_paid):,.2f}</p>
-        <p style="color: #10b981;"><strong>Payment Date:</strong> {invoice.payment_date.strftime('%d-%m-%Y %H:%M') if invoice.payment_date else 'N/A'}</p>
-        <p style="color: #10b981;"><strong>Payment Method:</strong> {invoice.payment_method or 'Razorpay'}</p>"""
-        else:
-            html_content += f"""
-        <p style="color: #f59e0b;"><strong>Balance Due:</strong> ₹{float(invoice.balance_due):,.2f}</p>"""
-        
-        html_content += """
-    </div>
-    
-    <div style="margin-top: 50px; padding-top: 20px; border-top: 1px solid #ddd; text-align: center; color: #666;">
-        <p>Thank you for your business!</p>
-        <p style="font-size: 12px;">This is a computer-generated invoice and requires no signature.</p>
-    </div>
-</body>
-</html>"""
-        
-        logger.info(f"Generated HTML invoice - Size: {len(html_content)} bytes")
-        
-        # Return HTML response
+        # Per-user document: browsers / accountants' tools revalidate, shared caches never store it
+        headers = {"ETag": invoice_renderer.etag(invoice), "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        html_content = invoice_renderer.render_html(invoice)
+        logger.info(f"Invoice {invoice.invoice_number} rendered - Size: {len(html_content)} bytes")
+
         return HTMLResponse(
             content=html_content,
             headers={
+                **headers,
                 "Content-Disposition": f"attachment; filename=Invoice_{invoice.invoice_number}.html"
             }
         )
@@ -413,6 +394,40 @@ async def download_invoice(
         raise HTTPException(status_code=500, detail=f"Failed to generate invoice: {str(e)}")
 
 
+@router.get("/{invoice_id}/pdf")
+async def download_invoice_pdf(
+    invoice_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    invoice_service: InvoiceService = Depends()
+):
+    """Download invoice as PDF. Send the ETag back in If-None-Match to get 304 when unchanged."""
+    invoice = await invoice_service.get_user_invoice(db, current_user.id, invoice_id)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+
+    # The PDF's content address doubles as its ETag
+    headers = {"ETag": f'"{invoice_pdf_service.digest(invoice)}"', "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        pdf, _ = await invoice_pdf_service.get_pdf(invoice)
+    except Exception as e:
+        logger.error(f"Error rendering invoice PDF {invoice_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to generate invoice PDF")
+
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={
+            **headers,
+            "Content-Disposition": f"attachment; filename=Invoice_{invoice.invoice_number}.pdf"
+        }
+    )
+
+
 # ---------------- PAYMENT ----------------
 
 @router.post("/{invoice_id}/pay")
@@ -1084,13 +1084,15 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List, Optional
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.order_service import OrderService
+from app.services.export_service import ExportService
 from app.schemas.order import (
     Order,
     OrderCreate,
@@ -1171,6 +1173,20 @@ async def get_orders_admin(
         )
 
 
+@router.get("/admin/export")
+async def export_orders(
+    format: str = Query("csv", description="Export format: csv or ndjson"),
+    columns: Optional[str] = Query(None, description="Comma separated list of columns to include"),
+    date_from: Optional[datetime] = Query(None, description="Include orders created on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Include orders created before this time"),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Stream all orders as CSV or NDJSON (Admin only)
+    """
+    return ExportService().streaming_response("orders", format, columns, date_from, date_to)
+
+
 # ---------------------- ORDER DETAILS ----------------------
 
 @router.get("/{order_id}", response_model=Order)
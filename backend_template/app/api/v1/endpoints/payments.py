@@ -1,15 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi import APIRouter, Depends, HTTPException, Request, Header, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, Dict, Any
 from decimal import Decimal
 from datetime import datetime
 
 from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.security import get_current_user, get_current_admin_user
 from app.services.payment_service import PaymentService
 from app.services.commission_service import CommissionService
 from app.services.order_service import OrderService
 from app.services.plan_service import PlanService
+from app.services.export_service import ExportService
 from app.schemas.users import User
 from app.models.payment import PaymentType, PaymentStatus
 from app.core.config import settings
@@ -280,6 +281,9 @@ async def verify_payment(
                     invoice_obj.payment_method = 'razorpay'
                     invoice_obj.payment_reference = payment_data.razorpay_payment_id
 
+                    from app.services.billing_summary_service import BillingSummaryService
+                    await BillingSummaryService().refresh(db, [invoice_obj.user_id])
+
                     # If invoice has an associated order, create the server
                     if invoice_obj.order_id:
                         from app.models.order import Order as OrderModel
@@ -474,6 +478,9 @@ async def verify_payment(
                     invoice_obj.payment_method = 'razorpay'
                     invoice_obj.payment_reference = payment_data.razorpay_payment_id
 
+                    from app.services.billing_summary_service import BillingSummaryService
+                    await BillingSummaryService().refresh(db, [invoice_obj.user_id])
+
                 await db.commit()
 
         # Distribute commission if applicable (skip for subscription payments)
@@ -742,4 +749,21 @@ async def get_payment_status(
             "created_at": payment_transaction.created_at.isoformat(),
             "paid_at": payment_transaction.paid_at.isoformat() if payment_transaction.paid_at else None
         }
-    }
\ No newline at end of file
+    }
+
+
+# --------------------------------------------------------
+# ✅ Export Payment Transactions (Admin)
+# --------------------------------------------------------
+@router.get("/admin/export")
+async def export_payment_transactions(
+    format: str = Query("csv", description="Export format: csv or ndjson"),
+    columns: Optional[str] = Query(None, description="Comma separated list of columns to include"),
+    date_from: Optional[datetime] = Query(None, description="Include payments created on or after this time"),
+    date_to: Optional[datetime] = Query(None, description="Include payments created before this time"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Stream payment transactions as CSV or NDJSON (Admin only)
+    """
+    return ExportService().streaming_response("payments", format, columns, date_from, date_to)
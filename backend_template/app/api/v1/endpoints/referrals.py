@@ -360,16 +360,23 @@
 
 
 
-from fastapi import APIRouter, Depends, HTTPException
+import io
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
 
 from app.core.database import get_db
 from app.core.security import get_current_user, get_current_admin_user
 from app.services.referral_service import ReferralService
+from app.services.referral_ledger_service import ReferralLedgerService
+from app.services.commission_service import CommissionService
+from app.services.payout_transfer_service import PayoutTransferService
+from app.services.referral_leaderboard_service import ReferralLeaderboardService
 from app.schemas.referrals import (
-    ReferralPayout, ReferralPayoutCreate, ReferralPayoutAction,
-    ReferralEarning, ReferralStats
+    ReferralPayout, ReferralPayoutCreate, ReferralPayoutAction, ReferralPayoutBulkAction,
+    ReferralEarning, ReferralStats, ReferralLedgerEntry, ReferralLeaderboard,
+    CommissionRateResponse, CommissionRateUpdate
 )
 from app.schemas.users import User
 
@@ -380,6 +387,17 @@ router = APIRouter()
 # USER ENDPOINTS
 # -------------------------------------------------------------
 
+@router.get("/leaderboard", response_model=ReferralLeaderboard)
+async def get_referral_leaderboard(
+    period: str = Query("month", description="week, month or all_time"),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    leaderboard_service: ReferralLeaderboardService = Depends()
+):
+    """Public: Top referrers for a period (precomputed, cached per worker)"""
+    return await leaderboard_service.get_leaderboard(db, period, limit)
+
+
 @router.get("/stats", response_model=ReferralStats)
 async def get_referral_stats(
     db: AsyncSession = Depends(get_db),
@@ -400,6 +418,18 @@ async def get_referral_earnings(
     return await referral_service.get_user_earnings(db, current_user.id)
 
 
+@router.get("/ledger", response_model=List[ReferralLedgerEntry])
+async def get_referral_ledger(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ledger_service: ReferralLedgerService = Depends()
+):
+    """Get user's referral balance ledger (newest first)"""
+    return await ledger_service.get_entries(db, current_user.id, skip, limit)
+
+
 @router.get("/payouts", response_model=List[ReferralPayout])
 async def get_referral_payouts(
     db: AsyncSession = Depends(get_db),
@@ -501,6 +531,94 @@ async def complete_payout(
     return {"message": "Payout marked as completed"}
 
 
+@router.post("/admin/earnings/{earning_id}/reverse")
+async def reverse_earning(
+    earning_id: int,
+    reason: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    ledger_service: ReferralLedgerService = Depends()
+):
+    """Admin: Reverse an unpaid referral earning (debits the user's balance)"""
+    entry = await ledger_service.reverse_earning(db, earning_id, reason)
+    await db.commit()
+    return {"message": "Earning reversed successfully", "balance_after": entry.balance_after}
+
+
+@router.get("/admin/ledger/verify")
+async def verify_referral_balances(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    ledger_service: ReferralLedgerService = Depends()
+):
+    """Admin: Compare balance snapshots against referral_earnings / referral_payouts"""
+    mismatches = await ledger_service.verify_balances(db)
+    return {"consistent": not mismatches, "mismatches": mismatches}
+
+
+@router.post("/admin/payouts/bulk")
+async def bulk_process_payouts(
+    action: ReferralPayoutBulkAction,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    referral_service: ReferralService = Depends()
+):
+    """
+    Admin: Approve or complete many payouts in one transaction.
+    Payouts not in the expected status (requested / approved) are skipped
+    and listed in the summary.
+    """
+    if action.action == "approve":
+        return await referral_service.bulk_approve_payouts(db, action.payout_ids, action.payment_reference)
+    return await referral_service.bulk_complete_payouts(db, action.payout_ids)
+
+
+@router.get("/admin/payouts/transfer-file")
+async def download_payout_transfer_file(
+    source: str = Query("referral", description="referral or affiliate"),
+    mode: str = Query("NEFT", description="NEFT or IMPS"),
+    current_user: User = Depends(get_current_admin_user),
+    transfer_service: PayoutTransferService = Depends()
+):
+    """
+    Admin: Bank bulk-upload CSV of all approved payouts, streamed row by row.
+    Affiliate payouts carry an AFF-<id> reference in place of a payout number.
+    """
+    return transfer_service.streaming_response(source, mode)
+
+
+@router.post("/admin/payouts/reconcile")
+async def reconcile_payout_transfers(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    transfer_service: PayoutTransferService = Depends()
+):
+    """
+    Admin: Apply the bank's reconciliation CSV (payout reference, status, UTR).
+    Successful transfers are completed in bulk; failed ones stay approved.
+    """
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return await transfer_service.reconcile(db, lines, processed_by=current_user.id)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Reconciliation file must be UTF-8 CSV")
+    finally:
+        lines.detach()
+
+
+@router.post("/admin/leaderboard/refresh")
+async def refresh_referral_leaderboard(
+    period: Optional[str] = Query(None, description="week, month or all_time (default: all)"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    leaderboard_service: ReferralLeaderboardService = Depends()
+):
+    """Admin: Rebuild the precomputed leaderboard now"""
+    written = await leaderboard_service.refresh(db, [period] if period else None)
+    return {"refreshed": written}
+
+
 @router.get("/admin/stats")
 async def get_admin_referral_stats(
     db: AsyncSession = Depends(get_db),
@@ -530,6 +648,33 @@ async def get_commission_structure():
     }
 
 
+@router.get("/admin/commission-rates", response_model=List[CommissionRateResponse])
+async def get_commission_rates(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    commission_service: CommissionService = Depends()
+):
+    """Admin: List configured referral commission rates"""
+    return await commission_service.get_commission_rate_configs(db)
+
+
+@router.put("/admin/commission-rates/{rate_id}", response_model=CommissionRateResponse)
+async def update_commission_rate(
+    rate_id: int,
+    rate_data: CommissionRateUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    commission_service: CommissionService = Depends()
+):
+    """Admin: Update a referral commission rate (all workers pick it up on their next version check)"""
+    rate = await commission_service.update_commission_rate(
+        db, rate_id, rate_data.model_dump(exclude_unset=True)
+    )
+    if not rate:
+        raise HTTPException(status_code=404, detail="Commission rate not found")
+    return rate
+
+
 # -------------------------------------------------------------
 # INTERNAL ENDPOINT (Optional: For Admin Testing / Manual Entry)
 # -------------------------------------------------------------
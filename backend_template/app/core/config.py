@@ -39,6 +39,75 @@ class Settings(BaseSettings):
     # 🔹 Admin
     DEFAULT_ADMIN_EMAIL: str = "admin@bidua.com"
 
+    # 🔹 Table partitioning (PostgreSQL monthly range partitions)
+    PARTITION_MONTHS_AHEAD: int = 3
+    PARTITION_ARCHIVE_SCHEMA: str = "archive"
+
+    # 🔹 Background commission distribution (scripts/commission_worker.py)
+    COMMISSION_WORKER_BATCH_SIZE: int = 200
+    COMMISSION_WORKER_INTERVAL_SECONDS: int = 10
+
+    # 🔹 Commission rate / rule cache (seconds between cross-worker version checks)
+    COMMISSION_RULES_VERSION_CHECK_SECONDS: int = 5
+
+    # 🔹 Referral leaderboard (scripts/refresh_referral_leaderboard.py)
+    REFERRAL_LEADERBOARD_SIZE: int = 100
+    REFERRAL_LEADERBOARD_CACHE_SECONDS: int = 60
+    REFERRAL_LEADERBOARD_REFRESH_INTERVAL_SECONDS: int = 900
+
+    # 🔹 Referral code existence filter (app/services/referral_code_index.py)
+    REFERRAL_CODE_FILTER_ERROR_RATE: float = 0.001
+    REFERRAL_CODE_SYNC_SECONDS: int = 5
+    REFERRAL_CODE_FILTER_REBUILD_SECONDS: int = 3600
+    REFERRAL_CODE_CACHE_TTL_SECONDS: int = 300
+    REFERRAL_CODE_CACHE_SIZE: int = 10000
+
+    # 🔹 Affiliate dashboard snapshot cache (app/services/affiliate_dashboard_cache.py)
+    AFFILIATE_DASHBOARD_CACHE_SECONDS: int = 60
+    AFFILIATE_DASHBOARD_CACHE_SIZE: int = 10000
+
+    # 🔹 Referral click / signup tracking buffer (app/services/referral_tracking_buffer.py)
+    REFERRAL_TRACKING_BATCH_SIZE: int = 500
+    REFERRAL_TRACKING_FLUSH_SECONDS: float = 0.5
+    # Queued events per worker; signups wait for room when full, clicks are dropped
+    REFERRAL_TRACKING_BUFFER_SIZE: int = 20000
+    # "commit": signup calls return once their batch is committed (group commit)
+    # "buffered": return immediately; queued signups are lost if the worker dies
+    REFERRAL_TRACKING_SIGNUP_DURABILITY: str = "commit"
+
+    # 🔹 Daily analytics rollups (scripts/rollup_analytics.py)
+    ANALYTICS_ROLLUP_BATCH_SIZE: int = 10000
+    ANALYTICS_ROLLUP_INTERVAL_SECONDS: int = 300
+    ANALYTICS_ROLLUP_SETTLE_SECONDS: int = 120
+    ANALYTICS_MAX_RANGE_DAYS: int = 1100
+
+    # 🔹 In-process referral graph (app/services/referral_graph.py)
+    REFERRAL_GRAPH_ENABLED: bool = False
+    REFERRAL_GRAPH_SYNC_SECONDS: int = 5
+    REFERRAL_GRAPH_REBUILD_SECONDS: int = 3600
+
+    # 🔹 Invoice documents (app/services/invoice_renderer.py)
+    INVOICE_RENDER_CACHE_SIZE: int = 1000
+    # PDFs (app/services/invoice_pdf_service.py, scripts/prerender_invoice_pdfs.py)
+    INVOICE_PDF_WORKERS: int = 2
+    INVOICE_PDF_CACHE_DIR: str = "var/invoice_pdfs"
+    INVOICE_PDF_CACHE_MAX_AGE_DAYS: int = 90
+
+    # 🔹 Renewal invoices (scripts/generate_renewal_invoices.py)
+    RENEWAL_INVOICE_LEAD_DAYS: int = 7
+    RENEWAL_INVOICE_PAYMENT_DAYS: int = 7
+    RENEWAL_INVOICE_BATCH_SIZE: int = 2000
+    RENEWAL_INVOICE_MAX_SERVERS: int = 100000
+    RENEWAL_INVOICE_INTERVAL_SECONDS: int = 3600
+
+    # 🔹 Overdue invoices and dunning (scripts/sweep_overdue_invoices.py)
+    INVOICE_OVERDUE_BATCH_SIZE: int = 5000
+    INVOICE_OVERDUE_INTERVAL_SECONDS: int = 3600
+    INVOICE_LATE_FEE_GRACE_DAYS: int = 3
+    INVOICE_LATE_FEE_PERCENT: float = 2.0        # of balance due, per started 30 days past grace
+    INVOICE_LATE_FEE_MAX_PERCENT: float = 10.0
+    INVOICE_DUNNING_STAGE_DAYS: List[int] = [1, 7, 14, 30]
+
     # 🔹 Razorpay settings
     APP_NAME: str = "Razorpay Payment Gateway"
     RAZORPAY_KEY_ID: str
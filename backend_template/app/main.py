@@ -10,7 +10,12 @@ from scalar_fastapi import get_scalar_api_reference
 
 from app.core.config import settings
 from app.api.v1.api import api_router
-from app.core.database import engine, Base
+from app.core.database import engine, Base, AsyncSessionLocal
+from app.services.partition_service import PartitionService
+from app.services.referral_code_index import referral_code_index
+from app.services.referral_graph import referral_graph_index
+from app.services.invoice_pdf_service import invoice_pdf_service
+from app.services.referral_tracking_buffer import referral_tracking_buffer
 
 
 app = FastAPI(
@@ -173,6 +178,30 @@ async def on_startup():
     print(f"✅ Connected to database: {safe_url}")
     await init_models()
     print("📦 Tables initialized (if not already present).")
+    # Partition upkeep must not keep the API from starting; scripts.manage_partitions
+    # can be rerun once the cause is fixed
+    try:
+        async with AsyncSessionLocal() as db:
+            created = await PartitionService().ensure_partitions(db)
+        if created:
+            print(f"🗂️  Created partitions: {', '.join(created)}")
+    except Exception as e:
+        print(f"⚠️ Partition maintenance failed: {str(e)}")
+    async with AsyncSessionLocal() as db:
+        codes = await referral_code_index.rebuild(db)
+    print(f"🔎 Referral code filter loaded ({codes} codes)")
+    if settings.REFERRAL_GRAPH_ENABLED:
+        async with AsyncSessionLocal() as db:
+            links = await referral_graph_index.rebuild(db)
+        print(f"🌳 Referral graph loaded ({links} links)")
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Queued referral clicks / signups are written before the worker exits
+    await referral_tracking_buffer.stop()
+    print("📝 Referral tracking buffer drained")
+    invoice_pdf_service.shutdown()
 
 # Root and health check endpoints
 @app.get("/", tags=["Introduction"])
@@ -3,19 +3,21 @@ from app.models.users import UserProfile
 from app.models.plan import HostingPlan
 from app.models.server import Server
 from app.models.order import Order
-from app.models.invoice import Invoice
-from app.models.referrals import ReferralPayout, ReferralEarning
-from app.models.billing import PaymentMethod, BillingSettings
+from app.models.invoice import Invoice, InvoiceDunningEvent, InvoiceLineItem
+from app.models.referrals import ReferralPayout, ReferralEarning, ReferralClosure, ReferralLedgerEntry, ReferralBalance, ReferralLeaderboardEntry
+from app.models.billing import PaymentMethod, BillingSettings, BillingSummary
 from app.models.settings import UserSettings
 from app.models.support import SupportTicket
 from app.models.ticket_message import TicketMessage
 from app.models.ticket_attachment import TicketAttachment
 from app.models.countries import Country
-from app.models.payment import PaymentTransaction, ReferralCommissionRate, PaymentType, ActivationType, PaymentStatus
+from app.models.payment import PaymentTransaction, PaymentRazorpayOrder, ReferralCommissionRate, PaymentType, ActivationType, PaymentStatus
 from app.models.addon import Addon, AddonCategory, BillingType
 from app.models.service import Service, ServiceCategory
 from app.models.order_addon import OrderAddon
 from app.models.order_service import OrderService
+from app.models.cache_version import CacheVersion
+from app.models.analytics import AffiliateDailyRollup, DailyRollup, RollupWatermark
 
 __all__ = [
     "UserProfile",
@@ -23,16 +25,24 @@ __all__ = [
     "Server",
     "Order",
     "Invoice",
+    "InvoiceDunningEvent",
+    "InvoiceLineItem",
     "ReferralPayout",
     "ReferralEarning",
+    "ReferralClosure",
+    "ReferralLedgerEntry",
+    "ReferralBalance",
+    "ReferralLeaderboardEntry",
     "PaymentMethod",
     "BillingSettings",
+    "BillingSummary",
     "UserSettings",
     "SupportTicket",
     "TicketMessage",
     "TicketAttachment",
     "Country",
     "PaymentTransaction",
+    "PaymentRazorpayOrder",
     "ReferralCommissionRate",
     "PaymentType",
     "ActivationType",
@@ -44,4 +54,8 @@ __all__ = [
     "ServiceCategory",
     "OrderAddon",
     "OrderService",
+    "CacheVersion",
+    "AffiliateDailyRollup",
+    "DailyRollup",
+    "RollupWatermark",
 ]
@@ -2,7 +2,7 @@
 Affiliate/Referral System Models
 Handles multi-level referral tracking, commissions, and payouts
 """
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Numeric, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, ForeignKey, Numeric, Text, Enum as SQLEnum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -112,6 +112,11 @@ class Referral(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __table_args__ = (
+        # Team listing: keyset pages ordered by (level, id) per referrer
+        Index('idx_referral_referrer_level_id', 'referrer_id', 'level', 'id'),
+    )
+
     # Relationships
     referrer = relationship("AffiliateSubscription", foreign_keys=[referrer_id], back_populates="referrals")
     parent = relationship("Referral", remote_side=[id], backref="child_referrals")
@@ -200,6 +205,11 @@ class Commission(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __table_args__ = (
+        Index('idx_commission_referral_affiliate', 'referral_id', 'affiliate_user_id'),
+        Index('idx_commission_affiliate_created_id', 'affiliate_user_id', 'created_at', 'id'),
+    )
+
     # Relationships
     referral = relationship("Referral", back_populates="commissions")
     payout = relationship("Payout", back_populates="commissions")
@@ -295,3 +305,25 @@ class AffiliateStats(Base):
     
     def __repr__(self):
         return f"<AffiliateStats(affiliate_user_id={self.affiliate_user_id}, total_earned={self.total_commission_earned})>"
+
+
+class ReferralClick(Base):
+    """
+    Referral link clicks, written in batches by the referral tracking buffer
+    """
+    __tablename__ = "referral_clicks"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    referral_code = Column(String(20), nullable=False)
+    ip_address = Column(String(50), nullable=True)
+    user_agent = Column(Text, nullable=True)
+    landing_page = Column(String(500), nullable=True)
+    clicked_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_referral_clicks_code_clicked', 'referral_code', 'clicked_at'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralClick(referral_code={self.referral_code}, clicked_at={self.clicked_at})>"
@@ -0,0 +1,62 @@
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, Numeric, String
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AffiliateDailyRollup(Base):
+    """
+    Per-affiliate daily totals of referral and affiliate activity (UTC days).
+    Maintained incrementally by AnalyticsRollupService from rows past each
+    source's watermark; charts read O(days) rows instead of the raw tables.
+    """
+    __tablename__ = "affiliate_daily_rollups"
+
+    affiliate_user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    referrals = Column(Integer, nullable=False, default=0)          # team members joined (any level)
+    direct_referrals = Column(Integer, nullable=False, default=0)   # level 1 only
+    commissions = Column(Integer, nullable=False, default=0)
+    commission_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    payout_requests = Column(Integer, nullable=False, default=0)
+    payout_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    referral_earnings = Column(Numeric(14, 2), nullable=False, default=0)   # net of reversals
+    referral_withdrawn = Column(Numeric(14, 2), nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<AffiliateDailyRollup(affiliate_user_id={self.affiliate_user_id}, day={self.day})>"
+
+
+class DailyRollup(Base):
+    """Platform-wide daily totals, same measures as AffiliateDailyRollup"""
+    __tablename__ = "daily_rollups"
+
+    day = Column(Date, primary_key=True)
+
+    referrals = Column(Integer, nullable=False, default=0)          # users who signed up referred (level 1 only)
+    direct_referrals = Column(Integer, nullable=False, default=0)
+    commissions = Column(Integer, nullable=False, default=0)
+    commission_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    payout_requests = Column(Integer, nullable=False, default=0)
+    payout_amount = Column(Numeric(14, 2), nullable=False, default=0)
+    referral_earnings = Column(Numeric(14, 2), nullable=False, default=0)
+    referral_withdrawn = Column(Numeric(14, 2), nullable=False, default=0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<DailyRollup(day={self.day})>"
+
+
+class RollupWatermark(Base):
+    """Highest source row id already folded into the daily rollups, per source table"""
+    __tablename__ = "rollup_watermarks"
+
+    source = Column(String(50), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<RollupWatermark(source='{self.source}', last_id={self.last_id})>"
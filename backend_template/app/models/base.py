@@ -10,15 +10,17 @@ from app.models.users import UserProfile
 from app.models.server import Server
 from app.models.plan import HostingPlan
 from app.models.order import Order
-from app.models.invoice import Invoice
-from app.models.billing import PaymentMethod, BillingSettings
-from app.models.referrals import  ReferralEarning, ReferralPayout
+from app.models.invoice import Invoice, InvoiceDunningEvent, InvoiceLineItem
+from app.models.billing import PaymentMethod, BillingSettings, BillingSummary
+from app.models.referrals import  ReferralEarning, ReferralPayout, ReferralClosure, ReferralLedgerEntry, ReferralBalance, ReferralLeaderboardEntry
 from app.models.support import SupportTicket
 from app.models.settings import UserSettings
 from app.models.countries import Country
+from app.models.cache_version import CacheVersion
+from app.models.analytics import AffiliateDailyRollup, DailyRollup, RollupWatermark
 from app.models.roles import Department, Role, Permission, UserDepartment, role_permissions, user_roles
 from app.models.affiliate import (
-    AffiliateSubscription, Referral, CommissionRule, Commission, Payout, AffiliateStats
+    AffiliateSubscription, Referral, CommissionRule, Commission, Payout, AffiliateStats, ReferralClick
 )
 # from app.models.payment import PaymentModel, PlanModel, SubscriptionModel
 
@@ -31,12 +33,14 @@ __all__ = [
     "Invoice",
     "PaymentMethod",
     "BillingSettings",
-    "ReferralEarning", "ReferralPayout",
+    "ReferralEarning", "ReferralPayout", "ReferralClosure", "ReferralLedgerEntry", "ReferralBalance", "ReferralLeaderboardEntry",
     "SupportTicket",
     "UserSettings",
     "Country",
+    "CacheVersion",
+    "AffiliateDailyRollup", "DailyRollup", "RollupWatermark",
     "Department", "Role", "Permission", "UserDepartment",
-    "AffiliateSubscription", "Referral", "CommissionRule", "Commission", "Payout", "AffiliateStats",
+    "AffiliateSubscription", "Referral", "CommissionRule", "Commission", "Payout", "AffiliateStats", "ReferralClick",
 ]
 
 # Optional debug info
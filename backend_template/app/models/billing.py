@@ -159,7 +159,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, JSON, Index
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, JSON, Index, Numeric
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -246,4 +246,33 @@ class BillingSettings(Base):  # 🔹 YE CLASS ADD KAREIN
     user = relationship("UserProfile", back_populates="billing_settings")
 
     def __repr__(self):
-        return f"<BillingSettings(id={self.id}, user_id={self.user_id}, auto_renewal={self.auto_renewal})>"
\ No newline at end of file
+        return f"<BillingSettings(id={self.id}, user_id={self.user_id}, auto_renewal={self.auto_renewal})>"
+
+
+class BillingSummary(Base):
+    """
+    Per-user billing figures for the customer dashboard and balance
+    endpoints, one row per user. Refreshed by BillingSummaryService in the
+    same transaction as every invoice / server change; checked against
+    invoices and servers by scripts/verify_billing_summaries.py.
+    """
+    __tablename__ = "billing_summaries"
+
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+
+    # Invoices awaiting payment (payment_status pending / overdue)
+    outstanding_balance = Column(Numeric(12, 2), nullable=False, default=0)
+    pending_invoices = Column(Integer, nullable=False, default=0)
+
+    # Active servers and their recurring cost
+    active_servers = Column(Integer, nullable=False, default=0)
+    monthly_cost = Column(Numeric(12, 2), nullable=False, default=0)
+
+    # Most recent paid invoice
+    last_payment_at = Column(DateTime(timezone=True), nullable=True)
+    last_payment_amount = Column(Numeric(10, 2), nullable=True)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BillingSummary(user_id={self.user_id}, outstanding_balance={self.outstanding_balance})>"
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class CacheVersion(Base):
+    """
+    Version counters for in-process caches.
+
+    Every worker keeps its own copy of a cached dataset together with the
+    version it was built from; bumping the counter here makes all workers
+    rebuild on their next version check.
+    """
+    __tablename__ = "cache_versions"
+
+    name = Column(String(100), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<CacheVersion(name='{self.name}', version={self.version})>"
@@ -99,7 +99,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, Numeric, ForeignKey, Text, JSON, Index
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, Numeric, ForeignKey, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -112,7 +112,11 @@ class Invoice(Base):
     # 🔹 Foreign Keys
     user_id = Column(Integer, ForeignKey('users_profiles.id'), nullable=False, index=True)
     order_id = Column(Integer, ForeignKey('orders.id'), nullable=True, index=True)  # optional link to an order
+    server_id = Column(Integer, ForeignKey('servers.id'), nullable=True)  # renewal invoices only
 
+    # 🔹 Billing period (renewal invoices: [start, end) of the period being renewed)
+    billing_period_start = Column(DateTime(timezone=True), nullable=True)
+    billing_period_end = Column(DateTime(timezone=True), nullable=True)
 
     # 🔹 Invoice info
     invoice_number = Column(String(100), unique=True, nullable=False, index=True)
@@ -191,6 +195,9 @@ class Invoice(Base):
         
         # Comprehensive analytics
         Index('idx_invoice_comprehensive', 'user_id', 'status', 'payment_status', 'due_date'),
+
+        # One renewal invoice per server per billing period
+        Index('uq_invoice_server_period', 'server_id', 'billing_period_start', unique=True),
     )
 
     def __repr__(self):
@@ -230,4 +237,77 @@ class Invoice(Base):
     def get_next_invoice_number(self):
         """Generate next invoice number (can be used in business logic)"""
         # This would typically be handled by database sequence or business logic
-        return f"INV-{self.invoice_date.strftime('%Y%m%d')}-{self.id:06d}"
\ No newline at end of file
+        return f"INV-{self.invoice_date.strftime('%Y%m%d')}-{self.id:06d}"
+
+
+class InvoiceDunningEvent(Base):
+    """
+    Outbox of dunning notifications, one row per invoice per dunning stage
+    (days overdue, INVOICE_DUNNING_STAGE_DAYS). Written by the overdue
+    sweeper in the same statement that marks the invoice; a notifier sends
+    rows with sent_at NULL and stamps them.
+    """
+    __tablename__ = "invoice_dunning_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, ForeignKey('invoices.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), nullable=False, index=True)
+
+    stage = Column(Integer, nullable=False)          # dunning stage reached, in days overdue
+    days_overdue = Column(Integer, nullable=False)
+    balance_due = Column(Numeric(10, 2), nullable=False)
+    late_fee = Column(Numeric(10, 2), nullable=False, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('invoice_id', 'stage', name='uq_dunning_event_invoice_stage'),
+        Index('idx_dunning_event_pending', 'sent_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<InvoiceDunningEvent(invoice_id={self.invoice_id}, stage={self.stage}, sent_at={self.sent_at})>"
+
+
+class InvoiceLineItem(Base):
+    """
+    One row per entry of Invoice.items, written alongside the JSON by every
+    invoice writer (InvoiceLineItemService) so revenue per plan / addon /
+    service is an indexed aggregate instead of parsing every invoice.
+    invoice_date is copied from the invoice for range scans.
+    """
+    __tablename__ = "invoice_line_items"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, ForeignKey('invoices.id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), nullable=False)
+    line_no = Column(Integer, nullable=False)                 # position in Invoice.items
+
+    # 🔹 What was sold
+    item_type = Column(String(20), nullable=False)            # plan, addon, service, other
+    ref_id = Column(Integer, nullable=True)                   # hosting_plans / addons / services id
+    description = Column(String(500), nullable=True)
+
+    # 🔹 Amounts (INR)
+    quantity = Column(Integer, nullable=False, default=1)
+    unit_price = Column(Numeric(10, 2), nullable=False, default=0)
+    amount = Column(Numeric(12, 2), nullable=False, default=0)           # quantity × unit_price
+    discount_amount = Column(Numeric(12, 2), nullable=False, default=0)
+    subtotal = Column(Numeric(12, 2), nullable=False, default=0)         # after discount, before tax
+    tax_amount = Column(Numeric(12, 2), nullable=False, default=0)
+    total_amount = Column(Numeric(12, 2), nullable=False, default=0)
+
+    invoice_date = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('invoice_id', 'line_no', name='uq_invoice_line_item_line'),
+        # Revenue per plan / addon / service over time
+        Index('idx_invoice_line_item_type_ref_date', 'item_type', 'ref_id', 'invoice_date'),
+        # Revenue of everything over time
+        Index('idx_invoice_line_item_date', 'invoice_date'),
+    )
+
+    def __repr__(self):
+        return f"<InvoiceLineItem(invoice_id={self.invoice_id}, line_no={self.line_no}, item_type='{self.item_type}', ref_id={self.ref_id})>"
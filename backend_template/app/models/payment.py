@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, JSON, Index, Text, Enum, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, JSON, Index, Text, Enum, Boolean, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -53,7 +53,7 @@ class PaymentTransaction(Base):
     currency = Column(String(10), default='INR', nullable=False)
 
     # Razorpay Details
-    razorpay_order_id = Column(String(100), unique=True, nullable=False, index=True)
+    razorpay_order_id = Column(String(100), nullable=False, index=True)  # Unique via PaymentRazorpayOrder
     razorpay_payment_id = Column(String(100), nullable=True, index=True)
     razorpay_signature = Column(String(255), nullable=True)
     
@@ -77,10 +77,14 @@ class PaymentTransaction(Base):
     failure_reason = Column(Text, nullable=True)
 
     # Timestamps
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # created_at is the monthly partition key, so it is part of the table's primary key
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     paid_at = Column(DateTime(timezone=True), nullable=True)
 
+    # ORM identity stays on id alone
+    __mapper_args__ = {"primary_key": [id]}
+
     # Relationships
     user = relationship(
         "UserProfile",
@@ -101,6 +105,10 @@ class PaymentTransaction(Base):
         Index('idx_payment_status_created', 'payment_status', 'created_at'),
         Index('idx_payment_commission', 'commission_distributed', 'payment_status'),
         Index('idx_payment_activation', 'activation_type', 'payment_type'),
+        # Unique constraints on a partitioned table must include the partition key,
+        # so this only holds per month; PaymentRazorpayOrder enforces it globally
+        UniqueConstraint('razorpay_order_id', 'created_at', name='uq_payment_razorpay_order'),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     def __repr__(self):
@@ -129,6 +137,23 @@ class PaymentTransaction(Base):
         return float(self.total_amount - self.refunded_amount)
 
 
+class PaymentRazorpayOrder(Base):
+    """
+    Unpartitioned key table holding each razorpay_order_id once.
+    payment_transactions is partitioned by created_at and cannot carry a
+    unique key on razorpay_order_id alone; PaymentService inserts a row here
+    in the same transaction as the payment, so a second payment for the same
+    Razorpay order fails on this primary key.
+    """
+    __tablename__ = "payment_razorpay_orders"
+
+    razorpay_order_id = Column(String(100), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self):
+        return f"<PaymentRazorpayOrder(razorpay_order_id='{self.razorpay_order_id}')>"
+
+
 class ReferralCommissionRate(Base):
     """
     Configuration table for referral commission rates
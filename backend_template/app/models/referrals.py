@@ -67,7 +67,7 @@
 
 
 
-from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON
+from sqlalchemy import Column, String, Integer, DateTime, Numeric, ForeignKey, Text, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -132,8 +132,17 @@ class ReferralEarning(Base):
     status = Column(String(50), default='pending')  # pending, approved, paid
     
     # Timestamps
-    earned_at = Column(DateTime(timezone=True), server_default=func.now())
+    # earned_at is the monthly partition key, so it is part of the table's primary key
+    earned_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True)
     paid_at = Column(DateTime(timezone=True), nullable=True)
+
+    # ORM identity stays on id alone
+    __mapper_args__ = {"primary_key": [id]}
+
+    __table_args__ = (
+        Index('idx_referral_earnings_order_level', 'order_id', 'level'),
+        {"postgresql_partition_by": "RANGE (earned_at)"},
+    )
     
     # Relationships
     user = relationship(
@@ -154,3 +163,106 @@ class ReferralEarning(Base):
     )
 
 
+class ReferralClosure(Base):
+    """
+    Closure table of the referral tree (users_profiles.referred_by).
+
+    One row per (ancestor, descendant) pair at every distance, so downline
+    counts, upline chains and team listings are single indexed lookups at
+    any depth. depth=1 is the direct referrer; self rows are not stored.
+    """
+    __tablename__ = "referral_closure"
+
+    ancestor_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    depth = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        # Downline queries: counts per level, team listings
+        Index('idx_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+        # Upline queries: commission chains
+        Index('idx_referral_closure_descendant_depth', 'descendant_id', 'depth'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralClosure(ancestor_id={self.ancestor_id}, descendant_id={self.descendant_id}, depth={self.depth})>"
+
+
+class ReferralLedgerEntry(Base):
+    """
+    Append-only ledger of everything that moves a user's referral balance:
+    earnings, reversals and payout state changes. Each row carries its
+    deltas per bucket and the available balance right after it.
+    """
+    __tablename__ = "referral_ledger"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('users_profiles.id'), nullable=False)
+
+    # earning, reversal, payout_requested, payout_rejected, payout_approved,
+    # adjustment, opening_balance
+    entry_type = Column(String(30), nullable=False)
+
+    earnings_delta = Column(Numeric(12, 2), nullable=False, default=0)
+    pending_delta = Column(Numeric(12, 2), nullable=False, default=0)
+    withdrawn_delta = Column(Numeric(12, 2), nullable=False, default=0)
+    balance_after = Column(Numeric(12, 2), nullable=False)
+
+    # referral_earnings is partitioned (PK includes earned_at), so no FK here
+    earning_id = Column(Integer, nullable=True)
+    payout_id = Column(Integer, ForeignKey('referral_payouts.id'), nullable=True)
+    note = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index('idx_referral_ledger_user_created', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralLedgerEntry(id={self.id}, user_id={self.user_id}, type='{self.entry_type}')>"
+
+
+class ReferralBalance(Base):
+    """
+    Running balance snapshot per user, kept in step with referral_ledger.
+    available_balance = total_earnings - pending_payouts - withdrawn.
+    """
+    __tablename__ = "referral_balances"
+
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), primary_key=True)
+    total_earnings = Column(Numeric(12, 2), nullable=False, default=0)
+    pending_payouts = Column(Numeric(12, 2), nullable=False, default=0)
+    withdrawn = Column(Numeric(12, 2), nullable=False, default=0)
+    available_balance = Column(Numeric(12, 2), nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # All-time leaderboard: top-N straight off the index
+        Index('idx_referral_balances_total_earnings', 'total_earnings', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f"<ReferralBalance(user_id={self.user_id}, available_balance={self.available_balance})>"
+
+
+class ReferralLeaderboardEntry(Base):
+    """
+    Precomputed top referrers per period ('week', 'month', 'all_time').
+    Rebuilt by ReferralLeaderboardService.refresh; ranks run 1..N per period
+    (ties broken by user_id).
+    """
+    __tablename__ = "referral_leaderboard"
+
+    period = Column(String(20), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users_profiles.id', ondelete='CASCADE'), nullable=False)
+    user_name = Column(String(255), nullable=True)
+    total_earnings = Column(Numeric(12, 2), nullable=False, default=0)
+    total_referrals = Column(Integer, nullable=False, default=0)
+    active_referrals = Column(Integer, nullable=False, default=0)
+    period_start = Column(DateTime(timezone=True), nullable=True)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<ReferralLeaderboardEntry(period={self.period}, rank={self.rank}, user_id={self.user_id})>"
@@ -3,7 +3,7 @@ Affiliate/Referral System Schemas
 """
 from pydantic import BaseModel, Field, validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 
 
@@ -236,6 +236,48 @@ class CommissionRuleResponse(BaseModel):
         from_attributes = True
 
 
+class CommissionRuleCreate(BaseModel):
+    """Create a commission rule (Admin)"""
+    name: str = Field(..., max_length=100)
+    description: Optional[str] = None
+    level: int = Field(..., ge=1, le=3)
+    product_type: Optional[str] = Field(None, description="'server', 'domain', 'all', etc")
+    commission_type: str = Field(..., description="percentage or fixed")
+    commission_value: Decimal = Field(..., ge=0)
+    min_purchase_amount: Optional[Decimal] = None
+    max_purchase_amount: Optional[Decimal] = None
+    is_active: bool = True
+    priority: int = 0
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+
+    @validator('commission_type')
+    def validate_commission_type(cls, v):
+        if v not in ('percentage', 'fixed'):
+            raise ValueError('commission_type must be percentage or fixed')
+        return v
+
+
+class CommissionRuleUpdate(BaseModel):
+    """Partial update of a commission rule (Admin)"""
+    name: Optional[str] = Field(None, max_length=100)
+    description: Optional[str] = None
+    commission_type: Optional[str] = None
+    commission_value: Optional[Decimal] = Field(None, ge=0)
+    min_purchase_amount: Optional[Decimal] = None
+    max_purchase_amount: Optional[Decimal] = None
+    is_active: Optional[bool] = None
+    priority: Optional[int] = None
+    valid_from: Optional[datetime] = None
+    valid_until: Optional[datetime] = None
+
+    @validator('commission_type')
+    def validate_commission_type(cls, v):
+        if v is not None and v not in ('percentage', 'fixed'):
+            raise ValueError('commission_type must be percentage or fixed')
+        return v
+
+
 # ==================== Activity Feed ====================
 
 class AffiliateActivity(BaseModel):
@@ -247,3 +289,26 @@ class AffiliateActivity(BaseModel):
     user_email: Optional[str]
     level: Optional[int]
     created_at: datetime
+
+
+# ==================== Analytics ====================
+
+class AnalyticsPoint(BaseModel):
+    """Totals of one day / week / month (period_start is its first day)"""
+    period_start: date
+    referrals: int
+    direct_referrals: int
+    commissions: int
+    commission_amount: Decimal
+    payout_requests: int
+    payout_amount: Decimal
+    referral_earnings: Decimal
+    referral_withdrawn: Decimal
+
+
+class AnalyticsTimeSeries(BaseModel):
+    """Time series read from the daily rollups"""
+    granularity: str
+    start: date
+    end: date
+    points: List[AnalyticsPoint]
@@ -235,7 +235,7 @@
 
 
 from pydantic import BaseModel, field_validator, ConfigDict
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from decimal import Decimal
 
@@ -327,6 +327,39 @@ class ReferralPayoutAction(BaseModel):
         return v
 
 
+# ----------------------------
+# ✅ Bulk Payout Action (Approve / Complete)
+# ----------------------------
+class ReferralPayoutBulkAction(BaseModel):
+    action: str  # approve or complete
+    payout_ids: List[int]
+    payment_reference: Optional[str] = None
+
+    @field_validator('action')
+    @classmethod
+    def validate_action(cls, v):
+        allowed = ['approve', 'complete']
+        if v not in allowed:
+            raise ValueError(f'Action must be one of {allowed}')
+        return v
+
+    @field_validator('payout_ids')
+    @classmethod
+    def validate_payout_ids(cls, v):
+        if not v:
+            raise ValueError('At least one payout id is required')
+        if len(v) > 5000:
+            raise ValueError('At most 5000 payouts per request')
+        return v
+
+    @field_validator('payment_reference')
+    @classmethod
+    def validate_payment_reference(cls, v, info):
+        if info.data.get('action') == 'approve' and not v:
+            raise ValueError('Payment reference is required for approval')
+        return v
+
+
 # ----------------------------
 # ✅ Referral Earning Schema
 # ----------------------------
@@ -361,6 +394,56 @@ class ReferralEarning(BaseModel):
         return v
 
 
+# ----------------------------
+# ✅ Referral Ledger Entry Schema
+# ----------------------------
+class ReferralLedgerEntry(BaseModel):
+    id: int
+    user_id: int
+    entry_type: str
+    earnings_delta: Decimal
+    pending_delta: Decimal
+    withdrawn_delta: Decimal
+    balance_after: Decimal
+    earning_id: Optional[int] = None
+    payout_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+# ----------------------------
+# ✅ Commission Rate Config Schemas (Admin)
+# ----------------------------
+class CommissionRateResponse(BaseModel):
+    id: int
+    level: int
+    payment_type: str
+    commission_percent: Decimal
+    active_from: Optional[datetime] = None
+    active_until: Optional[datetime] = None
+    is_active: bool
+    description: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CommissionRateUpdate(BaseModel):
+    commission_percent: Optional[Decimal] = None
+    active_from: Optional[datetime] = None
+    active_until: Optional[datetime] = None
+    is_active: Optional[bool] = None
+    description: Optional[str] = None
+
+    @field_validator('commission_percent')
+    @classmethod
+    def validate_commission_percent(cls, v):
+        if v is not None and (v < 0 or v > 100):
+            raise ValueError('Commission percent must be between 0 and 100')
+        return v
+
+
 # ----------------------------
 # ✅ Referral Stats Schema
 # ----------------------------
@@ -394,6 +477,27 @@ class ReferralStats(BaseModel):
         return v
 
 
+# ----------------------------
+# ✅ Referral Leaderboard Schemas
+# ----------------------------
+class ReferralLeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    user_name: Optional[str] = None
+    total_earnings: Decimal
+    total_referrals: int
+    active_referrals: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ReferralLeaderboard(BaseModel):
+    period: str
+    period_start: Optional[datetime] = None
+    refreshed_at: Optional[datetime] = None
+    entries: List[ReferralLeaderboardEntry]
+
+
 # ----------------------------
 # ✅ Bank Account Details
 # ----------------------------
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import AffiliateStats
+
+
+class AffiliateDashboardCache:
+    """
+    Per-process cache of assembled affiliate dashboards:
+    - One snapshot per user, kept for AFFILIATE_DASHBOARD_CACHE_SECONDS
+      (LRU-bounded by AFFILIATE_DASHBOARD_CACHE_SIZE)
+    - Validated on every read against affiliate_stats.last_calculated_at,
+      which every referral, commission and payout event bumps
+      (AffiliateStatsService), so a change made by any worker invalidates
+      the snapshot on the next load; one indexed lookup instead of the
+      whole dashboard
+    - Single flight: concurrent loads of a missing snapshot share one build
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "invalidated": 0,
+            "coalesced": 0,
+            "builds": 0,
+            "build_errors": 0,
+            "build_seconds": 0.0,
+        }
+
+    async def get(self, db: AsyncSession, user_id: int, build: Callable[[], Awaitable[Any]]) -> Any:
+        """Cached dashboard for user_id, built with build() when missing or stale"""
+        version = await self._version(db, user_id)
+
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, cached_version, value = entry
+            if expires_at < time.monotonic():
+                self._metrics["expired"] += 1
+            elif cached_version != version:
+                self._metrics["invalidated"] += 1
+            else:
+                self._metrics["hits"] += 1
+                self._entries.move_to_end(user_id)
+                return value
+            self._entries.pop(user_id, None)
+        else:
+            self._metrics["misses"] += 1
+
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            self._metrics["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        started = time.perf_counter()
+        try:
+            value = await build()
+        except Exception as e:
+            self._metrics["build_errors"] += 1
+            future.set_exception(e)
+            # Waiters (if any) receive the error; mark it retrieved either way
+            future.exception()
+            raise
+        else:
+            self._store(user_id, version, value)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            self._metrics["builds"] += 1
+            self._metrics["build_seconds"] += time.perf_counter() - started
+            self._inflight.pop(user_id, None)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """Drop one user's snapshot (or all) in this worker"""
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self._metrics["hits"] + self._metrics["misses"] + self._metrics["expired"] + self._metrics["invalidated"]
+        return {
+            **self._metrics,
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_ratio": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": settings.AFFILIATE_DASHBOARD_CACHE_SECONDS,
+            "max_size": settings.AFFILIATE_DASHBOARD_CACHE_SIZE,
+        }
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    async def _version(db: AsyncSession, user_id: int) -> Optional[datetime]:
+        result = await db.execute(
+            select(AffiliateStats.last_calculated_at).where(AffiliateStats.affiliate_user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    def _store(self, user_id: int, version: Optional[datetime], value: Any) -> None:
+        self._entries[user_id] = (time.monotonic() + settings.AFFILIATE_DASHBOARD_CACHE_SECONDS, version, value)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > settings.AFFILIATE_DASHBOARD_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+
+# Shared by every request handled by this worker process
+affiliate_dashboard_cache = AffiliateDashboardCache()
@@ -2,11 +2,13 @@
 Affiliate Service - Handles subscription, referral tracking, and commission calculations
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_, desc
-from sqlalchemy.orm import selectinload, joinedload
+from fastapi import HTTPException
+from sqlalchemy import select, func, and_, or_, desc, true, tuple_, update
+from sqlalchemy.orm import aliased, joinedload
 from typing import Optional, List, Dict, Tuple
 from decimal import Decimal
 from datetime import datetime, timedelta
+import base64
 import secrets
 import string
 
@@ -17,13 +19,26 @@ from app.models.affiliate import (
 from app.models.users import UserProfile
 from app.models.order import Order
 from app.models.server import Server
+from app.services.affiliate_stats_service import AffiliateStatsService
+from app.services.referral_closure_service import ReferralClosureService
+from app.services.commission_rule_cache import CachedRule, commission_rule_cache
+from app.services.referral_code_index import referral_code_index
+from app.services.referral_graph import referral_graph_index
 from app.schemas.affiliate import (
     AffiliateSubscriptionCreate, AffiliateSubscriptionResponse,
-    PayoutRequest, PayoutResponse, AffiliateStatsResponse,
+    PayoutRequest, PayoutResponse, AffiliateStatsResponse, AffiliateDashboard,
     CommissionDetail, TeamMember, ServerPurchaseDetail
 )
 
 
+# Admin payout actions: (statuses the action is allowed from, resulting status)
+PAYOUT_TRANSITIONS = {
+    'approve': ((PayoutStatus.PENDING,), PayoutStatus.PROCESSING),
+    'complete': ((PayoutStatus.PROCESSING,), PayoutStatus.COMPLETED),
+    'reject': ((PayoutStatus.PENDING, PayoutStatus.PROCESSING), PayoutStatus.FAILED),
+}
+
+
 class AffiliateService:
     """Service for managing affiliate/referral system"""
 
@@ -84,6 +99,7 @@ class AffiliateService:
         db.add(subscription)
         await db.commit()
         await db.refresh(subscription)
+        referral_code_index.add(referral_code)
 
         # Initialize affiliate stats
         await self._initialize_affiliate_stats(db, user_id)
@@ -174,6 +190,12 @@ class AffiliateService:
         if existing.scalar_one_or_none():
             return None  # Already referred
 
+        # A user cannot be referred by someone in their own downline
+        if referrer_subscription.user_id == referred_user_id or await ReferralClosureService().is_descendant(
+            db, referred_user_id, referrer_subscription.user_id
+        ):
+            return None
+
         # Create Level 1 referral
         referral_l1 = Referral(
             referrer_id=referrer_subscription.user_id,
@@ -196,19 +218,15 @@ class AffiliateService:
         if user:
             user.referred_by = referrer_subscription.user_id
 
-        # Track up to Level 2 and Level 3
-        current_referrer_id = referrer_subscription.user_id
+        # Level 2 and Level 3 referrers come from the closure table in one query
+        closure_service = ReferralClosureService()
+        upline = await closure_service.get_upline(db, referrer_subscription.user_id, max_depth=2)
+        await closure_service.link_user(db, referred_user_id, referrer_subscription.user_id)
+
+        stats_movements = [{"user_id": referrer_subscription.user_id, "total_referrals_level1": 1}]
         parent_referral_id = referral_l1.id
-        
-        for level in [2, 3]:
-            # Find next level referrer
-            next_result = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            next_referrer_id = next_result.scalar_one_or_none()
-            
-            if not next_referrer_id:
-                break
+        for referrer_depth, next_referrer_id in sorted(upline.items()):
+            level = referrer_depth + 1
 
             # Create referral record for this level
             referral = Referral(
@@ -231,13 +249,13 @@ class AffiliateService:
                 user.referral_level_3 = next_referrer_id
             
             parent_referral_id = referral.id
-            current_referrer_id = next_referrer_id
+            stats_movements.append({"user_id": next_referrer_id, f"total_referrals_level{level}": 1})
 
+        # Every affected affiliate's counters move in the same transaction
+        await AffiliateStatsService().apply(db, stats_movements)
         await db.commit()
-        
-        # Update stats for all affected affiliates
-        await self._update_referral_counts(db, referrer_subscription.user_id)
-        
+        referral_graph_index.link(referred_user_id, referrer_subscription.user_id)
+
         return referral_l1
 
     async def mark_referral_converted(
@@ -248,20 +266,20 @@ class AffiliateService:
         amount: Decimal
     ):
         """Mark referral as converted (first purchase made)"""
+        # Only rows flipped by this statement count, so a concurrent
+        # conversion of the same user cannot bump the counters twice
         result = await db.execute(
-            select(Referral).where(Referral.referred_user_id == user_id)
+            update(Referral)
+            .where(Referral.referred_user_id == user_id, Referral.has_purchased.is_not(True))
+            .values(has_purchased=True, first_purchase_at=datetime.utcnow(), first_purchase_amount=amount)
+            .returning(Referral.referrer_id, Referral.level)
+            .execution_options(synchronize_session=False)
         )
-        referrals = result.scalars().all()
-
-        for referral in referrals:
-            if not referral.has_purchased:
-                referral.has_purchased = True
-                referral.first_purchase_at = datetime.utcnow()
-                referral.first_purchase_amount = amount
-                
-                # Update stats
-                await self._update_referral_counts(db, referral.referrer_id)
 
+        await AffiliateStatsService().apply(db, [
+            {"user_id": referrer_id, f"active_referrals_level{level}": 1}
+            for referrer_id, level in result.all()
+        ])
         await db.commit()
 
     # ==================== Commission Management ====================
@@ -288,6 +306,7 @@ class AffiliateService:
         )
         referrals = result.scalars().all()
 
+        stats_movements = []
         for referral in referrals:
             # Get applicable commission rule
             commission_rule = await self._get_commission_rule(
@@ -317,12 +336,43 @@ class AffiliateService:
                 status=CommissionStatus.PENDING
             )
             db.add(commission)
+            stats_movements.append({
+                "user_id": referral.referrer_id,
+                "total_commission_earned": commission_amount,
+                "pending_commission": commission_amount,
+            })
 
+        await AffiliateStatsService().apply(db, stats_movements)
         await db.commit()
 
-        # Update affiliate stats for all referrers
-        for referral in referrals:
-            await self._update_commission_stats(db, referral.referrer_id)
+    async def create_commission_rule(self, db: AsyncSession, data: Dict) -> CommissionRule:
+        """Create a commission rule and invalidate every worker's rule cache"""
+        rule = CommissionRule(**data)
+        db.add(rule)
+        await commission_rule_cache.invalidate(db)
+        await db.commit()
+        await db.refresh(rule)
+        return rule
+
+    async def update_commission_rule(
+        self,
+        db: AsyncSession,
+        rule_id: int,
+        changes: Dict
+    ) -> Optional[CommissionRule]:
+        """Update a commission rule and invalidate every worker's rule cache"""
+        result = await db.execute(select(CommissionRule).where(CommissionRule.id == rule_id))
+        rule = result.scalar_one_or_none()
+        if not rule:
+            return None
+
+        for field, value in changes.items():
+            setattr(rule, field, value)
+
+        await commission_rule_cache.invalidate(db)
+        await db.commit()
+        await db.refresh(rule)
+        return rule
 
     async def approve_commission(
         self,
@@ -331,8 +381,9 @@ class AffiliateService:
         approved_by: int
     ) -> Optional[Commission]:
         """Approve a pending commission"""
+        # Row lock: a double-submitted approval must not move the stats twice
         result = await db.execute(
-            select(Commission).where(Commission.id == commission_id)
+            select(Commission).where(Commission.id == commission_id).with_for_update()
         )
         commission = result.scalar_one_or_none()
 
@@ -340,11 +391,13 @@ class AffiliateService:
             commission.status = CommissionStatus.APPROVED
             commission.approved_at = datetime.utcnow()
             commission.approved_by = approved_by
+            await AffiliateStatsService().apply(db, [{
+                "user_id": commission.affiliate_user_id,
+                "pending_commission": -commission.commission_amount,
+                "approved_commission": commission.commission_amount,
+            }])
             await db.commit()
-            
-            # Update stats
-            await self._update_commission_stats(db, commission.affiliate_user_id)
-            
+
             return commission
         return None
 
@@ -357,10 +410,9 @@ class AffiliateService:
         payout_request: PayoutRequest
     ) -> Payout:
         """Create payout request"""
-        # Get available balance
-        stats = await self.get_affiliate_stats(db, user_id)
-        
-        if stats.available_balance < payout_request.amount:
+        # Reserve the amount atomically; the payout row commits with it
+        if not await AffiliateStatsService().reserve_balance(db, user_id, payout_request.amount):
+            await db.rollback()
             raise ValueError("Insufficient balance for payout")
 
         payout = Payout(
@@ -389,38 +441,103 @@ class AffiliateService:
     ) -> Optional[Payout]:
         """Process payout (approve/reject/complete)"""
         result = await db.execute(
-            select(Payout).where(Payout.id == payout_id)
+            select(Payout).where(Payout.id == payout_id).with_for_update()
         )
         payout = result.scalar_one_or_none()
 
         if not payout:
             return None
 
-        if action == 'approve':
-            payout.status = PayoutStatus.PROCESSING
-        elif action == 'complete':
-            payout.status = PayoutStatus.COMPLETED
+        previous_status = payout.status
+        transition = PAYOUT_TRANSITIONS.get(action)
+        if transition is None or previous_status not in transition[0]:
+            await db.rollback()
+            raise ValueError(f"Cannot {action} a payout that is {previous_status.value}")
+
+        payout.status = transition[1]
+        if action == 'complete':
             payout.processed_at = datetime.utcnow()
-            
+
             # Mark commissions as paid
-            await self._mark_commissions_paid(db, payout.affiliate_user_id, payout.amount, payout_id)
+            await self.mark_commissions_paid(db, payout.affiliate_user_id, payout.amount, payout_id)
         elif action == 'reject':
-            payout.status = PayoutStatus.FAILED
             payout.processed_at = datetime.utcnow()
 
         payout.processed_by = processed_by
         payout.transaction_id = transaction_id
         payout.admin_notes = admin_notes
 
+        stats_service = AffiliateStatsService()
+        await stats_service.apply(
+            db, [self.payout_stats_movement(payout.affiliate_user_id, payout.amount, previous_status, payout.status)]
+        )
+        # Status-only changes still have to reach cached dashboards
+        await stats_service.touch(db, payout.affiliate_user_id)
         await db.commit()
         await db.refresh(payout)
 
-        # Update stats
-        if action == 'complete':
-            await self._update_commission_stats(db, payout.affiliate_user_id)
-
         return payout
 
+    @staticmethod
+    def payout_stats_movement(
+        user_id: int,
+        amount: Decimal,
+        old_status: PayoutStatus,
+        new_status: PayoutStatus
+    ) -> Dict:
+        """Stats deltas for a payout moving from old_status to new_status"""
+        open_statuses = (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+        opened = (new_status in open_statuses) - (old_status in open_statuses)
+        completed = (new_status == PayoutStatus.COMPLETED) - (old_status == PayoutStatus.COMPLETED)
+        return {
+            "user_id": user_id,
+            "pending_payouts": amount * opened,
+            "total_payouts": completed,
+            "total_payout_amount": amount * completed,
+        }
+
+    async def mark_commissions_paid(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        amount: Decimal,
+        payout_id: int
+    ):
+        """Mark commissions as paid for a payout (committed by the caller)"""
+        # Get approved commissions up to the payout amount
+        result = await db.execute(
+            select(Commission).where(
+                and_(
+                    Commission.affiliate_user_id == user_id,
+                    Commission.status == CommissionStatus.APPROVED,
+                    Commission.payout_id == None
+                )
+            ).order_by(Commission.created_at).limit(100)  # Safety limit
+        )
+        commissions = result.scalars().all()
+
+        remaining = amount
+        paid = Decimal('0')
+        for comm in commissions:
+            if remaining <= 0:
+                break
+            
+            comm.status = CommissionStatus.PAID
+            comm.paid_at = datetime.utcnow()
+            comm.payout_id = payout_id
+            remaining -= comm.commission_amount
+            paid += comm.commission_amount
+
+        # autoflush is off; flush so a later call in the same transaction
+        # does not pick these commissions up again
+        await db.flush()
+
+        await AffiliateStatsService().apply(db, [{
+            "user_id": user_id,
+            "approved_commission": -paid,
+            "paid_commission": paid,
+        }])
+
     # ==================== Stats & Analytics ====================
 
     async def get_affiliate_stats(
@@ -468,147 +585,293 @@ class AffiliateService:
             can_request_payout=stats.available_balance >= Decimal('500')
         )
 
+    async def get_dashboard(self, db: AsyncSession, user_id: int) -> AffiliateDashboard:
+        """Assemble the affiliate dashboard (cached per user by affiliate_dashboard_cache)"""
+        subscription = await self.get_user_subscription(db, user_id)
+        stats = await self.get_affiliate_stats(db, user_id)
+        recent_commissions = await self.get_recent_commissions(db, user_id, limit=10)
+
+        # Get pending payouts
+        payout_result = await db.execute(
+            select(Payout).where(
+                and_(
+                    Payout.affiliate_user_id == user_id,
+                    Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
+                )
+            )
+        )
+        pending_payouts = payout_result.scalars().all()
+
+        # Team summary
+        team_summary = {
+            "level1_count": stats.total_referrals_level1,
+            "level2_count": stats.total_referrals_level2,
+            "level3_count": stats.total_referrals_level3,
+            "total_active": stats.active_referrals,
+            "total_commission": stats.total_commission_earned
+        }
+
+        return AffiliateDashboard(
+            subscription=subscription,
+            stats=stats,
+            recent_commissions=recent_commissions,
+            pending_payouts=[PayoutResponse.from_orm(p) for p in pending_payouts],
+            team_summary=team_summary
+        )
+
     async def get_team_members(
         self,
         db: AsyncSession,
         user_id: int,
-        level: Optional[int] = None
+        level: Optional[int] = None,
+        has_purchased: Optional[bool] = None,
+        search: Optional[str] = None
     ) -> List[TeamMember]:
         """Get team members at specific level or all levels"""
-        query = select(Referral).where(Referral.referrer_id == user_id)
-        
-        if level:
-            query = query.where(Referral.level == level)
+        members, _ = await self.get_team_members_page(
+            db, user_id, level=level, has_purchased=has_purchased, search=search
+        )
+        return members
 
-        query = query.options(selectinload(Referral.commissions))
-        
-        result = await db.execute(query)
-        referrals = result.scalars().all()
+    async def get_team_members_page(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        level: Optional[int] = None,
+        has_purchased: Optional[bool] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[TeamMember], Optional[str]]:
+        """
+        Team members with their metrics in one query: per-member order total,
+        commission, active servers and child count come from LATERAL
+        subqueries evaluated only for the rows of the page.
 
-        team_members = []
-        for ref in referrals:
-            # Get user details
-            user_result = await db.execute(
-                select(UserProfile).where(UserProfile.id == ref.referred_user_id)
+        Ordered by (level, referral id); pass the returned cursor back to get
+        the next page. Returns (members, next_cursor).
+        """
+        # Most users have no team at the requested level: the in-process
+        # graph (when enabled) answers that without running the query
+        graph = await referral_graph_index.get(db)
+        if graph is not None:
+            counts = graph.get_downline_counts(user_id)
+            if not (counts.get(level, 0) if level else sum(counts.values())):
+                return [], None
+
+        purchases = (
+            select(func.coalesce(func.sum(Order.total_amount), 0).label("total"))
+            .where(
+                Order.user_id == Referral.referred_user_id,
+                Order.order_status.in_(['completed', 'active'])
             )
-            user = user_result.scalar_one_or_none()
-            if not user:
-                continue
-
-            # Get total purchases
-            purchases_result = await db.execute(
-                select(func.coalesce(func.sum(Order.total_amount), 0)).where(
-                    and_(
-                        Order.user_id == ref.referred_user_id,
-                        Order.order_status.in_(['completed', 'active'])
-                    )
-                )
+            .lateral("purchases")
+        )
+        commission = (
+            select(func.coalesce(func.sum(Commission.commission_amount), 0).label("total"))
+            .where(
+                Commission.referral_id == Referral.id,
+                Commission.affiliate_user_id == user_id
             )
-            total_purchases = purchases_result.scalar() or Decimal('0')
-
-            # Get total commission from this user
-            commission_result = await db.execute(
-                select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                    and_(
-                        Commission.referral_id == ref.id,
-                        Commission.affiliate_user_id == user_id
-                    )
-                )
+            .lateral("commission")
+        )
+        servers = (
+            select(func.count(Server.id).label("count"))
+            .where(
+                Server.user_id == Referral.referred_user_id,
+                Server.server_status.in_(['active', 'running'])
             )
-            total_commission = commission_result.scalar() or Decimal('0')
-
-            # Get active servers count
-            servers_result = await db.execute(
-                select(func.count(Server.id)).where(
-                    and_(
-                        Server.user_id == ref.referred_user_id,
-                        Server.server_status.in_(['active', 'running'])
-                    )
-                )
+            .lateral("servers")
+        )
+        child = aliased(Referral)
+        children = (
+            select(func.count(child.id).label("count"))
+            .where(child.referrer_id == Referral.referred_user_id, child.level == 1)
+            .lateral("children")
+        )
+
+        query = (
+            select(
+                Referral.id,
+                Referral.level,
+                Referral.created_at,
+                Referral.has_purchased,
+                UserProfile.id.label("member_id"),
+                UserProfile.email,
+                UserProfile.full_name,
+                purchases.c.total.label("total_purchases"),
+                commission.c.total.label("total_commission"),
+                servers.c.count.label("active_servers"),
+                children.c.count.label("child_count"),
             )
-            active_servers = servers_result.scalar() or 0
-
-            # Get child count (direct referrals of this member)
-            child_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == ref.referred_user_id,
-                        Referral.level == 1
-                    )
-                )
+            .join(UserProfile, UserProfile.id == Referral.referred_user_id)
+            .join(purchases, true())
+            .join(commission, true())
+            .join(servers, true())
+            .join(children, true())
+            .where(Referral.referrer_id == user_id)
+            .order_by(Referral.level, Referral.id)
+        )
+
+        if level:
+            query = query.where(Referral.level == level)
+        if has_purchased is not None:
+            query = query.where(Referral.has_purchased == has_purchased)
+        if search:
+            pattern = f"%{search}%"
+            query = query.where(or_(UserProfile.full_name.ilike(pattern), UserProfile.email.ilike(pattern)))
+        if cursor:
+            after_level, after_id = self._decode_team_cursor(cursor)
+            query = query.where(tuple_(Referral.level, Referral.id) > tuple_(after_level, after_id))
+        if limit:
+            query = query.limit(limit + 1)
+
+        rows = (await db.execute(query)).all()
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_team_cursor(rows[-1].level, rows[-1].id)
+
+        members = [
+            TeamMember(
+                user_id=row.member_id,
+                email=row.email,
+                full_name=row.full_name,
+                level=row.level,
+                joined_at=row.created_at,
+                has_purchased=bool(row.has_purchased),
+                total_purchases=row.total_purchases or Decimal('0'),
+                total_commission=row.total_commission or Decimal('0'),
+                active_servers=row.active_servers or 0,
+                child_count=row.child_count or 0
             )
-            child_count = child_result.scalar() or 0
-
-            team_members.append(TeamMember(
-                user_id=user.id,
-                email=user.email,
-                full_name=user.full_name,
-                level=ref.level,
-                joined_at=ref.created_at,
-                has_purchased=ref.has_purchased,
-                total_purchases=total_purchases,
-                total_commission=total_commission,
-                active_servers=active_servers,
-                child_count=child_count
-            ))
-
-        return team_members
+            for row in rows
+        ]
+        return members, next_cursor
+
+    @staticmethod
+    def _encode_team_cursor(level: int, referral_id: int) -> str:
+        return base64.urlsafe_b64encode(f"{level}:{referral_id}".encode()).decode()
+
+    @staticmethod
+    def _decode_team_cursor(cursor: str) -> Tuple[int, int]:
+        try:
+            level, referral_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            return int(level), int(referral_id)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
     async def get_recent_commissions(
         self,
         db: AsyncSession,
         user_id: int,
-        limit: int = 10
+        limit: int = 10,
+        status: Optional[CommissionStatus] = None
     ) -> List[CommissionDetail]:
         """Get recent commissions"""
+        commissions, _ = await self.get_commissions_page(db, user_id, status=status, limit=limit)
+        return commissions
+
+    async def get_commissions_page(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        status: Optional[CommissionStatus] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Tuple[List[CommissionDetail], Optional[str]]:
+        """
+        One page of an affiliate's commissions, newest first, with the
+        referred user's email and order in the same query.
+
+        Keyset pagination on (created_at, id): pass the returned cursor to get
+        the next page; None means there are no more rows.
+        """
+        query = self._commission_detail_query().where(Commission.affiliate_user_id == user_id)
+        if status is not None:
+            query = query.where(Commission.status == status)
+        if cursor:
+            after_created_at, after_id = self._decode_commission_cursor(cursor)
+            query = query.where(tuple_(Commission.created_at, Commission.id) < tuple_(after_created_at, after_id))
+        query = query.order_by(desc(Commission.created_at), desc(Commission.id)).limit(limit + 1)
+
+        rows = (await db.execute(query)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self._encode_commission_cursor(rows[-1].created_at, rows[-1].id)
+
+        return [self._commission_detail(row) for row in rows], next_cursor
+
+    async def get_commission_detail(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        commission_id: int
+    ) -> Optional[CommissionDetail]:
+        """Single commission of this affiliate, with the same related info as the feed"""
         result = await db.execute(
-            select(Commission)
-            .where(Commission.affiliate_user_id == user_id)
-            .order_by(desc(Commission.created_at))
-            .limit(limit)
-            .options(
-                selectinload(Commission.referral)
+            self._commission_detail_query().where(
+                Commission.id == commission_id,
+                Commission.affiliate_user_id == user_id
             )
         )
-        commissions = result.scalars().all()
+        row = result.one_or_none()
+        return self._commission_detail(row) if row else None
 
-        details = []
-        for comm in commissions:
-            # Get referred user email
-            referred_email = None
-            if comm.referral:
-                user_result = await db.execute(
-                    select(UserProfile.email).where(UserProfile.id == comm.referral.referred_user_id)
-                )
-                referred_email = user_result.scalar_one_or_none()
+    @staticmethod
+    def _commission_detail_query():
+        """Only the columns CommissionDetail needs; referral, user and order outer-joined"""
+        return (
+            select(
+                Commission.id,
+                Commission.affiliate_user_id,
+                Commission.level,
+                Commission.order_id,
+                Commission.order_amount,
+                Commission.commission_rate,
+                Commission.commission_amount,
+                Commission.status,
+                Commission.approved_at,
+                Commission.paid_at,
+                Commission.created_at,
+                UserProfile.email.label('referred_user_email'),
+                Order.id.label('existing_order_id'),
+            )
+            .outerjoin(Referral, Referral.id == Commission.referral_id)
+            .outerjoin(UserProfile, UserProfile.id == Referral.referred_user_id)
+            .outerjoin(Order, Order.id == Commission.order_id)
+        )
 
-            # Get order description
-            order_desc = None
-            if comm.order_id:
-                order_result = await db.execute(
-                    select(Order).where(Order.id == comm.order_id)
-                )
-                order = order_result.scalar_one_or_none()
-                if order:
-                    order_desc = f"Order #{order.id}"
-
-            details.append(CommissionDetail(
-                id=comm.id,
-                affiliate_user_id=comm.affiliate_user_id,
-                level=comm.level,
-                order_id=comm.order_id,
-                order_amount=comm.order_amount,
-                commission_rate=comm.commission_rate,
-                commission_amount=comm.commission_amount,
-                status=comm.status.value,
-                approved_at=comm.approved_at,
-                paid_at=comm.paid_at,
-                created_at=comm.created_at,
-                referred_user_email=referred_email,
-                order_description=order_desc
-            ))
-
-        return details
+    @staticmethod
+    def _commission_detail(row) -> CommissionDetail:
+        return CommissionDetail(
+            id=row.id,
+            affiliate_user_id=row.affiliate_user_id,
+            level=row.level,
+            order_id=row.order_id,
+            order_amount=row.order_amount,
+            commission_rate=row.commission_rate,
+            commission_amount=row.commission_amount,
+            status=row.status.value,
+            approved_at=row.approved_at,
+            paid_at=row.paid_at,
+            created_at=row.created_at,
+            referred_user_email=row.referred_user_email,
+            order_description=f"Order #{row.existing_order_id}" if row.existing_order_id else None
+        )
+
+    @staticmethod
+    def _encode_commission_cursor(created_at: datetime, commission_id: int) -> str:
+        return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{commission_id}".encode()).decode()
+
+    @staticmethod
+    def _decode_commission_cursor(cursor: str) -> Tuple[datetime, int]:
+        try:
+            created_at, commission_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(created_at), int(commission_id)
+        except (ValueError, UnicodeDecodeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
     # ==================== Helper Methods ====================
 
@@ -635,202 +898,12 @@ class AffiliateService:
         db.add(stats)
         await db.commit()
 
-    async def _update_referral_counts(self, db: AsyncSession, user_id: int):
-        """Update referral counts in stats"""
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
-            await self._initialize_affiliate_stats(db, user_id)
-            return
-
-        # Count referrals by level
-        for level in [1, 2, 3]:
-            # Total referrals
-            total_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level
-                    )
-                )
-            )
-            total = total_result.scalar() or 0
-
-            # Active referrals (with purchases)
-            active_result = await db.execute(
-                select(func.count(Referral.id)).where(
-                    and_(
-                        Referral.referrer_id == user_id,
-                        Referral.level == level,
-                        Referral.has_purchased == True
-                    )
-                )
-            )
-            active = active_result.scalar() or 0
-
-            if level == 1:
-                stats.total_referrals_level1 = total
-                stats.active_referrals_level1 = active
-            elif level == 2:
-                stats.total_referrals_level2 = total
-                stats.active_referrals_level2 = active
-            else:
-                stats.total_referrals_level3 = total
-                stats.active_referrals_level3 = active
-
-        stats.total_referrals = stats.total_referrals_level1 + stats.total_referrals_level2 + stats.total_referrals_level3
-        stats.active_referrals = stats.active_referrals_level1 + stats.active_referrals_level2 + stats.active_referrals_level3
-
-        await db.commit()
-
-    async def _update_commission_stats(self, db: AsyncSession, user_id: int):
-        """Update commission stats"""
-        stats_result = await db.execute(
-            select(AffiliateStats).where(AffiliateStats.affiliate_user_id == user_id)
-        )
-        stats = stats_result.scalar_one_or_none()
-        if not stats:
-            return
-
-        # Total earned
-        total_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                Commission.affiliate_user_id == user_id
-            )
-        )
-        stats.total_commission_earned = total_result.scalar() or Decimal('0')
-
-        # Pending
-        pending_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.PENDING
-                )
-            )
-        )
-        stats.pending_commission = pending_result.scalar() or Decimal('0')
-
-        # Approved
-        approved_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.APPROVED
-                )
-            )
-        )
-        stats.approved_commission = approved_result.scalar() or Decimal('0')
-
-        # Paid
-        paid_result = await db.execute(
-            select(func.coalesce(func.sum(Commission.commission_amount), 0)).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.PAID
-                )
-            )
-        )
-        stats.paid_commission = paid_result.scalar() or Decimal('0')
-
-        # Payouts
-        payout_count_result = await db.execute(
-            select(func.count(Payout.id)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payouts = payout_count_result.scalar() or 0
-
-        payout_amount_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status == PayoutStatus.COMPLETED
-                )
-            )
-        )
-        stats.total_payout_amount = payout_amount_result.scalar() or Decimal('0')
-
-        # Available balance = approved - paid - pending payouts
-        pending_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(Payout.amount), 0)).where(
-                and_(
-                    Payout.affiliate_user_id == user_id,
-                    Payout.status.in_([PayoutStatus.PENDING, PayoutStatus.PROCESSING])
-                )
-            )
-        )
-        pending_payouts = pending_payouts_result.scalar() or Decimal('0')
-
-        stats.available_balance = stats.approved_commission - stats.paid_commission - pending_payouts
-        stats.last_calculated_at = datetime.utcnow()
-
-        await db.commit()
-
     async def _get_commission_rule(
         self,
         db: AsyncSession,
         level: int,
         product_type: str,
         order_amount: Decimal
-    ) -> Optional[CommissionRule]:
-        """Get applicable commission rule"""
-        result = await db.execute(
-            select(CommissionRule).where(
-                and_(
-                    CommissionRule.level == level,
-                    or_(
-                        CommissionRule.product_type == product_type,
-                        CommissionRule.product_type == 'all',
-                        CommissionRule.product_type == None
-                    ),
-                    CommissionRule.is_active == True,
-                    or_(
-                        CommissionRule.min_purchase_amount == None,
-                        CommissionRule.min_purchase_amount <= order_amount
-                    ),
-                    or_(
-                        CommissionRule.max_purchase_amount == None,
-                        CommissionRule.max_purchase_amount >= order_amount
-                    )
-                )
-            ).order_by(desc(CommissionRule.priority))
-        )
-        return result.scalars().first()
-
-    async def _mark_commissions_paid(
-        self,
-        db: AsyncSession,
-        user_id: int,
-        amount: Decimal,
-        payout_id: int
-    ):
-        """Mark commissions as paid for a payout"""
-        # Get approved commissions up to the payout amount
-        result = await db.execute(
-            select(Commission).where(
-                and_(
-                    Commission.affiliate_user_id == user_id,
-                    Commission.status == CommissionStatus.APPROVED,
-                    Commission.payout_id == None
-                )
-            ).order_by(Commission.created_at).limit(100)  # Safety limit
-        )
-        commissions = result.scalars().all()
-
-        remaining = amount
-        for comm in commissions:
-            if remaining <= 0:
-                break
-            
-            comm.status = CommissionStatus.PAID
-            comm.paid_at = datetime.utcnow()
-            comm.payout_id = payout_id
-            remaining -= comm.commission_amount
-
-        await db.commit()
+    ) -> Optional[CachedRule]:
+        """Get applicable commission rule (in-memory rule index, no query on cache hit)"""
+        return await commission_rule_cache.get_rule(db, level, product_type, order_amount)
@@ -0,0 +1,290 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.affiliate import (
+    AffiliateStats, Commission, CommissionStatus, Payout, PayoutStatus, Referral
+)
+
+
+ZERO = Decimal("0.00")
+
+REFERRAL_LEVELS = (1, 2, 3)
+
+COUNT_FIELDS = tuple(
+    [f"total_referrals_level{level}" for level in REFERRAL_LEVELS]
+    + ["total_referrals"]
+    + [f"active_referrals_level{level}" for level in REFERRAL_LEVELS]
+    + ["active_referrals", "total_payouts"]
+)
+AMOUNT_FIELDS = (
+    "total_commission_earned",
+    "pending_commission",
+    "approved_commission",
+    "paid_commission",
+    "total_payout_amount",
+    "available_balance",
+)
+STATS_FIELDS = COUNT_FIELDS + AMOUNT_FIELDS
+
+# Payouts whose amount is still held back from the available balance
+OPEN_PAYOUT_STATUSES = (PayoutStatus.PENDING, PayoutStatus.PROCESSING)
+
+
+class AffiliateStatsService:
+    """
+    Incremental upkeep of affiliate_stats:
+    - Every referral, commission and payout event applies its deltas to the
+      stats rows with one atomic upsert (col = col + delta), in the caller's
+      transaction, instead of re-aggregating the affiliate's history
+    - Totals and available_balance are derived from the component deltas, so
+      the formula lives in one place (_derive)
+    - verify_stats recomputes rows from referrals / commissions / payouts and
+      resync_stats repairs drift (scripts/verify_affiliate_stats.py)
+    - Every write bumps last_calculated_at, the version the dashboard cache
+      checks (affiliate_dashboard_cache)
+    Nothing is committed here; callers commit with their own changes.
+    """
+
+    async def apply(self, db: AsyncSession, movements: List[Dict[str, Any]]) -> None:
+        """
+        Apply stats deltas. Each movement carries a user_id plus any of the
+        per-level referral counters, commission / payout fields, or
+        `pending_payouts` (change in open payout amount).
+        """
+        totals: Dict[int, Dict[str, Any]] = {}
+        for movement in movements:
+            bucket = totals.setdefault(movement["user_id"], {})
+            for field, amount in movement.items():
+                if field != "user_id" and amount:
+                    bucket[field] = bucket.get(field, 0) + amount
+
+        rows = [
+            {"affiliate_user_id": user_id, **self._derive(bucket)}
+            for user_id, bucket in sorted(totals.items()) if bucket
+        ]
+        if not rows:
+            return
+
+        # Rows are written in user_id order so concurrent events lock stats
+        # rows in the same order and cannot deadlock each other
+        stmt = pg_insert(AffiliateStats).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AffiliateStats.affiliate_user_id],
+            set_={
+                **{
+                    field: func.coalesce(getattr(AffiliateStats, field), 0) + getattr(stmt.excluded, field)
+                    for field in STATS_FIELDS
+                },
+                "last_calculated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+
+    async def reserve_balance(self, db: AsyncSession, user_id: int, amount: Decimal) -> bool:
+        """
+        Hold `amount` of the available balance for a new payout request.
+
+        Check and decrement happen in one statement, so two concurrent
+        requests cannot both spend the same balance.
+        """
+        result = await db.execute(
+            update(AffiliateStats)
+            .where(
+                AffiliateStats.affiliate_user_id == user_id,
+                AffiliateStats.available_balance >= amount,
+            )
+            .values(
+                available_balance=AffiliateStats.available_balance - amount,
+                last_calculated_at=func.now(),
+            )
+            .returning(AffiliateStats.id)
+            .execution_options(synchronize_session=False)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def touch(self, db: AsyncSession, user_id: int) -> None:
+        """Mark the row changed without moving any counter (e.g. a payout approved)"""
+        await db.execute(
+            update(AffiliateStats)
+            .where(AffiliateStats.affiliate_user_id == user_id)
+            .values(last_calculated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+
+    # ---------------------
+    # Consistency checks
+    # ---------------------
+
+    async def compute_stats(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+        start_id: Optional[int] = None,
+        end_id: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """Stats recomputed from referrals, commissions and payouts (grouped queries)"""
+        user_ids = list(user_ids) if user_ids is not None else None
+
+        def scoped(query, column):
+            if user_ids is not None:
+                query = query.where(column.in_(user_ids))
+            if start_id is not None:
+                query = query.where(column >= start_id)
+            if end_id is not None:
+                query = query.where(column < end_id)
+            return query
+
+        stats: Dict[int, Dict[str, Any]] = {}
+
+        def bucket(user_id: int) -> Dict[str, Any]:
+            return stats.setdefault(user_id, {})
+
+        referrals_query = scoped(
+            select(
+                Referral.referrer_id,
+                Referral.level,
+                func.count(Referral.id),
+                func.count(Referral.id).filter(Referral.has_purchased == True),
+            ).group_by(Referral.referrer_id, Referral.level),
+            Referral.referrer_id,
+        )
+        for user_id, level, total, active in (await db.execute(referrals_query)).all():
+            if level in REFERRAL_LEVELS:
+                bucket(user_id)[f"total_referrals_level{level}"] = total
+                bucket(user_id)[f"active_referrals_level{level}"] = active
+
+        def commission_sum(commission_status=None):
+            amount = func.sum(Commission.commission_amount)
+            if commission_status is not None:
+                amount = amount.filter(Commission.status == commission_status)
+            return func.coalesce(amount, 0)
+
+        commissions_query = scoped(
+            select(
+                Commission.affiliate_user_id,
+                commission_sum(),
+                commission_sum(CommissionStatus.PENDING),
+                commission_sum(CommissionStatus.APPROVED),
+                commission_sum(CommissionStatus.PAID),
+            ).group_by(Commission.affiliate_user_id),
+            Commission.affiliate_user_id,
+        )
+        for user_id, total, pending, approved, paid in (await db.execute(commissions_query)).all():
+            bucket(user_id).update({
+                "total_commission_earned": Decimal(total),
+                "pending_commission": Decimal(pending),
+                "approved_commission": Decimal(approved),
+                "paid_commission": Decimal(paid),
+            })
+
+        completed = Payout.status == PayoutStatus.COMPLETED
+        payouts_query = scoped(
+            select(
+                Payout.affiliate_user_id,
+                func.count(Payout.id).filter(completed),
+                func.coalesce(func.sum(Payout.amount).filter(completed), 0),
+                func.coalesce(func.sum(Payout.amount).filter(Payout.status.in_(OPEN_PAYOUT_STATUSES)), 0),
+            ).group_by(Payout.affiliate_user_id),
+            Payout.affiliate_user_id,
+        )
+        for user_id, count, amount, open_amount in (await db.execute(payouts_query)).all():
+            bucket(user_id).update({
+                "total_payouts": count,
+                "total_payout_amount": Decimal(amount),
+                "pending_payouts": Decimal(open_amount),
+            })
+
+        return {user_id: self._derive(values) for user_id, values in stats.items()}
+
+    async def verify_stats(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+        start_id: Optional[int] = None,
+        end_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare stats rows against the raw tables.
+
+        Returns one dict per affiliate whose row disagrees, with the
+        expected (raw) and actual (stored) values.
+        """
+        user_ids = list(user_ids) if user_ids is not None else None
+        expected = await self.compute_stats(db, user_ids, start_id, end_id)
+
+        query = select(AffiliateStats)
+        if user_ids is not None:
+            query = query.where(AffiliateStats.affiliate_user_id.in_(user_ids))
+        if start_id is not None:
+            query = query.where(AffiliateStats.affiliate_user_id >= start_id)
+        if end_id is not None:
+            query = query.where(AffiliateStats.affiliate_user_id < end_id)
+        rows = {
+            row.affiliate_user_id: row
+            for row in (await db.execute(query.execution_options(populate_existing=True))).scalars().all()
+        }
+
+        mismatches = []
+        for user_id in sorted(set(expected) | set(rows)):
+            want = expected.get(user_id) or self._derive({})
+            have = self._snapshot(rows.get(user_id))
+            if have != want:
+                mismatches.append({"user_id": user_id, "expected": want, "actual": have})
+        return mismatches
+
+    async def resync_stats(self, db: AsyncSession, user_id: int) -> Dict[str, Any]:
+        """
+        Overwrite one affiliate's stats row with values from the raw tables.
+
+        The row is locked before recomputing, so an event that already applied
+        its delta is waited for and counted, and one that has not yet applied
+        it adds its delta on top of the repaired row.
+        """
+        await db.execute(
+            select(AffiliateStats.id)
+            .where(AffiliateStats.affiliate_user_id == user_id)
+            .with_for_update()
+        )
+        values = (await self.compute_stats(db, [user_id])).get(user_id) or self._derive({})
+
+        stmt = pg_insert(AffiliateStats).values(affiliate_user_id=user_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AffiliateStats.affiliate_user_id],
+            set_={
+                **{field: getattr(stmt.excluded, field) for field in STATS_FIELDS},
+                "last_calculated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+        return values
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _derive(values: Dict[str, Any]) -> Dict[str, Any]:
+        """Full stats (or delta) row: totals and available balance from components"""
+        row = {field: values.get(field, 0) for field in COUNT_FIELDS}
+        row.update({field: Decimal(values.get(field, ZERO)) for field in AMOUNT_FIELDS})
+        row["total_referrals"] = sum(row[f"total_referrals_level{level}"] for level in REFERRAL_LEVELS)
+        row["active_referrals"] = sum(row[f"active_referrals_level{level}"] for level in REFERRAL_LEVELS)
+        # Available balance = approved - paid - open payouts
+        row["available_balance"] = (
+            row["approved_commission"]
+            - row["paid_commission"]
+            - Decimal(values.get("pending_payouts", ZERO))
+        )
+        return row
+
+    @staticmethod
+    def _snapshot(row: Optional[AffiliateStats]) -> Dict[str, Any]:
+        if row is None:
+            return AffiliateStatsService._derive({})
+        snapshot = {field: getattr(row, field) or 0 for field in COUNT_FIELDS}
+        snapshot.update({field: Decimal(getattr(row, field) or ZERO) for field in AMOUNT_FIELDS})
+        return snapshot
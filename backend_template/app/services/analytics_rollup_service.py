@@ -0,0 +1,290 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Date, cast, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import Commission, Payout, Referral
+from app.models.analytics import AffiliateDailyRollup, DailyRollup, RollupWatermark
+from app.models.referrals import ReferralLedgerEntry
+
+
+ZERO = Decimal("0.00")
+
+COUNT_MEASURES = ("referrals", "direct_referrals", "commissions", "payout_requests")
+AMOUNT_MEASURES = ("commission_amount", "payout_amount", "referral_earnings", "referral_withdrawn")
+ROLLUP_MEASURES = COUNT_MEASURES + AMOUNT_MEASURES
+
+GRANULARITIES = ("day", "week", "month")
+
+# Global measures taken from a different per-affiliate measure: a signup adds
+# a Referral row for each of up to three upline levels, so platform-wide
+# signups are the level-1 rows only
+GLOBAL_MEASURE_SOURCES = {"referrals": "direct_referrals"}
+
+# Source tables folded into the rollups, in processing order
+ROLLUP_SOURCES = ("referrals", "commissions", "payouts", "referral_ledger")
+
+# Ledger rows that only seed a balance, not activity of their day
+NON_ACTIVITY_LEDGER_TYPES = ("opening_balance",)
+
+
+def utc_day(column):
+    """Calendar day (UTC) of a timestamptz column"""
+    return cast(func.timezone("UTC", column), Date)
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+class AnalyticsRollupService:
+    """
+    Daily rollups of referral / affiliate activity, per affiliate and global:
+    - Each source table (referrals, commissions, payouts, referral_ledger)
+      has a watermark; run() folds rows past it into the rollups as additive
+      upserts, one id batch per transaction, watermark moved in the same one
+    - Rows younger than ANALYTICS_ROLLUP_SETTLE_SECONDS are left for the next
+      run so transactions still in flight are not skipped over
+    - rebuild() recomputes a day range from the raw tables (up to the
+      watermarks) to repair anything that slipped past
+    - Time series are read from the rollups and bucketed per day / week /
+      month, O(days) rows per chart
+    Amounts are counted when rows are created (commission earned, payout
+    requested); the referral ledger makes earnings net of reversals.
+    """
+
+    async def run(self, db: AsyncSession, batch_size: Optional[int] = None) -> Dict[str, int]:
+        """Fold every settled row past the watermarks into the rollups; rows processed per source"""
+        batch_size = batch_size or settings.ANALYTICS_ROLLUP_BATCH_SIZE
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.ANALYTICS_ROLLUP_SETTLE_SECONDS)
+        processed = {}
+
+        for source in ROLLUP_SOURCES:
+            processed[source] = 0
+            while True:
+                last_id = await self._lock_watermark(db, source)
+                model, created_column = self._source_columns(source)
+                batch = (
+                    select(model.id)
+                    .where(model.id > last_id, created_column <= cutoff)
+                    .order_by(model.id)
+                    .limit(batch_size)
+                    .subquery()
+                )
+                result = await db.execute(select(func.max(batch.c.id), func.count()).select_from(batch))
+                upto_id, count = result.one()
+                if not upto_id:
+                    await db.rollback()
+                    break
+
+                rows = await self._aggregate(db, source, model.id > last_id, model.id <= upto_id)
+                await self._add(db, rows)
+                await db.execute(
+                    update(RollupWatermark)
+                    .where(RollupWatermark.source == source)
+                    .values(last_id=upto_id)
+                )
+                await db.commit()
+                processed[source] += count
+                if count < batch_size:
+                    break
+
+        return processed
+
+    async def rebuild(self, db: AsyncSession, start: date, end: date) -> int:
+        """
+        Recompute the rollups of days start..end (inclusive) from the raw
+        tables, counting only rows up to each source's watermark so the next
+        run() does not add them twice. Returns the number of rollup rows written.
+        """
+        # Watermarks stay locked until commit, so run() cannot fold rows meanwhile
+        watermarks = {source: await self._lock_watermark(db, source) for source in ROLLUP_SOURCES}
+
+        await db.execute(
+            delete(AffiliateDailyRollup).where(AffiliateDailyRollup.day >= start, AffiliateDailyRollup.day <= end)
+        )
+        await db.execute(delete(DailyRollup).where(DailyRollup.day >= start, DailyRollup.day <= end))
+
+        written = 0
+        for source, last_id in watermarks.items():
+            model, created_column = self._source_columns(source)
+            rows = await self._aggregate(
+                db, source,
+                model.id <= last_id,
+                created_column >= datetime.combine(start, datetime.min.time(), timezone.utc),
+                created_column < datetime.combine(end + timedelta(days=1), datetime.min.time(), timezone.utc),
+            )
+            await self._add(db, rows)
+            written += len(rows)
+
+        await db.commit()
+        return written
+
+    async def get_timeseries(
+        self,
+        db: AsyncSession,
+        start: date,
+        end: date,
+        granularity: str = "day",
+        affiliate_user_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Per-period totals between start and end (inclusive); empty periods are zero"""
+        if granularity not in GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if end < start:
+            raise HTTPException(status_code=400, detail="end must not be before start")
+        if (end - start).days + 1 > settings.ANALYTICS_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Date range is limited to {settings.ANALYTICS_MAX_RANGE_DAYS} days"
+            )
+
+        table = DailyRollup if affiliate_user_id is None else AffiliateDailyRollup
+        query = (
+            select(table.day, *[getattr(table, measure) for measure in ROLLUP_MEASURES])
+            .where(table.day >= start, table.day <= end)
+        )
+        if affiliate_user_id is not None:
+            query = query.where(AffiliateDailyRollup.affiliate_user_id == affiliate_user_id)
+
+        buckets: Dict[date, Dict[str, Any]] = {}
+        day = start
+        while day <= end:
+            buckets.setdefault(period_start(day, granularity), self._empty())
+            day += timedelta(days=1)
+
+        for row in (await db.execute(query)).all():
+            bucket = buckets[period_start(row.day, granularity)]
+            for measure in ROLLUP_MEASURES:
+                bucket[measure] += getattr(row, measure) or 0
+
+        return [{"period_start": key, **values} for key, values in sorted(buckets.items())]
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            **{measure: 0 for measure in COUNT_MEASURES},
+            **{measure: ZERO for measure in AMOUNT_MEASURES},
+        }
+
+    @staticmethod
+    def _source_columns(source: str):
+        return {
+            "referrals": (Referral, Referral.created_at),
+            "commissions": (Commission, Commission.created_at),
+            "payouts": (Payout, Payout.requested_at),
+            "referral_ledger": (ReferralLedgerEntry, ReferralLedgerEntry.created_at),
+        }[source]
+
+    async def _lock_watermark(self, db: AsyncSession, source: str) -> int:
+        """Current watermark, row-locked so two rollup jobs cannot fold the same rows"""
+        await db.execute(
+            pg_insert(RollupWatermark)
+            .values(source=source, last_id=0)
+            .on_conflict_do_nothing(index_elements=[RollupWatermark.source])
+        )
+        result = await db.execute(
+            select(RollupWatermark.last_id).where(RollupWatermark.source == source).with_for_update()
+        )
+        return result.scalar_one()
+
+    async def _aggregate(self, db: AsyncSession, source: str, *conditions) -> List[Dict[str, Any]]:
+        """Per (user, day) measures of one source's rows matching conditions"""
+        if source == "referrals":
+            day = utc_day(Referral.created_at)
+            query = select(
+                Referral.referrer_id.label("user_id"),
+                day.label("day"),
+                func.count().label("referrals"),
+                func.count().filter(Referral.level == 1).label("direct_referrals"),
+            ).group_by(Referral.referrer_id, day)
+        elif source == "commissions":
+            day = utc_day(Commission.created_at)
+            query = select(
+                Commission.affiliate_user_id.label("user_id"),
+                day.label("day"),
+                func.count().label("commissions"),
+                func.coalesce(func.sum(Commission.commission_amount), 0).label("commission_amount"),
+            ).group_by(Commission.affiliate_user_id, day)
+        elif source == "payouts":
+            day = utc_day(Payout.requested_at)
+            query = select(
+                Payout.affiliate_user_id.label("user_id"),
+                day.label("day"),
+                func.count().label("payout_requests"),
+                func.coalesce(func.sum(Payout.amount), 0).label("payout_amount"),
+            ).group_by(Payout.affiliate_user_id, day)
+        else:
+            day = utc_day(ReferralLedgerEntry.created_at)
+            query = (
+                select(
+                    ReferralLedgerEntry.user_id.label("user_id"),
+                    day.label("day"),
+                    func.coalesce(func.sum(ReferralLedgerEntry.earnings_delta), 0).label("referral_earnings"),
+                    func.coalesce(func.sum(ReferralLedgerEntry.withdrawn_delta), 0).label("referral_withdrawn"),
+                )
+                .where(ReferralLedgerEntry.entry_type.not_in(NON_ACTIVITY_LEDGER_TYPES))
+                .group_by(ReferralLedgerEntry.user_id, day)
+            )
+
+        result = await db.execute(query.where(*conditions))
+        return [dict(row._mapping) for row in result.all()]
+
+    async def _add(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+        """Add per (user, day) measures to the affiliate and global rollups"""
+        if not rows:
+            return
+
+        per_user: Dict[Tuple[int, date], Dict[str, Any]] = {}
+        per_day: Dict[date, Dict[str, Any]] = {}
+        for row in rows:
+            user_bucket = per_user.setdefault((row["user_id"], row["day"]), self._empty())
+            day_bucket = per_day.setdefault(row["day"], self._empty())
+            for measure in ROLLUP_MEASURES:
+                if measure in row:
+                    user_bucket[measure] += row[measure]
+                global_measure = GLOBAL_MEASURE_SOURCES.get(measure, measure)
+                if global_measure in row:
+                    day_bucket[measure] += row[global_measure]
+
+        # Sorted keys: concurrent writers lock rollup rows in the same order
+        stmt = pg_insert(AffiliateDailyRollup).values([
+            {"affiliate_user_id": user_id, "day": day, **values}
+            for (user_id, day), values in sorted(per_user.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AffiliateDailyRollup.affiliate_user_id, AffiliateDailyRollup.day],
+            set_={
+                **{
+                    measure: getattr(AffiliateDailyRollup, measure) + getattr(stmt.excluded, measure)
+                    for measure in ROLLUP_MEASURES
+                },
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+
+        stmt = pg_insert(DailyRollup).values([
+            {"day": day, **values} for day, values in sorted(per_day.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[DailyRollup.day],
+            set_={
+                **{measure: getattr(DailyRollup, measure) + getattr(stmt.excluded, measure) for measure in ROLLUP_MEASURES},
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
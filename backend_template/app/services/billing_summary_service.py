@@ -0,0 +1,205 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.billing import BillingSummary
+from app.models.invoice import Invoice
+from app.models.server import Server
+
+
+ZERO = Decimal("0.00")
+
+# Invoices counted in the outstanding balance (same as the old per-request sums)
+OUTSTANDING_PAYMENT_STATUSES = ("pending", "overdue")
+
+SUMMARY_FIELDS = (
+    "outstanding_balance",
+    "pending_invoices",
+    "active_servers",
+    "monthly_cost",
+    "last_payment_at",
+    "last_payment_amount",
+)
+
+
+class BillingSummaryService:
+    """
+    Upkeep of billing_summaries, one row of billing figures per user:
+    - Every invoice / server change calls refresh() for the affected users in
+      its own transaction; the row is locked first, then recomputed from that
+      user's invoices and servers (idx_invoice_user_payment_status,
+      idx_server_user_status), so concurrent changes for one user serialize
+      and the last one sees them all
+    - The balance endpoints and customer dashboard read the row with one
+      primary-key lookup (get_summary); a missing row is built on first read
+    - verify_summaries / refresh repair drift from writes that bypass the
+      services (scripts/verify_billing_summaries.py)
+    Nothing is committed by refresh(); callers commit with their own changes.
+    """
+
+    async def get_summary(self, db: AsyncSession, user_id: int) -> BillingSummary:
+        summary = await db.get(BillingSummary, user_id)
+        if summary is None:
+            await self.refresh(db, [user_id])
+            await db.commit()
+            summary = await db.get(BillingSummary, user_id, populate_existing=True)
+        return summary
+
+    async def refresh(self, db: AsyncSession, user_ids: Iterable[int]) -> None:
+        """Recompute the summary rows of user_ids from invoices and servers"""
+        user_ids = sorted({user_id for user_id in user_ids if user_id})
+        if not user_ids:
+            return
+
+        # Sessions run with autoflush=False; push the caller's pending invoice
+        # and server changes so the recompute below reads them
+        await db.flush()
+
+        # Rows must exist to be locked; locked in user_id order so concurrent
+        # refreshes of overlapping users cannot deadlock
+        await db.execute(
+            pg_insert(BillingSummary)
+            .values([{"user_id": user_id} for user_id in user_ids])
+            .on_conflict_do_nothing(index_elements=[BillingSummary.user_id])
+        )
+        await db.execute(
+            select(BillingSummary.user_id)
+            .where(BillingSummary.user_id.in_(user_ids))
+            .order_by(BillingSummary.user_id)
+            .with_for_update()
+        )
+
+        summaries = await self.compute_summaries(db, user_ids)
+        rows = [{"user_id": user_id, **summaries.get(user_id, self._empty())} for user_id in user_ids]
+        stmt = pg_insert(BillingSummary).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BillingSummary.user_id],
+            set_={
+                **{field: getattr(stmt.excluded, field) for field in SUMMARY_FIELDS},
+                "updated_at": func.now(),
+            },
+        )
+        await db.execute(stmt)
+
+    # ---------------------
+    # Consistency checks
+    # ---------------------
+
+    async def compute_summaries(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+        start_id: Optional[int] = None,
+        end_id: Optional[int] = None
+    ) -> Dict[int, Dict[str, Any]]:
+        """Summaries recomputed from invoices and servers (grouped queries)"""
+        user_ids = list(user_ids) if user_ids is not None else None
+
+        def scoped(query, column):
+            if user_ids is not None:
+                query = query.where(column.in_(user_ids))
+            if start_id is not None:
+                query = query.where(column >= start_id)
+            if end_id is not None:
+                query = query.where(column < end_id)
+            return query
+
+        summaries: Dict[int, Dict[str, Any]] = {}
+
+        def bucket(user_id: int) -> Dict[str, Any]:
+            return summaries.setdefault(user_id, self._empty())
+
+        outstanding_query = scoped(
+            select(Invoice.user_id, func.coalesce(func.sum(Invoice.balance_due), 0), func.count(Invoice.id))
+            .where(Invoice.payment_status.in_(OUTSTANDING_PAYMENT_STATUSES))
+            .group_by(Invoice.user_id),
+            Invoice.user_id,
+        )
+        for user_id, balance, count in (await db.execute(outstanding_query)).all():
+            bucket(user_id).update({"outstanding_balance": Decimal(balance), "pending_invoices": count})
+
+        servers_query = scoped(
+            select(Server.user_id, func.count(Server.id), func.coalesce(func.sum(Server.monthly_cost), 0))
+            .where(Server.server_status == "active")
+            .group_by(Server.user_id),
+            Server.user_id,
+        )
+        for user_id, count, monthly_cost in (await db.execute(servers_query)).all():
+            bucket(user_id).update({"active_servers": count, "monthly_cost": Decimal(monthly_cost)})
+
+        ranked = scoped(
+            select(
+                Invoice.user_id,
+                Invoice.payment_date,
+                Invoice.amount_paid,
+                func.row_number().over(
+                    partition_by=Invoice.user_id,
+                    order_by=(Invoice.payment_date.desc(), Invoice.id.desc()),
+                ).label("rank"),
+            ).where(Invoice.payment_status == "paid", Invoice.payment_date.is_not(None)),
+            Invoice.user_id,
+        ).subquery()
+        last_payments = select(ranked.c.user_id, ranked.c.payment_date, ranked.c.amount_paid).where(ranked.c.rank == 1)
+        for user_id, paid_at, amount in (await db.execute(last_payments)).all():
+            bucket(user_id).update({"last_payment_at": paid_at, "last_payment_amount": amount})
+
+        return summaries
+
+    async def verify_summaries(
+        self,
+        db: AsyncSession,
+        user_ids: Optional[Iterable[int]] = None,
+        start_id: Optional[int] = None,
+        end_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare summary rows against invoices and servers.
+
+        Returns one dict per user whose row disagrees (or is missing while
+        the user has billing activity), with expected and actual values.
+        """
+        user_ids = list(user_ids) if user_ids is not None else None
+        expected = await self.compute_summaries(db, user_ids, start_id, end_id)
+
+        query = select(BillingSummary)
+        if user_ids is not None:
+            query = query.where(BillingSummary.user_id.in_(user_ids))
+        if start_id is not None:
+            query = query.where(BillingSummary.user_id >= start_id)
+        if end_id is not None:
+            query = query.where(BillingSummary.user_id < end_id)
+        rows = {
+            row.user_id: row
+            for row in (await db.execute(query.execution_options(populate_existing=True))).scalars().all()
+        }
+
+        mismatches = []
+        for user_id in sorted(set(expected) | set(rows)):
+            want = expected.get(user_id) or self._empty()
+            have = self._snapshot(rows.get(user_id))
+            if have != want:
+                mismatches.append({"user_id": user_id, "expected": want, "actual": have})
+        return mismatches
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            "outstanding_balance": ZERO,
+            "pending_invoices": 0,
+            "active_servers": 0,
+            "monthly_cost": ZERO,
+            "last_payment_at": None,
+            "last_payment_amount": None,
+        }
+
+    def _snapshot(self, row: Optional[BillingSummary]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        return {field: getattr(row, field) for field in SUMMARY_FIELDS}
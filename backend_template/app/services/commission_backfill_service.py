@@ -0,0 +1,309 @@
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.payment import ActivationType, PaymentStatus, PaymentTransaction, PaymentType
+from app.models.referrals import ReferralEarning
+from app.models.users import UserProfile
+from app.services.commission_service import CommissionService
+from app.services.referral_ledger_service import ReferralLedgerService
+
+
+PAID_STATUSES = (PaymentStatus.PAID, PaymentStatus.PARTIALLY_REFUNDED)
+
+# Refunded payments are replayed too: their canonical earnings are none
+REPLAY_STATUSES = PAID_STATUSES + (PaymentStatus.REFUNDED,)
+
+# Differences kept per chunk for the dry-run report
+SAMPLE_LIMIT = 20
+
+BACKFILL_REASON = "commission backfill"
+
+
+class CommissionBackfillService:
+    """
+    Replays paid payment_transactions through the canonical commission rule
+    and repairs referral_earnings to match:
+    - Canonical rule = CommissionService: buyer's L1-L3 chain, rates active
+      at paid_at, commission on the eligible (post-refund) amount, one set
+      of earnings per order (owned by its first paid transaction)
+    - Stored earnings of the order are diffed per level; missing ones are
+      inserted, wrong / duplicate / unexpected ones reversed, both in bulk
+      and through the ledger
+    - Paid earnings are never touched; a conflicting paid row is reported
+      and its level left alone
+    Work is split by payment_transactions.id range so chunks can run in
+    parallel (scripts/backfill_commissions.py).
+    """
+
+    def __init__(self):
+        self.commission_service = CommissionService()
+        self.ledger = ReferralLedgerService()
+
+    async def get_id_bounds(self, db: AsyncSession) -> Tuple[int, int]:
+        """Lowest and highest id among transactions the backfill replays"""
+        result = await db.execute(
+            select(func.min(PaymentTransaction.id), func.max(PaymentTransaction.id))
+            .where(PaymentTransaction.payment_status.in_(REPLAY_STATUSES))
+        )
+        low, high = result.one()
+        return low or 0, high or 0
+
+    async def reconcile_range(
+        self,
+        db: AsyncSession,
+        start_id: int,
+        end_id: int,
+        apply: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Diff (and with apply=True, correct) the earnings of every order whose
+        owning transaction id falls in [start_id, end_id).
+
+        Returns a report with counts, amounts and a sample of differences.
+        """
+        started = time.perf_counter()
+        report = {
+            "start_id": start_id,
+            "end_id": end_id,
+            "orders": 0,
+            "expected": 0,
+            "matched": 0,
+            "missing": 0,
+            "reversed": 0,
+            "paid_conflicts": 0,
+            "amount_added": Decimal("0.00"),
+            "amount_reversed": Decimal("0.00"),
+            "applied": apply,
+            "samples": [],
+            "seconds": 0.0,
+        }
+
+        result = await db.execute(
+            select(PaymentTransaction.order_id)
+            .where(
+                PaymentTransaction.id >= start_id,
+                PaymentTransaction.id < end_id,
+                PaymentTransaction.order_id.is_not(None),
+                PaymentTransaction.payment_status.in_(REPLAY_STATUSES),
+            )
+            .distinct()
+        )
+        order_ids = [order_id for (order_id,) in result.all()]
+        if not order_ids:
+            report["seconds"] = time.perf_counter() - started
+            return report
+
+        # Every replayable transaction of these orders, wherever its id falls
+        result = await db.execute(
+            select(PaymentTransaction)
+            .where(
+                PaymentTransaction.order_id.in_(order_ids),
+                PaymentTransaction.payment_status.in_(REPLAY_STATUSES),
+            )
+            .order_by(PaymentTransaction.id)
+        )
+        owners: Dict[int, PaymentTransaction] = {}
+        for tx in result.scalars().all():
+            current = owners.get(tx.order_id)
+            if current is None or (current.payment_status not in PAID_STATUSES and tx.payment_status in PAID_STATUSES):
+                owners[tx.order_id] = tx
+        owners = {
+            order_id: tx for order_id, tx in owners.items() if start_id <= tx.id < end_id
+        }
+        # Not distributed yet: the commission worker owns these
+        owners = {
+            order_id: tx for order_id, tx in owners.items()
+            if tx.commission_distributed or tx.payment_status not in PAID_STATUSES
+        }
+        report["orders"] = len(owners)
+        if not owners:
+            report["seconds"] = time.perf_counter() - started
+            return report
+
+        expected = await self._expected_earnings(db, list(owners.values()))
+
+        result = await db.execute(
+            select(
+                ReferralEarning.id,
+                ReferralEarning.order_id,
+                ReferralEarning.level,
+                ReferralEarning.user_id,
+                ReferralEarning.referred_user_id,
+                ReferralEarning.commission_amount,
+                ReferralEarning.status,
+            )
+            .where(
+                ReferralEarning.order_id.in_(list(owners)),
+                ReferralEarning.status != "reversed",
+            )
+            .order_by(ReferralEarning.id)
+        )
+        stored: Dict[Tuple[int, int], List[Any]] = {}
+        for row in result.all():
+            stored.setdefault((row.order_id, row.level), []).append(row)
+
+        to_insert: List[Dict[str, Any]] = []
+        to_reverse: List[int] = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key)
+            rows = stored.get(key, [])
+            if want:
+                report["expected"] += 1
+
+            keep = None
+            if want:
+                keep = next(
+                    (
+                        row for row in rows
+                        if row.user_id == want["user_id"]
+                        and row.referred_user_id == want["referred_user_id"]
+                        and Decimal(row.commission_amount) == want["commission_amount"]
+                    ),
+                    None,
+                )
+            surplus = [row for row in rows if row is not keep]
+
+            if any(row.status == "paid" for row in surplus):
+                report["paid_conflicts"] += 1
+                self._sample(report, "paid_conflict", key, want, rows)
+                continue
+
+            if keep is not None:
+                report["matched"] += 1
+            elif want:
+                report["missing"] += 1
+                report["amount_added"] += want["commission_amount"]
+                to_insert.append(want)
+                self._sample(report, "missing", key, want, rows)
+            if surplus:
+                report["reversed"] += len(surplus)
+                report["amount_reversed"] += sum((Decimal(row.commission_amount) for row in surplus), Decimal("0.00"))
+                to_reverse += [row.id for row in surplus]
+                if keep is not None or not want:
+                    self._sample(report, "unexpected", key, want, surplus)
+
+        if apply and (to_insert or to_reverse):
+            await self._apply(db, to_insert, to_reverse)
+
+        report["seconds"] = time.perf_counter() - started
+        return report
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _expected_earnings(
+        self, db: AsyncSession, transactions: List[PaymentTransaction]
+    ) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        """Canonical earnings keyed by (order_id, level)"""
+        buyer_ids = {tx.user_id for tx in transactions}
+        result = await db.execute(
+            select(
+                UserProfile.id,
+                UserProfile.referred_by,
+                UserProfile.referral_level_1,
+                UserProfile.referral_level_2,
+                UserProfile.referral_level_3,
+            ).where(UserProfile.id.in_(buyer_ids))
+        )
+        chains = {
+            user_id: {1: level_1 or referred_by, 2: level_2, 3: level_3}
+            for user_id, referred_by, level_1, level_2, level_3 in result.all()
+        }
+
+        rates_cache: Dict[Tuple[PaymentType, Any], Dict[int, Decimal]] = {}
+        expected = {}
+        for tx in transactions:
+            enable_commission = tx.payment_metadata and tx.payment_metadata.get('enable_commission', False)
+            chain = chains.get(tx.user_id)
+            if (
+                tx.payment_status not in PAID_STATUSES
+                or tx.activation_type != ActivationType.REFERRAL
+                or not enable_commission
+                or not chain
+                or not chain[1]
+            ):
+                continue
+
+            paid_at = tx.paid_at or tx.created_at
+            rates_key = (tx.payment_type, paid_at)
+            if rates_key not in rates_cache:
+                rates_cache[rates_key] = await self.commission_service._get_commission_rates(
+                    db, tx.payment_type, paid_at
+                )
+            rates = rates_cache[rates_key]
+
+            eligible_amount = Decimal(str(tx.get_commission_eligible_amount()))
+            for level, referrer_id in chain.items():
+                rate = rates.get(level, Decimal('0.00'))
+                if not referrer_id or rate <= 0:
+                    continue
+                expected[(tx.order_id, level)] = {
+                    "user_id": referrer_id,
+                    "referred_user_id": tx.user_id,
+                    "order_id": tx.order_id,
+                    "level": level,
+                    "commission_rate": rate,
+                    "order_amount": eligible_amount,
+                    "commission_amount": (eligible_amount * rate / Decimal('100')).quantize(Decimal('0.01')),
+                    "status": 'approved',
+                    "earned_at": paid_at,
+                }
+        return expected
+
+    async def _apply(self, db: AsyncSession, to_insert: List[Dict[str, Any]], to_reverse: List[int]) -> None:
+        """Write one chunk's corrections in a single transaction"""
+        if to_reverse:
+            result = await db.execute(
+                update(ReferralEarning)
+                .where(ReferralEarning.id.in_(to_reverse), ReferralEarning.status.not_in(("reversed", "paid")))
+                .values(status="reversed")
+                .returning(ReferralEarning.id, ReferralEarning.user_id, ReferralEarning.commission_amount)
+                .execution_options(synchronize_session=False)
+            )
+            await self.ledger.record_reversals_bulk(
+                db,
+                [(earning_id, user_id, Decimal(amount)) for earning_id, user_id, amount in result.all()],
+                reason=BACKFILL_REASON,
+            )
+
+        if to_insert:
+            result = await db.execute(
+                insert(ReferralEarning).returning(
+                    ReferralEarning.id, ReferralEarning.user_id, ReferralEarning.commission_amount
+                ),
+                to_insert,
+            )
+            await self.ledger.record_earnings_bulk(
+                db, [(earning_id, user_id, Decimal(amount)) for earning_id, user_id, amount in result.all()]
+            )
+
+        await db.commit()
+
+    @staticmethod
+    def _sample(report: Dict[str, Any], kind: str, key: Tuple[int, int], want, rows) -> None:
+        if len(report["samples"]) >= SAMPLE_LIMIT:
+            return
+        order_id, level = key
+        report["samples"].append({
+            "kind": kind,
+            "order_id": order_id,
+            "level": level,
+            "expected": None if not want else {
+                "user_id": want["user_id"],
+                "commission_amount": str(want["commission_amount"]),
+            },
+            "stored": [
+                {
+                    "earning_id": row.id,
+                    "user_id": row.user_id,
+                    "commission_amount": str(row.commission_amount),
+                    "status": row.status,
+                }
+                for row in rows
+            ],
+        })
@@ -0,0 +1,212 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import CommissionRule
+from app.models.cache_version import CacheVersion
+from app.models.payment import PaymentType, ReferralCommissionRate
+
+
+CACHE_NAME = "commission_rules"
+
+# Bucket for commission rules that apply to every product type
+ALL_PRODUCTS = "all"
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _in_window(at: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    return (start is None or start <= at) and (end is None or at <= end)
+
+
+@dataclass(frozen=True)
+class CachedRate:
+    level: int
+    commission_percent: Decimal
+    active_from: Optional[datetime]
+    active_until: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class CachedRule:
+    """Detached copy of a CommissionRule row (safe to share across sessions)"""
+    id: int
+    level: int
+    product_type: str
+    commission_type: str
+    commission_value: Decimal
+    min_purchase_amount: Optional[Decimal]
+    max_purchase_amount: Optional[Decimal]
+    priority: int
+    valid_from: Optional[datetime]
+    valid_until: Optional[datetime]
+
+    def matches(self, amount: Decimal, at: datetime) -> bool:
+        return (
+            (self.min_purchase_amount is None or self.min_purchase_amount <= amount)
+            and (self.max_purchase_amount is None or amount <= self.max_purchase_amount)
+            and _in_window(at, self.valid_from, self.valid_until)
+        )
+
+
+class CommissionRuleCache:
+    """
+    Per-process index of active referral_commission_rates and commission_rules:
+    - Rates keyed by payment type and level, rules keyed by level and product
+      type (pre-merged with the 'all' bucket, highest priority first)
+    - Active windows (active_from/active_until, valid_from/valid_until) and
+      amount bands are checked in memory against the compiled entries
+    - Rebuilt when the cache_versions counter moves; workers check the
+      counter at most every COMMISSION_RULES_VERSION_CHECK_SECONDS
+    """
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._rates: Dict[PaymentType, Dict[int, List[CachedRate]]] = {}
+        self._rules: Dict[Tuple[int, str], List[CachedRule]] = {}
+
+    async def get_rates(
+        self, db: AsyncSession, payment_type: PaymentType, at: Optional[datetime] = None
+    ) -> Dict[int, Decimal]:
+        """Active commission percent per level for a payment type ({} if none configured)"""
+        await self._ensure_fresh(db)
+        at = at or datetime.now(timezone.utc)
+
+        rates = {}
+        for level, candidates in self._rates.get(payment_type, {}).items():
+            for rate in candidates:
+                if _in_window(at, rate.active_from, rate.active_until):
+                    rates[level] = rate.commission_percent
+                    break
+        return rates
+
+    async def get_rule(
+        self,
+        db: AsyncSession,
+        level: int,
+        product_type: Optional[str],
+        order_amount: Decimal,
+        at: Optional[datetime] = None,
+    ) -> Optional[CachedRule]:
+        """Highest-priority active rule for a level, product type and order amount"""
+        await self._ensure_fresh(db)
+        at = at or datetime.now(timezone.utc)
+
+        candidates = self._rules.get((level, product_type or ALL_PRODUCTS))
+        if candidates is None:
+            candidates = self._rules.get((level, ALL_PRODUCTS), [])
+        for rule in candidates:
+            if rule.matches(order_amount, at):
+                return rule
+        return None
+
+    async def invalidate(self, db: AsyncSession) -> int:
+        """
+        Bump the shared version counter (in the caller's transaction) and
+        drop this worker's copy. Call after any change to rates or rules.
+        """
+        stmt = pg_insert(CacheVersion).values(name=CACHE_NAME, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={"version": CacheVersion.version + 1},
+        ).returning(CacheVersion.version)
+        version = (await db.execute(stmt)).scalar_one()
+
+        self._version = None
+        self._checked_at = 0.0
+        return version
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _ensure_fresh(self, db: AsyncSession) -> None:
+        if (
+            self._version is not None
+            and time.monotonic() - self._checked_at < settings.COMMISSION_RULES_VERSION_CHECK_SECONDS
+        ):
+            return
+
+        async with self._lock:
+            if (
+                self._version is not None
+                and time.monotonic() - self._checked_at < settings.COMMISSION_RULES_VERSION_CHECK_SECONDS
+            ):
+                return
+
+            result = await db.execute(
+                select(CacheVersion.version).where(CacheVersion.name == CACHE_NAME)
+            )
+            version = result.scalar_one_or_none() or 0
+            if version != self._version:
+                await self._load(db)
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    async def _load(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(ReferralCommissionRate).where(ReferralCommissionRate.is_active == True)
+        )
+        rates: Dict[PaymentType, Dict[int, List[CachedRate]]] = {}
+        for row in result.scalars().all():
+            rates.setdefault(row.payment_type, {}).setdefault(row.level, []).append(
+                CachedRate(
+                    level=row.level,
+                    commission_percent=Decimal(row.commission_percent),
+                    active_from=_utc(row.active_from),
+                    active_until=_utc(row.active_until),
+                )
+            )
+        # Most recently started rate wins when windows overlap
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        for levels in rates.values():
+            for candidates in levels.values():
+                candidates.sort(key=lambda r: r.active_from or oldest, reverse=True)
+
+        result = await db.execute(
+            select(CommissionRule).where(CommissionRule.is_active == True)
+        )
+        by_bucket: Dict[Tuple[int, str], List[CachedRule]] = {}
+        for row in result.scalars().all():
+            rule = CachedRule(
+                id=row.id,
+                level=row.level,
+                product_type=row.product_type or ALL_PRODUCTS,
+                commission_type=row.commission_type,
+                commission_value=Decimal(row.commission_value),
+                min_purchase_amount=row.min_purchase_amount,
+                max_purchase_amount=row.max_purchase_amount,
+                priority=row.priority or 0,
+                valid_from=_utc(row.valid_from),
+                valid_until=_utc(row.valid_until),
+            )
+            by_bucket.setdefault((rule.level, rule.product_type), []).append(rule)
+
+        # Each product bucket also carries the 'all' rules, highest priority first
+        rules: Dict[Tuple[int, str], List[CachedRule]] = {}
+        for (level, product_type), bucket in by_bucket.items():
+            merged = list(bucket)
+            if product_type != ALL_PRODUCTS:
+                merged += by_bucket.get((level, ALL_PRODUCTS), [])
+            rules[(level, product_type)] = sorted(merged, key=lambda r: (-r.priority, r.id))
+
+        self._rates = rates
+        self._rules = rules
+
+
+# Shared by every request handled by this worker process
+commission_rule_cache = CommissionRuleCache()
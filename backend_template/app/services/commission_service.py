@@ -1,14 +1,20 @@
+import time
 from decimal import Decimal
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, func, update, insert, bindparam
 from fastapi import HTTPException
 
-from app.models.payment import PaymentTransaction, ReferralCommissionRate, PaymentType
+from app.core.config import settings
+from app.models.payment import (
+    PaymentTransaction, ReferralCommissionRate, PaymentType, PaymentStatus, ActivationType
+)
 from app.models.referrals import ReferralEarning
 from app.models.users import UserProfile
 from app.models.order import Order
+from app.services.referral_ledger_service import ReferralLedgerService
+from app.services.commission_rule_cache import commission_rule_cache
 
 
 class CommissionService:
@@ -36,11 +42,13 @@ class CommissionService:
         Returns:
             List of created ReferralEarning records
         """
-        # Get payment transaction
+        # Get payment transaction (locked, so the batch worker skips it meanwhile)
         result = await db.execute(
             select(PaymentTransaction).where(
                 PaymentTransaction.id == payment_transaction_id
             )
+            .with_for_update()
+            .execution_options(populate_existing=True)
         )
         payment_transaction = result.scalars().first()
 
@@ -126,6 +134,146 @@ class CommissionService:
 
         return earnings
 
+    async def distribute_pending_batch(
+        self,
+        db: AsyncSession,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Distribute commission for a batch of paid, undistributed transactions
+        
+        Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED (served by
+        idx_payment_commission), so several workers - and the inline
+        distribute_commission path - can run in parallel without ever
+        processing the same transaction twice. All earnings of the batch are
+        computed in memory and written with bulk statements.
+        
+        Returns:
+            Batch metrics (claimed, distributed, skipped, earnings, amount, seconds)
+        """
+        started = time.perf_counter()
+        batch_size = batch_size or settings.COMMISSION_WORKER_BATCH_SIZE
+
+        result = await db.execute(
+            select(PaymentTransaction)
+            .where(
+                PaymentTransaction.commission_distributed == False,
+                PaymentTransaction.payment_status.in_([PaymentStatus.PAID, PaymentStatus.PARTIALLY_REFUNDED]),
+                PaymentTransaction.activation_type == ActivationType.REFERRAL,
+            )
+            .order_by(PaymentTransaction.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        transactions = result.scalars().all()
+
+        metrics = {
+            "claimed": len(transactions),
+            "distributed": 0,
+            "skipped": 0,
+            "earnings_created": 0,
+            "amount_distributed": Decimal("0.00"),
+            "seconds": 0.0,
+        }
+        if not transactions:
+            metrics["seconds"] = time.perf_counter() - started
+            return metrics
+
+        # Buyers' referral chains in one query
+        buyer_ids = {tx.user_id for tx in transactions}
+        result = await db.execute(
+            select(
+                UserProfile.id,
+                UserProfile.referred_by,
+                UserProfile.referral_level_1,
+                UserProfile.referral_level_2,
+                UserProfile.referral_level_3,
+            ).where(UserProfile.id.in_(buyer_ids))
+        )
+        chains = {
+            user_id: {1: level_1 or referred_by, 2: level_2, 3: level_3}
+            for user_id, referred_by, level_1, level_2, level_3 in result.all()
+        }
+
+        # Rates once per payment type in the batch
+        rates_by_type = {
+            payment_type: await self._get_commission_rates(db, payment_type)
+            for payment_type in {tx.payment_type for tx in transactions}
+        }
+
+        now = datetime.utcnow()
+        rows = []
+        level_counts: Dict[int, Dict[int, int]] = {}
+        for tx in transactions:
+            enable_commission = tx.payment_metadata and tx.payment_metadata.get('enable_commission', False)
+            chain = chains.get(tx.user_id)
+            if not enable_commission or not chain or not chain[1] or tx.order_id is None:
+                metrics["skipped"] += 1
+                continue
+
+            eligible_amount = Decimal(str(tx.get_commission_eligible_amount()))
+            rates = rates_by_type[tx.payment_type]
+            for level, referrer_id in chain.items():
+                rate = rates.get(level, Decimal('0.00'))
+                if not referrer_id or rate <= 0:
+                    continue
+                commission_amount = (eligible_amount * rate / Decimal('100')).quantize(Decimal('0.01'))
+                rows.append({
+                    "user_id": referrer_id,
+                    "referred_user_id": tx.user_id,
+                    "order_id": tx.order_id,
+                    "level": level,
+                    "commission_rate": rate,
+                    "order_amount": eligible_amount,
+                    "commission_amount": commission_amount,
+                    "status": 'approved',
+                    "earned_at": now,
+                })
+                counts = level_counts.setdefault(referrer_id, {1: 0, 2: 0, 3: 0})
+                counts[level] += 1
+            metrics["distributed"] += 1
+
+        if rows:
+            result = await db.execute(
+                insert(ReferralEarning).returning(
+                    ReferralEarning.id, ReferralEarning.user_id, ReferralEarning.commission_amount
+                ),
+                rows,
+            )
+            created = result.all()
+            await ReferralLedgerService().record_earnings_bulk(
+                db, [(earning_id, user_id, Decimal(amount)) for earning_id, user_id, amount in created]
+            )
+
+            profiles = UserProfile.__table__
+            await db.execute(
+                update(profiles)
+                .where(profiles.c.id == bindparam("b_user_id"))
+                .values(
+                    l1_referrals=func.coalesce(profiles.c.l1_referrals, 0) + bindparam("b_l1"),
+                    l2_referrals=func.coalesce(profiles.c.l2_referrals, 0) + bindparam("b_l2"),
+                    l3_referrals=func.coalesce(profiles.c.l3_referrals, 0) + bindparam("b_l3"),
+                ),
+                [
+                    {"b_user_id": user_id, "b_l1": counts[1], "b_l2": counts[2], "b_l3": counts[3]}
+                    for user_id, counts in sorted(level_counts.items())
+                ],
+            )
+            metrics["earnings_created"] = len(created)
+            metrics["amount_distributed"] = sum((Decimal(amount) for _, _, amount in created), Decimal("0.00"))
+
+        # Skipped rows are marked too, exactly like the inline path does
+        await db.execute(
+            update(PaymentTransaction)
+            .where(PaymentTransaction.id.in_([tx.id for tx in transactions]))
+            .values(commission_distributed=True, commission_distributed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        metrics["seconds"] = time.perf_counter() - started
+        return metrics
+
     async def _get_referral_chain(
         self,
         db: AsyncSession,
@@ -146,28 +294,17 @@ class CommissionService:
     async def _get_commission_rates(
         self,
         db: AsyncSession,
-        payment_type: PaymentType
+        payment_type: PaymentType,
+        at: Optional[datetime] = None
     ) -> Dict[int, Decimal]:
         """
-        Get active commission rates for a payment type
+        Get commission rates for a payment type active at `at` (default now)
+        (served from the in-memory rule cache, honouring active_from/active_until)
         
         Returns:
             Dict mapping level to commission percentage
         """
-        result = await db.execute(
-            select(ReferralCommissionRate).where(
-                and_(
-                    ReferralCommissionRate.payment_type == payment_type,
-                    ReferralCommissionRate.is_active == True
-                )
-            ).order_by(ReferralCommissionRate.level)
-        )
-        rates = result.scalars().all()
-
-        # Convert to dictionary
-        rate_dict = {}
-        for rate in rates:
-            rate_dict[rate.level] = rate.commission_percent
+        rate_dict = dict(await commission_rule_cache.get_rates(db, payment_type, at))
 
         # Default rates if not configured
         if not rate_dict:
@@ -223,25 +360,56 @@ class CommissionService:
 
         db.add(earning)
 
-        # Update referrer's balance
+        # Update referrer's balance (ledger snapshot, mirrored onto the profile)
+        await ReferralLedgerService().record_earning(db, earning)
+
+        # Update referral statistics
+        level_counter = {
+            1: UserProfile.l1_referrals,
+            2: UserProfile.l2_referrals,
+            3: UserProfile.l3_referrals,
+        }.get(level)
+        if level_counter is not None:
+            await db.execute(
+                update(UserProfile)
+                .where(UserProfile.id == referrer_id)
+                .values({level_counter: func.coalesce(level_counter, 0) + 1})
+            )
+
+        return earning
+
+    async def get_commission_rate_configs(self, db: AsyncSession) -> List[ReferralCommissionRate]:
+        """All configured commission rates (Admin)"""
         result = await db.execute(
-            select(UserProfile).where(UserProfile.id == referrer_id)
+            select(ReferralCommissionRate).order_by(
+                ReferralCommissionRate.payment_type,
+                ReferralCommissionRate.level,
+                ReferralCommissionRate.active_from.desc()
+            )
         )
-        referrer = result.scalars().first()
-
-        if referrer:
-            referrer.total_earnings = (referrer.total_earnings or Decimal('0.00')) + commission_amount
-            referrer.available_balance = (referrer.available_balance or Decimal('0.00')) + commission_amount
-            
-            # Update referral statistics
-            if level == 1:
-                referrer.l1_referrals = (referrer.l1_referrals or 0) + 1
-            elif level == 2:
-                referrer.l2_referrals = (referrer.l2_referrals or 0) + 1
-            elif level == 3:
-                referrer.l3_referrals = (referrer.l3_referrals or 0) + 1
+        return result.scalars().all()
 
-        return earning
+    async def update_commission_rate(
+        self,
+        db: AsyncSession,
+        rate_id: int,
+        changes: Dict[str, Any]
+    ) -> Optional[ReferralCommissionRate]:
+        """Update a commission rate and invalidate every worker's rate cache"""
+        result = await db.execute(
+            select(ReferralCommissionRate).where(ReferralCommissionRate.id == rate_id)
+        )
+        rate = result.scalars().first()
+        if not rate:
+            return None
+
+        for field, value in changes.items():
+            setattr(rate, field, value)
+
+        await commission_rule_cache.invalidate(db)
+        await db.commit()
+        await db.refresh(rate)
+        return rate
 
     async def seed_default_commission_rates(self, db: AsyncSession):
         """
@@ -304,4 +472,5 @@ class CommissionService:
             rate = ReferralCommissionRate(**rate_data)
             db.add(rate)
 
+        await commission_rule_cache.invalidate(db)
         await db.commit()
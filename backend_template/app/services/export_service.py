@@ -0,0 +1,248 @@
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.models.order import Order
+from app.models.payment import PaymentTransaction
+from app.models.users import UserProfile
+
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Rows fetched per server-side cursor round trip
+EXPORT_BATCH_SIZE = 1000
+
+
+class ExportService:
+    """
+    Streams admin exports (orders, payments, invoices) as CSV or NDJSON:
+    - Rows come from a server-side cursor (AsyncSession.stream + yield_per),
+      so memory stays constant regardless of the number of rows
+    - Columns are picked from a whitelist per dataset
+    - Optional date range filter on the dataset's date column
+    """
+
+    # Exportable columns per dataset, in default output order
+    DATASETS: Dict[str, Dict[str, Any]] = {
+        "orders": {
+            "date_column": Order.created_at,
+            "id_column": Order.id,
+            "columns": {
+                "id": Order.id,
+                "order_number": Order.order_number,
+                "user_id": Order.user_id,
+                "user_email": UserProfile.email,
+                "plan_id": Order.plan_id,
+                "order_status": Order.order_status,
+                "payment_status": Order.payment_status,
+                "billing_cycle": Order.billing_cycle,
+                "payment_type": Order.payment_type,
+                "total_amount": Order.total_amount,
+                "discount_amount": Order.discount_amount,
+                "tax_amount": Order.tax_amount,
+                "grand_total": Order.grand_total,
+                "currency": Order.currency,
+                "payment_method": Order.payment_method,
+                "payment_reference": Order.payment_reference,
+                "razorpay_order_id": Order.razorpay_order_id,
+                "razorpay_payment_id": Order.razorpay_payment_id,
+                "payment_date": Order.payment_date,
+                "created_at": Order.created_at,
+                "completed_at": Order.completed_at,
+            },
+            "join": (UserProfile, Order.user_id == UserProfile.id),
+        },
+        "payments": {
+            "date_column": PaymentTransaction.created_at,
+            "id_column": PaymentTransaction.id,
+            "columns": {
+                "id": PaymentTransaction.id,
+                "user_id": PaymentTransaction.user_id,
+                "user_email": UserProfile.email,
+                "order_id": PaymentTransaction.order_id,
+                "payment_type": PaymentTransaction.payment_type,
+                "activation_type": PaymentTransaction.activation_type,
+                "subtotal": PaymentTransaction.subtotal,
+                "discount_applied": PaymentTransaction.discount_applied,
+                "tax_amount": PaymentTransaction.tax_amount,
+                "total_amount": PaymentTransaction.total_amount,
+                "refunded_amount": PaymentTransaction.refunded_amount,
+                "currency": PaymentTransaction.currency,
+                "payment_status": PaymentTransaction.payment_status,
+                "payment_method": PaymentTransaction.payment_method,
+                "razorpay_order_id": PaymentTransaction.razorpay_order_id,
+                "razorpay_payment_id": PaymentTransaction.razorpay_payment_id,
+                "commission_distributed": PaymentTransaction.commission_distributed,
+                "created_at": PaymentTransaction.created_at,
+                "paid_at": PaymentTransaction.paid_at,
+            },
+            "join": (UserProfile, PaymentTransaction.user_id == UserProfile.id),
+        },
+        "invoices": {
+            "date_column": Invoice.invoice_date,
+            "id_column": Invoice.id,
+            "columns": {
+                "id": Invoice.id,
+                "invoice_number": Invoice.invoice_number,
+                "user_id": Invoice.user_id,
+                "user_name": UserProfile.full_name,
+                "user_email": UserProfile.email,
+                "order_id": Invoice.order_id,
+                "invoice_date": Invoice.invoice_date,
+                "due_date": Invoice.due_date,
+                "subtotal": Invoice.subtotal,
+                "tax_amount": Invoice.tax_amount,
+                "total_amount": Invoice.total_amount,
+                "amount_paid": Invoice.amount_paid,
+                "balance_due": Invoice.balance_due,
+                "currency": Invoice.currency,
+                "status": Invoice.status,
+                "payment_status": Invoice.payment_status,
+                "payment_method": Invoice.payment_method,
+                "payment_date": Invoice.payment_date,
+                "payment_reference": Invoice.payment_reference,
+                "created_at": Invoice.created_at,
+            },
+            "join": (UserProfile, Invoice.user_id == UserProfile.id),
+        },
+    }
+
+    def resolve_columns(self, dataset: str, columns: Optional[str]) -> List[str]:
+        """Validate a comma separated column list against the dataset whitelist"""
+        available = self.DATASETS[dataset]["columns"]
+        if not columns:
+            return list(available.keys())
+
+        selected = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in selected if c not in available]
+        if unknown or not selected:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    f"Unknown export columns: {', '.join(unknown) or '(none given)'}. "
+                    f"Available: {', '.join(available.keys())}"
+                ),
+            )
+        return selected
+
+    def build_query(
+        self,
+        dataset: str,
+        columns: List[str],
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ):
+        config = self.DATASETS[dataset]
+        query = select(*[config["columns"][c].label(c) for c in columns])
+
+        join_target, on_clause = config["join"]
+        if any(config["columns"][c].class_ is join_target for c in columns):
+            query = query.select_from(config["id_column"].class_).join(join_target, on_clause)
+
+        if date_from:
+            query = query.where(config["date_column"] >= date_from)
+        if date_to:
+            query = query.where(config["date_column"] < date_to)
+
+        return query.order_by(config["id_column"]).execution_options(
+            yield_per=EXPORT_BATCH_SIZE
+        )
+
+    async def stream_export(
+        self,
+        dataset: str,
+        export_format: str,
+        columns: List[str],
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield the export body chunk by chunk.
+
+        Uses its own session: the request-scoped session from get_db may be
+        closed before a StreamingResponse finishes sending.
+        """
+        query = self.build_query(dataset, columns, date_from, date_to)
+
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(query)
+
+            if export_format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                async for partition in result.partitions():
+                    writer.writerows(
+                        [self._format_value(v) for v in row] for row in partition
+                    )
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                if buffer.tell():
+                    yield buffer.getvalue().encode("utf-8")
+            else:
+                async for partition in result.partitions():
+                    yield "".join(
+                        json.dumps(
+                            {c: self._format_value(v, csv_mode=False) for c, v in zip(columns, row)}
+                        ) + "\n"
+                        for row in partition
+                    ).encode("utf-8")
+
+    def streaming_response(
+        self,
+        dataset: str,
+        export_format: str,
+        columns: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> StreamingResponse:
+        """Validate export parameters and wrap the stream in a StreamingResponse"""
+        if export_format not in EXPORT_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported export format '{export_format}'. Use csv or ndjson",
+            )
+        if date_from and date_to and date_from >= date_to:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="date_from must be earlier than date_to",
+            )
+
+        selected = self.resolve_columns(dataset, columns)
+        filename = f"{dataset}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+
+        return StreamingResponse(
+            self.stream_export(dataset, export_format, selected, date_from, date_to),
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _format_value(value: Any, csv_mode: bool = True) -> Any:
+        if value is None:
+            return "" if csv_mode else None
+        if isinstance(value, enum.Enum):
+            return value.value
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
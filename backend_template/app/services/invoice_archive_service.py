@@ -0,0 +1,143 @@
+import asyncio
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.services.invoice_pdf_service import invoice_pdf_service
+from app.services.invoice_renderer import invoice_renderer
+
+
+ARCHIVE_FORMATS = ("html", "pdf")
+
+# Invoices fetched per server-side cursor round trip (and PDFs rendered in parallel)
+ARCHIVE_BATCH_SIZE = 100
+
+
+class _ZipSink:
+    """Write-only, unseekable file object: zipfile appends, the stream drains"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class InvoiceArchiveService:
+    """
+    Streams ZIP archives of rendered invoices (HTML or PDF):
+    - Invoices come from a server-side cursor in ARCHIVE_BATCH_SIZE chunks
+    - Each file is compressed straight into the response as it is rendered;
+      zipfile writes data descriptors to the unseekable stream, so no temp
+      file is needed and memory stays flat apart from the central directory
+      (one small entry per invoice)
+    - HTML skips the per-worker render cache so a big archive does not evict
+      the invoices customers are downloading; PDFs go through the
+      content-addressed PDF cache and the render pool
+    """
+
+    async def stream_archive(
+        self,
+        archive_format: str,
+        user_id: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Yield the ZIP body chunk by chunk.
+
+        Uses its own session: the request-scoped session from get_db may be
+        closed before a StreamingResponse finishes sending.
+        """
+        query = self.build_query(user_id, date_from, date_to)
+        sink = _ZipSink()
+
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(query)
+            with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+                async for invoices in result.scalars().partitions():
+                    if archive_format == "pdf":
+                        documents = await asyncio.gather(*[invoice_pdf_service.get_pdf(i) for i in invoices])
+                        files = [(invoice, pdf) for invoice, (pdf, _) in zip(invoices, documents)]
+                    else:
+                        files = [
+                            (invoice, invoice_renderer.render_html(invoice, cache=False).encode("utf-8"))
+                            for invoice in invoices
+                        ]
+
+                    for invoice, data in files:
+                        archive.writestr(self._entry(invoice, archive_format), data)
+                    yield sink.drain()
+            yield sink.drain()
+
+    def build_query(
+        self,
+        user_id: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ):
+        query = select(Invoice)
+        if user_id is not None:
+            query = query.where(Invoice.user_id == user_id)
+        if date_from:
+            query = query.where(Invoice.invoice_date >= date_from)
+        if date_to:
+            query = query.where(Invoice.invoice_date < date_to)
+        return query.order_by(Invoice.id).execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+
+    def streaming_response(
+        self,
+        archive_format: str,
+        user_id: Optional[int] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> StreamingResponse:
+        """Validate archive parameters and wrap the stream in a StreamingResponse"""
+        if archive_format not in ARCHIVE_FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported archive format '{archive_format}'. Use html or pdf",
+            )
+        if date_from and date_to and date_from >= date_to:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="date_from must be earlier than date_to",
+            )
+
+        scope = f"user{user_id}_" if user_id is not None else ""
+        filename = f"invoices_{scope}{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+
+        return StreamingResponse(
+            self.stream_archive(archive_format, user_id, date_from, date_to),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _entry(invoice: Invoice, archive_format: str) -> zipfile.ZipInfo:
+        issued = invoice.invoice_date or invoice.created_at or datetime.now()
+        entry = zipfile.ZipInfo(
+            f"Invoice_{invoice.invoice_number}.{archive_format}",
+            date_time=(max(issued.year, 1980),) + issued.timetuple()[1:6],
+        )
+        entry.compress_type = zipfile.ZIP_DEFLATED
+        return entry
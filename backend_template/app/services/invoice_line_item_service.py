@@ -0,0 +1,289 @@
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import exists, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.addon import Addon
+from app.models.invoice import Invoice, InvoiceLineItem
+from app.models.order import Order
+from app.models.order_addon import OrderAddon
+from app.models.order_service import OrderService as OrderServiceModel
+from app.models.plan import HostingPlan
+from app.models.server import Server
+from app.models.service import Service
+
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+LINE_ITEM_TYPES = ("plan", "addon", "service", "other")
+
+# Rows per INSERT (15 bound columns each, well under the 32767 parameter limit)
+INSERT_BATCH_SIZE = 1000
+
+
+def _decimal(value: Any, default: Decimal = ZERO) -> Decimal:
+    if value is None:
+        return default
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_item_rows(
+    invoice_id: int,
+    user_id: int,
+    invoice_date: datetime,
+    items: Optional[List[Dict[str, Any]]],
+) -> List[Dict[str, Any]]:
+    """
+    invoice_line_items rows for an invoice's items JSON. Items written
+    before item_type / ref_id existed become 'other' unless the backfill
+    tagged them first.
+    """
+    rows = []
+    for line_no, item in enumerate(items or []):
+        if not isinstance(item, dict):
+            continue
+        quantity = int(item.get("quantity", item.get("qty", 1)) or 1)
+        unit_price = _decimal(item.get("unit_price", item.get("price")))
+        amount = _decimal(unit_price * quantity)
+        discount_amount = _decimal(item.get("discount_amount"))
+        subtotal = _decimal(item.get("subtotal_after_discount"), amount - discount_amount)
+        tax_amount = _decimal(item.get("gst_amount"))
+        item_type = item.get("item_type")
+        rows.append({
+            "invoice_id": invoice_id,
+            "user_id": user_id,
+            "line_no": line_no,
+            "item_type": item_type if item_type in LINE_ITEM_TYPES else "other",
+            "ref_id": item.get("ref_id"),
+            "description": str(item.get("description") or item.get("item_name") or "")[:500] or None,
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "amount": amount,
+            "discount_amount": discount_amount,
+            "subtotal": subtotal,
+            "tax_amount": tax_amount,
+            "total_amount": _decimal(item.get("total_amount", item.get("total")), subtotal + tax_amount),
+            "invoice_date": invoice_date,
+        })
+    return rows
+
+
+class InvoiceLineItemService:
+    """
+    invoice_line_items, the relational copy of Invoice.items:
+    - Invoice writers (create_order, create_invoice, the renewal job) tag
+      items with item_type / ref_id and call write() / write_rows() in the
+      same transaction as the invoice
+    - backfill() converts existing invoices one id range at a time, tagging
+      legacy items from their order (plan, order addons, order services) or
+      renewed server; ranges are independent, so
+      scripts/backfill_invoice_line_items.py runs several in parallel
+    - Inserts ignore (invoice_id, line_no) conflicts, so writes and the
+      backfill are idempotent
+    - revenue_report() aggregates on idx_invoice_line_item_type_ref_date
+    """
+
+    async def write(self, db: AsyncSession, invoices: Iterable[Invoice]) -> int:
+        """Line items for flushed invoices; returns rows written"""
+        rows = []
+        for invoice in invoices:
+            rows += line_item_rows(invoice.id, invoice.user_id, self._invoice_date(invoice), invoice.items)
+        return await self.write_rows(db, rows)
+
+    async def write_rows(self, db: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            await db.execute(
+                pg_insert(InvoiceLineItem)
+                .values(rows[start:start + INSERT_BATCH_SIZE])
+                .on_conflict_do_nothing(index_elements=["invoice_id", "line_no"])
+            )
+        return len(rows)
+
+    async def backfill(self, db: AsyncSession, start_id: int, end_id: int) -> Tuple[int, int]:
+        """
+        Line items for invoices with start_id <= id < end_id that have none yet.
+        Returns (invoices, line items) written. Nothing is committed here.
+        """
+        has_lines = exists().where(InvoiceLineItem.invoice_id == Invoice.id)
+        result = await db.execute(
+            select(
+                Invoice.id, Invoice.user_id, Invoice.invoice_date, Invoice.created_at,
+                Invoice.items, Invoice.order_id, Invoice.server_id,
+            )
+            .where(Invoice.id >= start_id, Invoice.id < end_id, ~has_lines)
+            .order_by(Invoice.id)
+        )
+        invoices = result.all()
+        if not invoices:
+            return 0, 0
+
+        order_ids = {invoice.order_id for invoice in invoices if invoice.order_id}
+        server_ids = {invoice.server_id for invoice in invoices if invoice.server_id}
+        order_plans, order_addons, order_services = await self._order_context(db, order_ids)
+        server_plans = dict((await db.execute(
+            select(Server.id, Server.plan_id).where(Server.id.in_(server_ids))
+        )).all()) if server_ids else {}
+
+        rows = []
+        for invoice in invoices:
+            plan_id = server_plans.get(invoice.server_id) or order_plans.get(invoice.order_id)
+            items = self._tag_items(
+                invoice.items,
+                plan_id,
+                order_addons.get(invoice.order_id, []),
+                order_services.get(invoice.order_id, []),
+                has_context=bool(invoice.order_id or invoice.server_id),
+            )
+            rows += line_item_rows(
+                invoice.id, invoice.user_id, invoice.invoice_date or invoice.created_at, items
+            )
+
+        await self.write_rows(db, rows)
+        return len(invoices), len(rows)
+
+    async def revenue_report(
+        self,
+        db: AsyncSession,
+        start: date,
+        end: date,
+        item_type: Optional[str] = None,
+        ref_id: Optional[int] = None,
+        paid_only: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Revenue per month (UTC, by invoice date) per plan / addon / service
+        between start and end (inclusive). paid_only counts paid invoices only.
+        """
+        if item_type is not None and item_type not in LINE_ITEM_TYPES:
+            raise HTTPException(status_code=400, detail=f"item_type must be one of {', '.join(LINE_ITEM_TYPES)}")
+        if end < start:
+            raise HTTPException(status_code=400, detail="end must not be before start")
+        if (end - start).days + 1 > settings.ANALYTICS_MAX_RANGE_DAYS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Date range is limited to {settings.ANALYTICS_MAX_RANGE_DAYS} days"
+            )
+
+        month = func.date_trunc("month", func.timezone("UTC", InvoiceLineItem.invoice_date)).label("month")
+        query = (
+            select(
+                month,
+                InvoiceLineItem.item_type,
+                InvoiceLineItem.ref_id,
+                func.count(InvoiceLineItem.id).label("lines"),
+                func.sum(InvoiceLineItem.quantity).label("quantity"),
+                func.sum(InvoiceLineItem.subtotal).label("subtotal"),
+                func.sum(InvoiceLineItem.tax_amount).label("tax_amount"),
+                func.sum(InvoiceLineItem.total_amount).label("total_amount"),
+            )
+            .where(
+                InvoiceLineItem.invoice_date >= datetime.combine(start, time.min, timezone.utc),
+                InvoiceLineItem.invoice_date < datetime.combine(end + timedelta(days=1), time.min, timezone.utc),
+            )
+            .group_by(month, InvoiceLineItem.item_type, InvoiceLineItem.ref_id)
+            .order_by(month, InvoiceLineItem.item_type, InvoiceLineItem.ref_id)
+        )
+        if item_type is not None:
+            query = query.where(InvoiceLineItem.item_type == item_type)
+        if ref_id is not None:
+            query = query.where(InvoiceLineItem.ref_id == ref_id)
+        if paid_only:
+            query = query.join(Invoice, Invoice.id == InvoiceLineItem.invoice_id).where(Invoice.payment_status == "paid")
+
+        rows = (await db.execute(query)).all()
+        names = await self._catalog_names(db, {(row.item_type, row.ref_id) for row in rows if row.ref_id})
+        return [
+            {
+                "month": row.month.date(),
+                "item_type": row.item_type,
+                "ref_id": row.ref_id,
+                "name": names.get((row.item_type, row.ref_id)),
+                "lines": row.lines,
+                "quantity": row.quantity or 0,
+                "subtotal": row.subtotal or ZERO,
+                "tax_amount": row.tax_amount or ZERO,
+                "total_amount": row.total_amount or ZERO,
+            }
+            for row in rows
+        ]
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _invoice_date(invoice: Invoice) -> datetime:
+        if invoice.invoice_date is not None:
+            return invoice.invoice_date
+        return datetime.now(timezone.utc)
+
+    async def _order_context(self, db: AsyncSession, order_ids) -> Tuple[Dict, Dict, Dict]:
+        """Plan id, (addon_id, name) and (service_id, name) lists per order"""
+        if not order_ids:
+            return {}, {}, {}
+        plans = dict((await db.execute(select(Order.id, Order.plan_id).where(Order.id.in_(order_ids)))).all())
+
+        addons: Dict[int, List[Tuple[int, str]]] = {}
+        for order_id, addon_id, name in (await db.execute(
+            select(OrderAddon.order_id, OrderAddon.addon_id, OrderAddon.addon_name)
+            .where(OrderAddon.order_id.in_(order_ids))
+        )).all():
+            addons.setdefault(order_id, []).append((addon_id, name))
+
+        services: Dict[int, List[Tuple[int, str]]] = {}
+        for order_id, service_id, name in (await db.execute(
+            select(OrderServiceModel.order_id, OrderServiceModel.service_id, OrderServiceModel.service_name)
+            .where(OrderServiceModel.order_id.in_(order_ids))
+        )).all():
+            services.setdefault(order_id, []).append((service_id, name))
+
+        return plans, addons, services
+
+    @staticmethod
+    def _tag_items(
+        items: Optional[List[Dict[str, Any]]],
+        plan_id: Optional[int],
+        addons: List[Tuple[int, str]],
+        services: List[Tuple[int, str]],
+        has_context: bool,
+    ) -> List[Dict[str, Any]]:
+        """
+        item_type / ref_id for legacy items: order and renewal invoices list
+        the plan first, then addons and services by name
+        """
+        candidates = sorted(
+            [("addon", ref, name) for ref, name in addons] + [("service", ref, name) for ref, name in services],
+            key=lambda candidate: len(candidate[2] or ""),
+            reverse=True,
+        )
+        tagged = []
+        for line_no, item in enumerate(items or []):
+            if not isinstance(item, dict) or item.get("item_type") in LINE_ITEM_TYPES:
+                tagged.append(item)
+                continue
+            description = str(item.get("description") or item.get("item_name") or "")
+            item_type, ref_id = "other", None
+            if has_context and line_no == 0:
+                item_type, ref_id = "plan", plan_id
+            else:
+                for candidate_type, candidate_ref, name in candidates:
+                    if name and description.startswith(name):
+                        item_type, ref_id = candidate_type, candidate_ref
+                        break
+            tagged.append({**item, "item_type": item_type, "ref_id": ref_id})
+        return tagged
+
+    async def _catalog_names(self, db: AsyncSession, refs) -> Dict[Tuple[str, int], str]:
+        names = {}
+        for item_type, model in (("plan", HostingPlan), ("addon", Addon), ("service", Service)):
+            ids = {ref_id for ref_type, ref_id in refs if ref_type == item_type}
+            if ids:
+                result = await db.execute(select(model.id, model.name).where(model.id.in_(ids)))
+                names.update({(item_type, ref_id): name for ref_id, name in result.all()})
+        return names
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.models.invoice import Invoice
+from app.services.invoice_renderer import format_date
+from app.utils.invoice_pdf import LAYOUT_VERSION, render_invoice_pdf
+
+
+def invoice_document(invoice: Invoice) -> Dict[str, Any]:
+    """Everything the PDF shows, as plain picklable data"""
+    return {
+        "invoice_number": invoice.invoice_number,
+        "invoice_date": format_date(invoice.invoice_date),
+        "due_date": format_date(invoice.due_date),
+        "payment_status": invoice.payment_status or "pending",
+        "items": [
+            {
+                "description": item.get("description", "N/A"),
+                "quantity": item.get("quantity", 1),
+                "unit_price": str(item.get("unit_price", 0)),
+                "amount": str(item.get("amount", 0)),
+            }
+            for item in invoice.items or []
+        ],
+        "subtotal": str(invoice.subtotal or 0),
+        "tax_amount": str(invoice.tax_amount or 0),
+        "total_amount": str(invoice.total_amount or 0),
+        "amount_paid": str(invoice.amount_paid or 0),
+        "balance_due": str(invoice.balance_due or 0),
+        "payment_date": format_date(invoice.payment_date, "%d-%m-%Y %H:%M"),
+        "payment_method": invoice.payment_method,
+    }
+
+
+def document_digest(document: Dict[str, Any]) -> str:
+    """Content address of a document: same content and layout, same PDF"""
+    payload = json.dumps({"layout": LAYOUT_VERSION, "document": document}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InvoicePdfService:
+    """
+    Invoice PDFs rendered in a process pool with an on-disk cache:
+    - Layout (app/utils/invoice_pdf.py) runs in INVOICE_PDF_WORKERS spawned
+      processes, so CPU-heavy rendering never blocks the event loop
+    - PDFs are stored under INVOICE_PDF_CACHE_DIR by the sha256 of the
+      invoice content and layout version: a changed invoice has a new
+      address, an unchanged one is never rendered twice (by any worker or
+      by scripts/prerender_invoice_pdfs.py)
+    - Concurrent requests for the same missing PDF share one render
+    - Files not read for INVOICE_PDF_CACHE_MAX_AGE_DAYS are pruned by the
+      pre-render job
+    """
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "renders": 0,
+            "render_errors": 0,
+            "render_seconds": 0.0,
+            "max_render_seconds": 0.0,
+        }
+
+    @property
+    def cache_dir(self) -> Path:
+        return Path(settings.INVOICE_PDF_CACHE_DIR)
+
+    def digest(self, invoice: Invoice) -> str:
+        return document_digest(invoice_document(invoice))
+
+    async def get_pdf(self, invoice: Invoice) -> Tuple[bytes, str]:
+        """PDF bytes of an invoice and their content address (usable as an ETag)"""
+        document = invoice_document(invoice)
+        digest = document_digest(document)
+
+        pdf = await asyncio.to_thread(self._read, digest)
+        if pdf is not None:
+            self._metrics["hits"] += 1
+            return pdf, digest
+        self._metrics["misses"] += 1
+
+        inflight = self._inflight.get(digest)
+        if inflight is not None:
+            self._metrics["coalesced"] += 1
+            return await asyncio.shield(inflight), digest
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = future
+        try:
+            pdf = await self._render(document, digest)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(pdf)
+            return pdf, digest
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(digest, None)
+
+    async def prerender(self, invoices: Iterable[Invoice]) -> Dict[str, int]:
+        """Render every invoice not cached yet, the whole batch in parallel"""
+        pending = {}
+        cached = 0
+        for invoice in invoices:
+            document = invoice_document(invoice)
+            digest = document_digest(document)
+            if digest in pending or self._path(digest).exists():
+                cached += 1
+            else:
+                pending[digest] = document
+
+        results = await asyncio.gather(
+            *[self._render(document, digest) for digest, document in pending.items()],
+            return_exceptions=True,
+        )
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        return {"rendered": len(pending) - failed, "cached": cached, "failed": failed}
+
+    def prune(self, max_age_days: Optional[int] = None) -> int:
+        """Delete cached PDFs not read for max_age_days; returns files removed"""
+        max_age_days = max_age_days if max_age_days is not None else settings.INVOICE_PDF_CACHE_MAX_AGE_DAYS
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        for path in self.cache_dir.glob("*/*.pdf"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self._metrics["hits"] + self._metrics["misses"]
+        renders = self._metrics["renders"]
+        return {
+            **self._metrics,
+            "inflight": len(self._inflight),
+            "workers": settings.INVOICE_PDF_WORKERS,
+            "hit_ratio": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_render_ms": round(self._metrics["render_seconds"] / renders * 1000, 2) if renders else 0.0,
+        }
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    def _path(self, digest: str) -> Path:
+        return self.cache_dir / digest[:2] / f"{digest}.pdf"
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        path = self._path(digest)
+        try:
+            pdf = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Reads count as use for pruning
+        os.utime(path)
+        return pdf
+
+    def _write(self, digest: str, pdf: bytes) -> None:
+        path = self._path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Readers only ever see complete files
+        # Unique per writer: concurrent tasks and threads of one process too
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+            tmp.write(pdf)
+        os.replace(tmp.name, path)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers start clean instead of forking the server's sockets and event loop
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.INVOICE_PDF_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def _render(self, document: Dict[str, Any], digest: str) -> bytes:
+        try:
+            pdf, seconds = await asyncio.get_running_loop().run_in_executor(
+                self._get_pool(), render_invoice_pdf, document
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next render
+            self._metrics["render_errors"] += 1
+            self._pool = None
+            raise
+        except Exception:
+            self._metrics["render_errors"] += 1
+            raise
+        self._metrics["renders"] += 1
+        self._metrics["render_seconds"] += seconds
+        self._metrics["max_render_seconds"] = max(self._metrics["max_render_seconds"], seconds)
+        await asyncio.to_thread(self._write, digest, pdf)
+        return pdf
+
+
+# Shared by every request handled by this worker process
+invoice_pdf_service = InvoicePdfService()
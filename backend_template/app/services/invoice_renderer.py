@@ -0,0 +1,115 @@
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from app.core.config import settings
+from app.models.invoice import Invoice
+
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates" / "invoices"
+HTML_TEMPLATE = "invoice.html"
+
+
+def _money(value: Any) -> str:
+    return f"₹{float(value or 0):,.2f}"
+
+
+def format_date(value: Optional[datetime], fmt: str = "%d-%m-%Y") -> str:
+    return value.strftime(fmt) if value else "N/A"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers etag (weak comparison, as for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class InvoiceRenderer:
+    """
+    Renders invoice documents from precompiled templates (app/templates/invoices):
+    - Templates are compiled once per process; auto_reload is off, so no
+      per-request stat / recompile
+    - Rendered output is cached per invoice with the updated_at it was
+      rendered from, LRU-bounded by INVOICE_RENDER_CACHE_SIZE; any change to
+      the invoice bumps updated_at and replaces the entry on the next read
+    - The ETag is derived from the same key plus a template fingerprint, so
+      a repeat download is answered 304 without rendering
+    """
+
+    def __init__(self):
+        self._env = Environment(
+            loader=FileSystemLoader(str(TEMPLATE_DIR)),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self._env.filters["money"] = _money
+        self._env.filters["dmy"] = format_date
+        self._html = self._env.get_template(HTML_TEMPLATE)
+        self._fingerprint = hashlib.sha1((TEMPLATE_DIR / HTML_TEMPLATE).read_bytes()).hexdigest()[:12]
+
+        self._cache: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "renders": 0,
+            "render_seconds": 0.0,
+        }
+
+    @staticmethod
+    def version(invoice: Invoice) -> str:
+        """Changes whenever the invoice row does (updated_at, else created_at)"""
+        changed_at = invoice.updated_at or invoice.created_at
+        return changed_at.isoformat() if changed_at else ""
+
+    def etag(self, invoice: Invoice, kind: str = "html") -> str:
+        digest = hashlib.sha1(
+            f"{invoice.id}:{self.version(invoice)}:{kind}:{self._fingerprint}".encode("utf-8")
+        ).hexdigest()[:20]
+        return f'"{digest}"'
+
+    def render_html(self, invoice: Invoice, cache: bool = True) -> str:
+        """Invoice HTML; cache=False renders without touching the cache (bulk exports)"""
+        if not cache:
+            return self._html.render(invoice=invoice)
+
+        version = self.version(invoice)
+        entry = self._cache.get(invoice.id)
+        if entry is not None and entry[0] == version:
+            self._metrics["hits"] += 1
+            self._cache.move_to_end(invoice.id)
+            return entry[1]
+
+        self._metrics["misses"] += 1
+        started = time.perf_counter()
+        html = self._html.render(invoice=invoice)
+        self._metrics["renders"] += 1
+        self._metrics["render_seconds"] += time.perf_counter() - started
+
+        self._cache[invoice.id] = (version, html)
+        self._cache.move_to_end(invoice.id)
+        while len(self._cache) > settings.INVOICE_RENDER_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return html
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self._metrics["hits"] + self._metrics["misses"]
+        return {
+            **self._metrics,
+            "size": len(self._cache),
+            "max_size": settings.INVOICE_RENDER_CACHE_SIZE,
+            "hit_ratio": round(self._metrics["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Shared by every request handled by this worker process
+invoice_renderer = InvoiceRenderer()
@@ -239,7 +239,7 @@
 
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
+from sqlalchemy import and_, func, or_, select
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -247,6 +247,8 @@ from decimal import Decimal
 from app.models.invoice import Invoice
 from app.models.users import UserProfile
 from app.schemas.invoice import InvoiceStats
+from app.services.billing_summary_service import BillingSummaryService
+from app.services.invoice_line_item_service import InvoiceLineItemService
 
 
 class InvoiceService:
@@ -353,6 +355,9 @@ class InvoiceService:
         )
 
         db.add(db_invoice)
+        await db.flush()
+        await InvoiceLineItemService().write(db, [db_invoice])
+        await BillingSummaryService().refresh(db, [user_id])
         await db.commit()
         await db.refresh(db_invoice)
         return db_invoice
@@ -371,6 +376,7 @@ class InvoiceService:
         invoice.balance_due = Decimal("0.0")
         invoice.status = "paid"
 
+        await BillingSummaryService().refresh(db, [user_id])
         await db.commit()
         return True
 
@@ -381,14 +387,8 @@ class InvoiceService:
     async def get_user_monthly_cost(
         self, db: AsyncSession, user_id: int
     ) -> Decimal:
-        from app.models.server import Server
-        result = await db.execute(
-            select(func.sum(Server.monthly_cost)).where(
-                Server.user_id == user_id,
-                Server.server_status == "active",
-            )
-        )
-        return result.scalar() or Decimal("0.0")
+        summary = await BillingSummaryService().get_summary(db, user_id)
+        return summary.monthly_cost
 
     # async def get_user_current_balance(
     #     self, db: AsyncSession, user_id: int
@@ -403,32 +403,10 @@ class InvoiceService:
 
 
     async def get_user_current_balance(
-            self, db: AsyncSession, user_id: int
-        ) -> Decimal:
-            result = await db.execute(
-                select(func.sum(Invoice.balance_due)).where(
-                    Invoice.user_id == user_id,
-                    Invoice.payment_status.in_(["pending", "overdue"]),
-                )
-            )
-
-            balance = result.scalar() or Decimal("0.0")
-
-            # 🧩 Debug print section
-            print(f"🧾 Checking Current Balance for User ID: {user_id}")
-            print(f"Query Result: {result}")
-            print(f"Calculated Balance (Pending + Overdue): {balance}")
-
-            # Optional: Check all invoice details for debugging
-            all_invoices = await db.execute(
-                select(Invoice).where(Invoice.user_id == user_id)
-            )
-            invoices = all_invoices.scalars().all()
-            print("All invoice statuses and balances:")
-            for inv in invoices:
-                print(f"Invoice ID: {inv.id}, Status: {inv.payment_status}, Balance Due: {inv.balance_due}")
-
-            return balance
+        self, db: AsyncSession, user_id: int
+    ) -> Decimal:
+        summary = await BillingSummaryService().get_summary(db, user_id)
+        return summary.outstanding_balance
 
 
     async def get_monthly_revenue(self, db: AsyncSession) -> Decimal:
@@ -450,7 +428,13 @@ class InvoiceService:
             select(func.count(Invoice.id)).where(Invoice.payment_status == "pending")
         )).scalar()
         overdue_invoices = (await db.execute(
-            select(func.count(Invoice.id)).where(Invoice.payment_status == "overdue")
+            select(func.count(Invoice.id)).where(
+                or_(
+                    Invoice.payment_status == "overdue",
+                    # Marked by the overdue sweeper (app/services/overdue_invoice_service.py)
+                    and_(Invoice.status == "overdue", Invoice.payment_status != "paid"),
+                )
+            )
         )).scalar()
 
         total_revenue = (
@@ -505,13 +489,8 @@ class InvoiceService:
     async def get_user_pending_invoices_count(
         self, db: AsyncSession, user_id: int
     ) -> int:
-        result = await db.execute(
-            select(func.count(Invoice.id)).where(
-                Invoice.user_id == user_id,
-                Invoice.payment_status.in_(["pending", "overdue"]),
-            )
-        )
-        return result.scalar() or 0
+        summary = await BillingSummaryService().get_summary(db, user_id)
+        return summary.pending_invoices
 
 
 
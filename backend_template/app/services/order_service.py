@@ -17,6 +17,21 @@ from app.models.order_service import OrderService as OrderServiceModel
 from app.schemas.order import OrderCreate, OrderUpdate, OrderSummary, InvoiceResponse
 from app.models.referrals import ReferralEarning
 from app.services.referral_service import ReferralService
+from app.services.referral_closure_service import ReferralClosureService
+from app.services.referral_ledger_service import ReferralLedgerService
+from app.services.billing_summary_service import BillingSummaryService
+from app.services.invoice_line_item_service import InvoiceLineItemService
+
+
+# Billing cycle → discount % (applied to plan, addons and services; renewals too)
+BILLING_CYCLE_DISCOUNTS = {
+    "monthly": Decimal("5.00"),
+    "quarterly": Decimal("10.00"),
+    "semi-annually": Decimal("15.00"),
+    "annually": Decimal("20.00"),
+    "biennially": Decimal("25.00"),
+    "triennially": Decimal("35.00"),
+}
 
 
 class OrderService:
@@ -132,15 +147,7 @@ class OrderService:
             order_number = await self._generate_order_number(db)
 
             # ✅ 3️⃣ Billing cycle → discount %
-            discount_map = {
-                "monthly": Decimal("5.00"),
-                "quarterly": Decimal("10.00"),
-                "semi-annually": Decimal("15.00"),
-                "annually": Decimal("20.00"),
-                "biennially": Decimal("25.00"),
-                "triennially": Decimal("35.00"),
-            }
-            discount_percent = discount_map.get(order_data.billing_cycle.lower(), Decimal("0.00"))
+            discount_percent = BILLING_CYCLE_DISCOUNTS.get(order_data.billing_cycle.lower(), Decimal("0.00"))
 
             # ✅ 4️⃣ Calculate base totals from hosting plan
             plan_subtotal = Decimal(order_data.total_amount)
@@ -185,6 +192,8 @@ class OrderService:
 
                     # Invoice line item
                     invoice_addon_items.append({
+                        "item_type": "addon",
+                        "ref_id": addon.id,
                         "description": f"{addon.name} - {addon.category.value}",
                         "quantity": int(quantity),
                         "unit_price": float(unit_price),
@@ -234,6 +243,8 @@ class OrderService:
 
                     # Invoice line item
                     invoice_service_items.append({
+                        "item_type": "service",
+                        "ref_id": service.id,
                         "description": f"{service.name} - {service.category.value}",
                         "quantity": int(quantity),
                         "unit_price": float(unit_price),
@@ -334,6 +345,8 @@ class OrderService:
 
             # Build complete invoice items array: plan + addons + services
             plan_item = {
+                "item_type": "plan",
+                "ref_id": plan.id,
                 "description": f"{plan.name} - {order_data.billing_cycle.title()} Plan",
                 "quantity": 1,
                 "amount": float(grand_total),
@@ -371,6 +384,9 @@ class OrderService:
             )
 
             db.add(new_invoice)
+            await db.flush()
+            await InvoiceLineItemService().write(db, [new_invoice])
+            await BillingSummaryService().refresh(db, [user_id])
 
             # ✅ 1️⃣2️⃣ Commit all changes
             await db.commit()
@@ -537,25 +553,21 @@ class OrderService:
             3: 2.0,
         }
 
-        # 5️⃣ Detect referral direction and traverse up
-        current_user = buyer
-        current_level = 1
+        # 5️⃣ Whole upline in one closure lookup: {level: referrer_id}
+        upline = await ReferralClosureService().get_upline(
+            db, buyer.id, max_depth=len(commission_structure)
+        )
         order_amount = float(order.grand_total or 0)
+        ledger = ReferralLedgerService()
 
-        while current_user.referred_by and current_level <= len(commission_structure):
-            # find the referrer (upline)
-            result = await db.execute(select(UserProfile).filter(UserProfile.id == current_user.referred_by))
-            referrer = result.scalars().first()
-            if not referrer:
-                break
-
+        for current_level, referrer_id in upline.items():
             commission_rate = commission_structure[current_level]
             commission_amount = round(order_amount * (commission_rate / 100), 2)
 
             # Create referral earning record
             earning = ReferralEarning(
-                user_id=buyer.id,
-                referred_user_id=referrer.id,
+                user_id=referrer_id,
+                referred_user_id=buyer.id,
                 order_id=order.id,
                 level=current_level,
                 commission_rate=commission_rate,
@@ -565,10 +577,7 @@ class OrderService:
                 earned_at=datetime.utcnow(),
             )
             db.add(earning)
-
-            # Move up the chain
-            current_user = referrer
-            current_level += 1
+            await ledger.record_earning(db, earning)
 
         await db.commit()
         await db.refresh(order)
@@ -689,6 +698,7 @@ class OrderService:
                 invoice.balance_due = Decimal("0.00")
                 invoice.updated_at = datetime.utcnow()
                 db.add(invoice)
+                await BillingSummaryService().refresh(db, [invoice.user_id])
 
             db.add(order)
             await db.commit()
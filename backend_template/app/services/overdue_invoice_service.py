@@ -0,0 +1,163 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, Numeric, case, cast, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.invoice import Invoice, InvoiceDunningEvent
+
+
+# Invoice statuses that can still become (or stay) overdue
+OPEN_INVOICE_STATUSES = ("unpaid", "issued", "sent", "overdue")
+
+# Payment statuses with money still owed
+OPEN_PAYMENT_STATUSES = ("pending", "partially_paid", "failed", "overdue")
+
+
+class OverdueInvoiceService:
+    """
+    Overdue sweeper for invoices:
+    - Open invoices past due_date are found on idx_invoice_status_due_date in
+      id order, INVOICE_OVERDUE_BATCH_SIZE per transaction (locked rows, e.g.
+      a payment being recorded, are skipped until the next sweep)
+    - One statement per batch: a data-modifying CTE sets status='overdue',
+      days_overdue and late_fee for the whole batch in the database, and the
+      rows it returns feed an INSERT into invoice_dunning_events; nothing is
+      loaded into Python
+    - Rows already up to date for today are not rewritten
+    - Late fee: INVOICE_LATE_FEE_PERCENT of balance_due per started 30 days
+      past INVOICE_LATE_FEE_GRACE_DAYS, capped at INVOICE_LATE_FEE_MAX_PERCENT;
+      it never goes down (partial payments do not refund fees)
+    - A dunning event is emitted once per invoice per stage in
+      INVOICE_DUNNING_STAGE_DAYS; an invoice first swept late only gets the
+      highest stage it has reached
+    """
+
+    async def sweep(
+        self,
+        db: AsyncSession,
+        now: Optional[datetime] = None,
+        batch_size: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Mark overdue invoices; returns invoices updated and dunning events emitted"""
+        now = now or datetime.now(timezone.utc)
+        batch_size = batch_size or settings.INVOICE_OVERDUE_BATCH_SIZE
+        totals = {"updated": 0, "events": 0}
+
+        last_id = 0
+        while True:
+            result = await db.execute(self.build_sweep(now, last_id, batch_size))
+            updated, upto_id, events = result.one()
+            await db.commit()
+            if not updated:
+                break
+            totals["updated"] += updated
+            totals["events"] += events
+            last_id = upto_id
+
+        return totals
+
+    def build_sweep(self, now: datetime, after_id: int, batch_size: int):
+        """The per-batch statement: WITH batch, swept (UPDATE), events (INSERT) SELECT counts"""
+        days = self._days_overdue(now)
+        batch = (
+            select(Invoice.id)
+            .where(
+                Invoice.status.in_(OPEN_INVOICE_STATUSES),
+                Invoice.due_date < now,
+                Invoice.payment_status.in_(OPEN_PAYMENT_STATUSES),
+                Invoice.balance_due > 0,
+                Invoice.id > after_id,
+                or_(Invoice.status != "overdue", Invoice.days_overdue.is_distinct_from(days)),
+            )
+            .order_by(Invoice.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("batch")
+        )
+
+        swept = (
+            update(Invoice)
+            .where(Invoice.id.in_(select(batch.c.id)))
+            .values(
+                status="overdue",
+                days_overdue=days,
+                late_fee=func.greatest(func.coalesce(Invoice.late_fee, 0), self._late_fee(days)),
+                updated_at=now,
+            )
+            .returning(
+                Invoice.id, Invoice.user_id, Invoice.days_overdue, Invoice.balance_due, Invoice.late_fee
+            )
+            .cte("swept")
+        )
+
+        stage = self._dunning_stage(swept.c.days_overdue)
+        events = (
+            pg_insert(InvoiceDunningEvent)
+            .from_select(
+                ["invoice_id", "user_id", "stage", "days_overdue", "balance_due", "late_fee"],
+                select(
+                    swept.c.id, swept.c.user_id, stage,
+                    swept.c.days_overdue, swept.c.balance_due, swept.c.late_fee,
+                ).where(stage.is_not(None)),
+            )
+            .on_conflict_do_nothing(index_elements=["invoice_id", "stage"])
+            .returning(InvoiceDunningEvent.id)
+            .cte("events")
+        )
+
+        return select(
+            select(func.count()).select_from(swept).scalar_subquery(),
+            select(func.max(swept.c.id)).scalar_subquery(),
+            select(func.count()).select_from(events).scalar_subquery(),
+        )
+
+    async def get_pending_events(self, db: AsyncSession, limit: int = 500) -> List[InvoiceDunningEvent]:
+        """Unsent dunning events, oldest first, locked for this notifier's transaction"""
+        result = await db.execute(
+            select(InvoiceDunningEvent)
+            .where(InvoiceDunningEvent.sent_at.is_(None))
+            .order_by(InvoiceDunningEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return result.scalars().all()
+
+    async def mark_events_sent(self, db: AsyncSession, event_ids: List[int]) -> None:
+        if not event_ids:
+            return
+        await db.execute(
+            update(InvoiceDunningEvent)
+            .where(InvoiceDunningEvent.id.in_(event_ids))
+            .values(sent_at=func.now())
+        )
+        await db.commit()
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    @staticmethod
+    def _days_overdue(now: datetime):
+        """Whole days since due_date, computed by the database"""
+        return cast(func.floor(func.extract("epoch", literal(now) - Invoice.due_date) / 86400), Integer)
+
+    @staticmethod
+    def _late_fee(days):
+        grace = settings.INVOICE_LATE_FEE_GRACE_DAYS
+        # numeric throughout: Postgres has no round(double precision, int)
+        periods = case((days > grace, func.ceil(cast(days - grace, Numeric) / 30)), else_=0)
+        percent = func.least(
+            periods * Decimal(str(settings.INVOICE_LATE_FEE_PERCENT)),
+            Decimal(str(settings.INVOICE_LATE_FEE_MAX_PERCENT)),
+        )
+        return cast(func.round(Invoice.balance_due * percent / 100, 2), Numeric(10, 2))
+
+    @staticmethod
+    def _dunning_stage(days):
+        """Highest stage in INVOICE_DUNNING_STAGE_DAYS reached, NULL before the first"""
+        stages = sorted(settings.INVOICE_DUNNING_STAGE_DAYS, reverse=True)
+        return case(*[(days >= stage, stage) for stage in stages], else_=None)
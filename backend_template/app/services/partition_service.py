@@ -0,0 +1,227 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+
+# Tables range-partitioned by month, mapped to their partition key column.
+# `orders` is intentionally not partitioned: invoices, servers, order_addons,
+# order_services, payment_transactions and referral_earnings all reference
+# orders.id, and a partitioned table can only be referenced through a key that
+# includes the partition column.
+PARTITIONED_TABLES: Dict[str, str] = {
+    "payment_transactions": "created_at",
+    "referral_earnings": "earned_at",
+}
+
+
+def month_start(value: datetime) -> datetime:
+    """First instant (UTC) of the month containing value"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Shift a month start by a number of months"""
+    index = value.year * 12 + (value.month - 1) + months
+    return value.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """Name of the partition holding the given month, e.g. payment_transactions_p2025_11"""
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+class PartitionService:
+    """
+    Maintains monthly range partitions (PostgreSQL only):
+    - Creates partitions for the current month and the next few months
+    - Keeps a DEFAULT partition as a safety net for out-of-range rows
+    - Detaches old partitions and moves them to an archive schema
+    """
+
+    async def is_partitioned(self, db: AsyncSession, table: str) -> bool:
+        """Whether the table exists as a partitioned parent (False on SQLite or before migration)"""
+        if db.bind.dialect.name != "postgresql":
+            return False
+
+        result = await db.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+            ),
+            {"table": table},
+        )
+        return result.scalar() is not None
+
+    async def ensure_partitions(
+        self,
+        db: AsyncSession,
+        months_ahead: Optional[int] = None,
+        now: Optional[datetime] = None,
+    ) -> List[str]:
+        """
+        Create missing monthly partitions from the current month up to
+        `months_ahead` months in the future, plus the DEFAULT partition.
+        Rows that already landed in the DEFAULT partition for a missing month
+        are moved into the new partition (see _split_default).
+
+        Returns the names of the partitions that were created.
+        """
+        months_ahead = settings.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        current = month_start(now or datetime.now(timezone.utc))
+        created: List[str] = []
+
+        for table in PARTITIONED_TABLES:
+            if not await self.is_partitioned(db, table):
+                continue
+
+            existing = set(await self._partition_names(db, table))
+
+            default_name = f"{table}_default"
+            if default_name not in existing:
+                await db.execute(text(f"CREATE TABLE IF NOT EXISTS {default_name} PARTITION OF {table} DEFAULT"))
+                created.append(default_name)
+
+            for offset in range(months_ahead + 1):
+                lower = add_months(current, offset)
+                name = partition_name(table, lower)
+                if name in existing:
+                    continue
+                if default_name in existing and await self._default_has_rows(db, table, lower):
+                    await self._split_default(db, table, lower)
+                else:
+                    await db.execute(text(self._create_partition_sql(table, lower)))
+                created.append(name)
+
+        await db.commit()
+        return created
+
+    async def list_partitions(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """List attached partitions with their bounds and approximate row counts"""
+        partitions = []
+        for table in PARTITIONED_TABLES:
+            if not await self.is_partitioned(db, table):
+                continue
+
+            result = await db.execute(
+                text(
+                    "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint "
+                    "FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid "
+                    "JOIN pg_class p ON p.oid = i.inhparent "
+                    "WHERE p.relname = :table AND pg_table_is_visible(p.oid) "
+                    "ORDER BY c.relname"
+                ),
+                {"table": table},
+            )
+            partitions.extend(
+                {
+                    "table": table,
+                    "partition": name,
+                    "bounds": bounds,
+                    "estimated_rows": max(rows, 0),
+                }
+                for name, bounds, rows in result.all()
+            )
+        return partitions
+
+    async def detach_partition(
+        self,
+        db: AsyncSession,
+        table: str,
+        month: datetime,
+        archive: bool = True,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        Detach the partition holding `month` from its parent table.
+
+        With archive=True the detached table is moved into the archive schema
+        (settings.PARTITION_ARCHIVE_SCHEMA) so it can be dumped or dropped later
+        without touching the live table. Partitions of the current month or later
+        are never detached.
+        """
+        if table not in PARTITIONED_TABLES:
+            raise HTTPException(status_code=400, detail=f"Table '{table}' is not partitioned")
+
+        lower = month_start(month)
+        if lower >= month_start(now or datetime.now(timezone.utc)):
+            raise HTTPException(status_code=400, detail="Only past months can be detached")
+
+        name = partition_name(table, lower)
+        if name not in await self._partition_names(db, table):
+            raise HTTPException(status_code=404, detail=f"Partition '{name}' not found")
+
+        await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+
+        location = name
+        if archive:
+            schema = settings.PARTITION_ARCHIVE_SCHEMA
+            await db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+            await db.execute(text(f"ALTER TABLE {name} SET SCHEMA {schema}"))
+            location = f"{schema}.{name}"
+
+        await db.commit()
+        return {"table": table, "partition": name, "archived": archive, "location": location}
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _partition_names(self, db: AsyncSession, table: str) -> List[str]:
+        result = await db.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+            ),
+            {"table": table},
+        )
+        return [row[0] for row in result.all()]
+
+    async def _default_has_rows(self, db: AsyncSession, table: str, lower: datetime) -> bool:
+        column = PARTITIONED_TABLES[table]
+        result = await db.execute(
+            text(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {column} >= :lower AND {column} < :upper)"),
+            {"lower": lower, "upper": add_months(lower, 1)},
+        )
+        return bool(result.scalar())
+
+    async def _split_default(self, db: AsyncSession, table: str, lower: datetime) -> None:
+        """
+        Create the partition for `lower` when the DEFAULT partition already
+        holds rows for that month (PostgreSQL refuses a plain CREATE ... PARTITION OF
+        then): detach the default, create the partition, move the month's rows
+        across and reattach the default, all in the caller's transaction.
+        """
+        column = PARTITIONED_TABLES[table]
+        default_name = f"{table}_default"
+        name = partition_name(table, lower)
+
+        await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default_name}"))
+        await db.execute(text(self._create_partition_sql(table, lower)))
+        await db.execute(
+            text(
+                f"WITH moved AS ("
+                f"DELETE FROM {default_name} WHERE {column} >= :lower AND {column} < :upper RETURNING *"
+                f") INSERT INTO {name} SELECT * FROM moved"
+            ),
+            {"lower": lower, "upper": add_months(lower, 1)},
+        )
+        await db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default_name} DEFAULT"))
+
+    @staticmethod
+    def _create_partition_sql(table: str, lower: datetime) -> str:
+        upper = add_months(lower, 1)
+        return (
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, lower)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
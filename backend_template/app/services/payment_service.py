@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi import HTTPException
 
-from app.models.payment import PaymentTransaction, PaymentType, ActivationType, PaymentStatus
+from app.models.payment import PaymentTransaction, PaymentRazorpayOrder, PaymentType, ActivationType, PaymentStatus
 from app.models.users import UserProfile
 from app.models.order import Order
 from app.services.razorpay_service import RazorpayService
@@ -108,6 +108,9 @@ class PaymentService:
         )
 
         db.add(payment_transaction)
+        # Claims the order id (payment_transactions is partitioned and cannot
+        # hold a unique key on it); a duplicate fails the commit
+        db.add(PaymentRazorpayOrder(razorpay_order_id=razorpay_order['id']))
         await db.commit()
         await db.refresh(payment_transaction)
 
@@ -0,0 +1,336 @@
+import csv
+import io
+import json
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, select, update
+
+from app.core.database import AsyncSessionLocal
+from app.models.affiliate import Payout, PayoutStatus
+from app.models.referrals import ReferralPayout
+from app.models.users import UserProfile
+from app.services.affiliate_service import AffiliateService
+from app.services.affiliate_stats_service import AffiliateStatsService
+from app.services.referral_service import ReferralService
+
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_SOURCES = ("referral", "affiliate")
+TRANSFER_MODES = ("NEFT", "IMPS")
+
+# Rows fetched per server-side cursor round trip
+TRANSFER_BATCH_SIZE = 1000
+
+# Reconciliation rows applied per transaction
+RECONCILE_CHUNK_SIZE = 500
+
+# Affiliate payouts have no payout number; the bank file carries this instead
+AFFILIATE_REFERENCE_PREFIX = "AFF-"
+
+TRANSFER_COLUMNS = [
+    "Payment Mode",
+    "Beneficiary Name",
+    "Beneficiary Account Number",
+    "IFSC",
+    "Bank Name",
+    "Amount",
+    "TDS Amount",
+    "Payout Reference",
+    "Beneficiary Email",
+    "Remarks",
+]
+
+# Accepted header names in bank reconciliation files (lower-cased)
+RECONCILE_REFERENCE_COLUMNS = ("payout reference", "payout_reference", "payout_number", "reference", "customer reference")
+RECONCILE_STATUS_COLUMNS = ("status", "transaction status")
+RECONCILE_UTR_COLUMNS = ("utr", "utr number", "bank reference", "bank_reference")
+RECONCILE_SUCCESS_STATUSES = ("success", "successful", "paid", "completed", "processed")
+
+
+class PayoutTransferService:
+    """
+    Bank bulk transfers for approved payouts:
+    - Streams approved referral payouts (or processing affiliate payouts) as a
+      NEFT/IMPS bulk-upload CSV from a server-side cursor, constant memory
+    - Applies the bank's reconciliation file back: successful rows complete
+      their payouts in set-based chunks, failures stay approved for a retry
+    """
+
+    def build_query(self, source: str):
+        if source == "referral":
+            query = (
+                select(
+                    ReferralPayout.payout_number,
+                    ReferralPayout.net_amount,
+                    ReferralPayout.tds_amount,
+                    ReferralPayout.bank_account_details,
+                    UserProfile.full_name,
+                    UserProfile.email,
+                )
+                .join(UserProfile, ReferralPayout.user_id == UserProfile.id)
+                .where(ReferralPayout.status == "approved")
+                .order_by(ReferralPayout.id)
+            )
+        else:
+            query = (
+                select(
+                    Payout.id,
+                    Payout.amount,
+                    Payout.payment_details,
+                    UserProfile.full_name,
+                    UserProfile.email,
+                )
+                .join(UserProfile, Payout.affiliate_user_id == UserProfile.id)
+                .where(Payout.status == PayoutStatus.PROCESSING, Payout.payment_method == "bank_transfer")
+                .order_by(Payout.id)
+            )
+        return query.execution_options(yield_per=TRANSFER_BATCH_SIZE)
+
+    async def stream_transfer_file(self, source: str, mode: str) -> AsyncIterator[bytes]:
+        """
+        Yield the bulk-upload CSV chunk by chunk.
+
+        Uses its own session: the request-scoped session from get_db may be
+        closed before a StreamingResponse finishes sending.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(TRANSFER_COLUMNS)
+        skipped: List[str] = []
+
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(self.build_query(source))
+            async for partition in result.partitions():
+                for row in partition:
+                    line = self._transfer_row(source, mode, row)
+                    if line is None:
+                        skipped.append(self._reference(source, row))
+                        continue
+                    writer.writerow(line)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+        if skipped:
+            # The file is already streaming, so there is no response body left to report in
+            logger.warning(
+                "Transfer file (%s): skipped %d payout(s) without usable bank details: %s",
+                source, len(skipped), ", ".join(skipped),
+            )
+
+    def streaming_response(self, source: str, mode: str) -> StreamingResponse:
+        """Validate parameters and wrap the transfer file in a StreamingResponse"""
+        mode = mode.upper()
+        if source not in TRANSFER_SOURCES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown payout source '{source}'. Use referral or affiliate",
+            )
+        if mode not in TRANSFER_MODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unsupported payment mode '{mode}'. Use NEFT or IMPS",
+            )
+
+        filename = f"{source}_payouts_{mode.lower()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        return StreamingResponse(
+            self.stream_transfer_file(source, mode),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    async def reconcile(self, db, lines: Iterable[str], processed_by: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Apply a bank reconciliation CSV (reference, status, UTR per row).
+
+        Successful rows complete their payouts chunk by chunk; failed rows are
+        reported and left approved so they go out with the next transfer file.
+        """
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames:
+            raise HTTPException(status_code=400, detail="Reconciliation file is empty")
+
+        headers = {name.strip().lower(): name for name in reader.fieldnames if name}
+        reference_col = self._pick_column(headers, RECONCILE_REFERENCE_COLUMNS)
+        status_col = self._pick_column(headers, RECONCILE_STATUS_COLUMNS)
+        utr_col = self._pick_column(headers, RECONCILE_UTR_COLUMNS)
+        if not reference_col or not status_col:
+            raise HTTPException(
+                status_code=400,
+                detail="Reconciliation file needs a payout reference column and a status column",
+            )
+
+        summary = {
+            "rows": 0,
+            "completed": 0,
+            "failed": [],
+            "not_completed": [],
+            "total_net_amount": 0.0,
+            "earnings_marked_paid": 0,
+        }
+        chunk: List[Dict[str, Optional[str]]] = []
+
+        for row in reader:
+            reference = (row.get(reference_col) or "").strip()
+            if not reference:
+                continue
+            summary["rows"] += 1
+
+            if (row.get(status_col) or "").strip().lower() not in RECONCILE_SUCCESS_STATUSES:
+                summary["failed"].append(reference)
+                continue
+
+            utr = (row.get(utr_col) or "").strip() if utr_col else ""
+            chunk.append({"reference": reference, "utr": utr or None})
+            if len(chunk) >= RECONCILE_CHUNK_SIZE:
+                await self._apply_chunk(db, chunk, summary, processed_by)
+                chunk = []
+
+        if chunk:
+            await self._apply_chunk(db, chunk, summary, processed_by)
+        return summary
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _apply_chunk(
+        self, db, chunk: List[Dict[str, Optional[str]]], summary: Dict[str, Any], processed_by: Optional[int]
+    ) -> None:
+        referral_rows = [r for r in chunk if not r["reference"].startswith(AFFILIATE_REFERENCE_PREFIX)]
+        affiliate_rows = [r for r in chunk if r["reference"].startswith(AFFILIATE_REFERENCE_PREFIX)]
+
+        if referral_rows:
+            references = [r["reference"] for r in referral_rows]
+            result = await db.execute(
+                select(ReferralPayout.id, ReferralPayout.payout_number)
+                .where(ReferralPayout.payout_number.in_(references))
+            )
+            ids_by_reference = {number: payout_id for payout_id, number in result.all()}
+
+            # Record the bank UTR before completing (only approved rows)
+            utr_rows = [
+                {"b_number": r["reference"], "b_utr": r["utr"]}
+                for r in referral_rows if r["utr"] and r["reference"] in ids_by_reference
+            ]
+            if utr_rows:
+                payouts = ReferralPayout.__table__
+                await db.execute(
+                    update(payouts)
+                    .where(payouts.c.payout_number == bindparam("b_number"), payouts.c.status == "approved")
+                    .values(payment_reference=bindparam("b_utr")),
+                    utr_rows,
+                )
+
+            done = set()
+            if ids_by_reference:
+                completed = await ReferralService().bulk_complete_payouts(db, list(ids_by_reference.values()))
+                done = set(completed["processed"])
+                summary["completed"] += len(done)
+                summary["total_net_amount"] += completed["total_net_amount"]
+                summary["earnings_marked_paid"] += completed["earnings_marked_paid"]
+            summary["not_completed"] += [
+                reference for reference in references if ids_by_reference.get(reference) not in done
+            ]
+
+        if affiliate_rows:
+            utr_by_id: Dict[int, Optional[str]] = {}
+            for r in affiliate_rows:
+                try:
+                    utr_by_id[int(r["reference"][len(AFFILIATE_REFERENCE_PREFIX):])] = r["utr"]
+                except ValueError:
+                    summary["not_completed"].append(r["reference"])
+            if not utr_by_id:
+                return
+
+            result = await db.execute(
+                update(Payout)
+                .where(Payout.id.in_(list(utr_by_id)), Payout.status == PayoutStatus.PROCESSING)
+                .values(status=PayoutStatus.COMPLETED, processed_at=datetime.utcnow(), processed_by=processed_by)
+                .returning(Payout.id, Payout.affiliate_user_id, Payout.amount)
+                .execution_options(synchronize_session=False)
+            )
+            completed = result.all()
+
+            affiliate_service = AffiliateService()
+            await AffiliateStatsService().apply(db, [
+                affiliate_service.payout_stats_movement(
+                    affiliate_user_id, Decimal(amount), PayoutStatus.PROCESSING, PayoutStatus.COMPLETED
+                )
+                for _, affiliate_user_id, amount in completed
+            ])
+
+            utr_rows = [
+                {"b_id": payout_id, "b_utr": utr_by_id[payout_id]}
+                for payout_id, _, _ in completed if utr_by_id.get(payout_id)
+            ]
+            if utr_rows:
+                payouts = Payout.__table__
+                await db.execute(
+                    update(payouts).where(payouts.c.id == bindparam("b_id")).values(transaction_id=bindparam("b_utr")),
+                    utr_rows,
+                )
+
+            # Commission allocation is FIFO per affiliate, so it stays per payout
+            for payout_id, affiliate_user_id, amount in completed:
+                await affiliate_service.mark_commissions_paid(db, affiliate_user_id, amount, payout_id)
+            await db.commit()
+
+            done = {payout_id for payout_id, _, _ in completed}
+            summary["completed"] += len(done)
+            summary["total_net_amount"] += float(sum((Decimal(amount) for _, _, amount in completed), Decimal("0")))
+            summary["not_completed"] += [
+                f"{AFFILIATE_REFERENCE_PREFIX}{payout_id}" for payout_id in utr_by_id if payout_id not in done
+            ]
+
+    @staticmethod
+    def _reference(source: str, row) -> str:
+        return row[0] if source == "referral" else f"{AFFILIATE_REFERENCE_PREFIX}{row[0]}"
+
+    def _transfer_row(self, source: str, mode: str, row) -> Optional[List[Any]]:
+        if source == "referral":
+            reference, amount, tds, details, full_name, email = row
+        else:
+            payout_id, amount, details, full_name, email = row
+            reference, tds = f"{AFFILIATE_REFERENCE_PREFIX}{payout_id}", Decimal("0")
+
+        details = self._bank_details(details)
+        account_number = str(details.get("account_number") or "").strip()
+        ifsc = str(details.get("ifsc_code") or details.get("ifsc") or "").strip().upper()
+        if not account_number or not ifsc:
+            return None
+
+        return [
+            mode,
+            details.get("account_holder") or full_name or "",
+            account_number,
+            ifsc,
+            details.get("bank_name") or "",
+            f"{Decimal(amount):.2f}",
+            f"{Decimal(tds or 0):.2f}",
+            reference,
+            email or "",
+            f"{source.title()} payout {reference}"[:30],
+        ]
+
+    @staticmethod
+    def _bank_details(details: Any) -> Dict[str, Any]:
+        # referral_payouts stores JSON, affiliate payouts a JSON string
+        if isinstance(details, str):
+            try:
+                details = json.loads(details)
+            except ValueError:
+                return {}
+        return details if isinstance(details, dict) else {}
+
+    @staticmethod
+    def _pick_column(headers: Dict[str, str], candidates) -> Optional[str]:
+        return next((headers[c] for c in candidates if c in headers), None)
@@ -8,6 +8,7 @@ from sqlalchemy import select
 from app.core.config import settings
 from app.models.order import Order
 from app.models.users import UserProfile
+from app.services.referral_code_index import normalize_code, referral_code_index
 
 
 class RazorpayService:
@@ -142,12 +143,20 @@ class RazorpayService:
         if not referral_code.startswith('REF'):
             return None
 
+        # Not gated on the existence filter: a code from another worker's
+        # new signup may not be indexed yet, and a miss here drops attribution
+        cached_id = referral_code_index.get_cached(("ref", normalize_code(referral_code)))
+        if cached_id is not None:
+            return cached_id
+
         try:
             user_id = int(referral_code[3:])
             result = await db.execute(
                 select(UserProfile).where(UserProfile.id == user_id)
             )
             user = result.scalar_one_or_none()
+            if user:
+                referral_code_index.remember(("ref", normalize_code(referral_code)), user.id)
             return user.id if user else None
         except (ValueError, IndexError):
             return None
@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, delete, func, insert, literal, select, true, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.referrals import ReferralClosure
+from app.models.users import UserProfile
+
+
+class ReferralClosureService:
+    """
+    Maintains and queries the referral closure table:
+    - Links a user under a referrer (moving their whole downline with them)
+    - Upline chain of a user in one query
+    - Downline counts per level and team listings in one query
+    Writes are not committed here; callers commit with their own changes.
+    """
+
+    async def link_user(self, db: AsyncSession, user_id: int, referrer_id: int) -> None:
+        """
+        Place user_id (and their existing downline) under referrer_id.
+
+        Raises ValueError if the link would create a cycle.
+        """
+        if user_id == referrer_id or await self.is_descendant(db, user_id, referrer_id):
+            raise ValueError(f"Referral cycle: user {referrer_id} is in the downline of user {user_id}")
+
+        subtree = union_all(
+            select(literal(user_id, Integer).label("node"), literal(0, Integer).label("depth")),
+            select(ReferralClosure.descendant_id, ReferralClosure.depth)
+            .where(ReferralClosure.ancestor_id == user_id),
+        ).subquery("subtree")
+        upline = union_all(
+            select(literal(referrer_id, Integer).label("node"), literal(0, Integer).label("depth")),
+            select(ReferralClosure.ancestor_id, ReferralClosure.depth)
+            .where(ReferralClosure.descendant_id == referrer_id),
+        ).subquery("upline")
+
+        # Detach the subtree from its previous upline, if any
+        await db.execute(
+            delete(ReferralClosure).where(
+                ReferralClosure.descendant_id.in_(select(subtree.c.node)),
+                ReferralClosure.ancestor_id.not_in(select(subtree.c.node)),
+            )
+        )
+
+        # Every new ancestor x every node of the subtree
+        await db.execute(
+            insert(ReferralClosure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    upline.c.node,
+                    subtree.c.node,
+                    upline.c.depth + subtree.c.depth + 1,
+                ).select_from(upline.join(subtree, true())),
+            )
+        )
+
+    async def is_descendant(self, db: AsyncSession, ancestor_id: int, user_id: int) -> bool:
+        """Whether user_id is anywhere in the downline of ancestor_id"""
+        result = await db.execute(
+            select(ReferralClosure.depth).where(
+                ReferralClosure.ancestor_id == ancestor_id,
+                ReferralClosure.descendant_id == user_id,
+            )
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def get_upline(
+        self, db: AsyncSession, user_id: int, max_depth: int = 3
+    ) -> Dict[int, int]:
+        """Ancestors of a user keyed by depth (1 = direct referrer)"""
+        result = await db.execute(
+            select(ReferralClosure.depth, ReferralClosure.ancestor_id)
+            .where(
+                ReferralClosure.descendant_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .order_by(ReferralClosure.depth)
+        )
+        return {depth: ancestor_id for depth, ancestor_id in result.all()}
+
+    async def get_downline_counts(
+        self, db: AsyncSession, user_id: int, max_depth: int = 3
+    ) -> Dict[int, int]:
+        """Number of referred users per level, levels 1..max_depth always present"""
+        result = await db.execute(
+            select(ReferralClosure.depth, func.count())
+            .where(
+                ReferralClosure.ancestor_id == user_id,
+                ReferralClosure.depth <= max_depth,
+            )
+            .group_by(ReferralClosure.depth)
+        )
+        counts = {depth: 0 for depth in range(1, max_depth + 1)}
+        counts.update({depth: count for depth, count in result.all()})
+        return counts
+
+    async def get_team(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        depth: Optional[int] = None,
+        max_depth: int = 3,
+        skip: int = 0,
+        limit: int = 50,
+    ) -> Tuple[List[Tuple[UserProfile, int]], int]:
+        """Downline users with their level, optionally limited to one level, plus the total count"""
+        conditions = [ReferralClosure.ancestor_id == user_id]
+        if depth is not None:
+            conditions.append(ReferralClosure.depth == depth)
+        else:
+            conditions.append(ReferralClosure.depth <= max_depth)
+
+        total_result = await db.execute(
+            select(func.count()).select_from(ReferralClosure).where(*conditions)
+        )
+        total = total_result.scalar() or 0
+
+        result = await db.execute(
+            select(UserProfile, ReferralClosure.depth)
+            .join(ReferralClosure, ReferralClosure.descendant_id == UserProfile.id)
+            .where(*conditions)
+            .order_by(ReferralClosure.depth, UserProfile.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return [(user, level) for user, level in result.all()], total
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.affiliate import AffiliateSubscription
+from app.models.users import UserProfile
+
+
+# Rows fetched per round trip while (re)building
+LOAD_BATCH_SIZE = 10000
+
+# Catch-up re-reads this many ids below the last one seen, so rows committed
+# slightly out of id order are not missed
+SYNC_ID_OVERLAP = 500
+
+
+def user_ref_code(user_id: int) -> str:
+    """Id-derived code accepted at checkout (RazorpayService), e.g. REF0042"""
+    return f"REF{user_id:04d}"
+
+
+def normalize_code(code: str) -> str:
+    """
+    Form a code is indexed and looked up under: trimmed, upper-cased, and
+    REF<digits> re-padded like user_ref_code, since checkout parses the id
+    with int() and accepts REF42 as well as REF0042
+    """
+    code = code.strip().upper()
+    if code.startswith("REF") and code[3:].isdigit():
+        return user_ref_code(int(code[3:]))
+    return code
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (blake2b double hashing)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        new = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                new = True
+        # Re-adding a known item (catch-up overlap) does not count towards capacity
+        if new:
+            self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class ReferralCodeIndex:
+    """
+    Per-process existence filter for referral codes:
+    - Bloom filter over affiliate codes, user referral codes and the
+      id-derived REF codes (all in normalize_code form); a miss means the
+      code did not exist at the last sync
+    - Built at startup, extended in place when codes are created here, and
+      caught up with rows from other workers at most every
+      REFERRAL_CODE_SYNC_SECONDS (fully rebuilt every
+      REFERRAL_CODE_FILTER_REBUILD_SECONDS)
+    - Small TTL cache for positive lookups, so repeated validations of a
+      real code skip the database as well
+    Codes created on another worker since the last sync are still misses,
+    so signup and checkout query the database instead of rejecting on a
+    miss; only best-effort paths (validation UI, click tracking) trust it.
+    """
+
+    def __init__(self):
+        self._filter: Optional[BloomFilter] = None
+        self._last_user_id = 0
+        self._last_affiliate_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._positive: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    async def might_exist(self, db: AsyncSession, code: Optional[str]) -> bool:
+        """False when the code was unknown at the last sync (no query needed)"""
+        if not code or not code.strip():
+            return False
+        await self._ensure_fresh(db)
+        return normalize_code(code) in self._filter
+
+    def add(self, *codes: Optional[str]) -> None:
+        """Record codes created by this worker right away"""
+        if self._filter is None:
+            return
+        for code in codes:
+            if code:
+                self._filter.add(normalize_code(code))
+
+    def get_cached(self, key: Hashable) -> Any:
+        entry = self._positive.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._positive.pop(key, None)
+            return None
+        self._positive.move_to_end(key)
+        return value
+
+    def remember(self, key: Hashable, value: Any) -> None:
+        """Cache a positive lookup for REFERRAL_CODE_CACHE_TTL_SECONDS"""
+        self._positive[key] = (time.monotonic() + settings.REFERRAL_CODE_CACHE_TTL_SECONDS, value)
+        self._positive.move_to_end(key)
+        while len(self._positive) > settings.REFERRAL_CODE_CACHE_SIZE:
+            self._positive.popitem(last=False)
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """Load every code from scratch; returns the number of codes indexed"""
+        async with self._lock:
+            await self._rebuild(db)
+            return self._filter.count
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _ensure_fresh(self, db: AsyncSession) -> None:
+        now = time.monotonic()
+        if self._filter is not None and now - self._synced_at < settings.REFERRAL_CODE_SYNC_SECONDS:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            if self._filter is not None and now - self._synced_at < settings.REFERRAL_CODE_SYNC_SECONDS:
+                return
+            if (
+                self._filter is None
+                or self._filter.count > self._filter.capacity
+                or now - self._built_at >= settings.REFERRAL_CODE_FILTER_REBUILD_SECONDS
+            ):
+                await self._rebuild(db)
+            else:
+                await self._load_since(db, self._filter, self._last_user_id - SYNC_ID_OVERLAP,
+                                       self._last_affiliate_id - SYNC_ID_OVERLAP)
+                self._synced_at = time.monotonic()
+
+    async def _rebuild(self, db: AsyncSession) -> None:
+        max_user_id = (await db.execute(select(func.max(UserProfile.id)))).scalar() or 0
+        max_affiliate_id = (await db.execute(select(func.max(AffiliateSubscription.id)))).scalar() or 0
+
+        # Ids bound the number of codes; headroom covers growth until the next rebuild
+        expected = 2 * max_user_id + max_affiliate_id
+        bloom = BloomFilter(int(expected * 1.5) + 10000, settings.REFERRAL_CODE_FILTER_ERROR_RATE)
+        self._last_user_id = 0
+        self._last_affiliate_id = 0
+        await self._load_since(db, bloom, 0, 0)
+
+        self._filter = bloom
+        self._built_at = self._synced_at = time.monotonic()
+
+    async def _load_since(self, db: AsyncSession, bloom: BloomFilter, user_id: int, affiliate_id: int) -> None:
+        result = await db.stream(
+            select(UserProfile.id, UserProfile.referral_code)
+            .where(UserProfile.id > user_id)
+            .order_by(UserProfile.id)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for row_id, code in result:
+            self._add_all(bloom, (user_ref_code(row_id), code))
+            self._last_user_id = max(self._last_user_id, row_id)
+
+        result = await db.stream(
+            select(AffiliateSubscription.id, AffiliateSubscription.referral_code)
+            .where(AffiliateSubscription.id > affiliate_id)
+            .order_by(AffiliateSubscription.id)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for row_id, code in result:
+            self._add_all(bloom, (code,))
+            self._last_affiliate_id = max(self._last_affiliate_id, row_id)
+
+    @staticmethod
+    def _add_all(bloom: BloomFilter, codes: Iterable[Optional[str]]) -> None:
+        for code in codes:
+            if code:
+                bloom.add(normalize_code(code))
+
+
+# Shared by every request handled by this worker process
+referral_code_index = ReferralCodeIndex()
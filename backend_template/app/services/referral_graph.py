@@ -0,0 +1,407 @@
+import asyncio
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.referrals import ReferralClosure
+from app.models.users import UserProfile
+
+
+# Rows fetched per round trip while (re)building
+LOAD_BATCH_SIZE = 10000
+
+# Catch-up re-reads this many ids below the last one seen, so links
+# committed slightly out of id order are not missed
+SYNC_ID_OVERLAP = 500
+
+# Levels whose per-node counts are kept in arrays (the commission depth)
+TRACKED_LEVELS = 3
+
+ITEM_SIZE = array("i").itemsize
+
+
+def _zeros(size: int) -> array:
+    return array("i", bytes(ITEM_SIZE * size))
+
+
+class ReferralGraph:
+    """
+    Referral tree held in flat int arrays indexed by user id:
+    - parent[id]: direct referrer (0 = none)
+    - CSR child lists (child_offsets / children) built from the snapshot;
+      links added afterwards go to a small per-parent overlay
+    - team_size[id] and level_counts[k][id] (k = 1..3) maintained on every
+      link, so subtree sizes and per-level counts are O(1) and upline
+      chains / descendant checks are O(depth)
+    Around 28 bytes per user (see scripts/benchmark_referral_graph.py).
+    Cycles found in the snapshot are cut in memory and listed in `cycles`.
+    """
+
+    def __init__(self, size: int = 0):
+        self.parent = _zeros(size)
+        self.team_size = _zeros(size)
+        self.level_counts = [_zeros(size) for _ in range(TRACKED_LEVELS)]
+        self.child_offsets = _zeros(1)
+        self.children = _zeros(0)
+        self.cycles: List[List[int]] = []
+        self._extra_children: Dict[int, List[int]] = {}
+        self.edges = 0
+
+    @classmethod
+    def from_edges(cls, size: int, edges: Iterable[Tuple[int, int]]) -> "ReferralGraph":
+        """Build from (user_id, referrer_id) pairs; ids must be below size"""
+        graph = cls(size)
+        parent = graph.parent
+        for user_id, referrer_id in edges:
+            parent[user_id] = referrer_id
+        graph._index()
+        return graph
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def get_parent(self, user_id: int) -> int:
+        return self.parent[user_id] if 0 < user_id < len(self.parent) else 0
+
+    def get_children(self, user_id: int) -> List[int]:
+        """Direct referrals of a user"""
+        if not 0 < user_id < len(self.parent):
+            return []
+        parent = self.parent
+        members = []
+        if user_id < len(self.child_offsets) - 1:
+            members = [
+                child for child in self.children[self.child_offsets[user_id]:self.child_offsets[user_id + 1]]
+                if parent[child] == user_id
+            ]
+        extra = self._extra_children.get(user_id)
+        if extra:
+            members.extend(child for child in extra if parent[child] == user_id)
+        return members
+
+    def get_upline(self, user_id: int, max_depth: int = TRACKED_LEVELS) -> Dict[int, int]:
+        """Ancestors of a user keyed by depth (1 = direct referrer)"""
+        upline = {}
+        ancestor = self.get_parent(user_id)
+        depth = 1
+        while ancestor and depth <= max_depth:
+            upline[depth] = ancestor
+            ancestor = self.parent[ancestor]
+            depth += 1
+        return upline
+
+    def is_descendant(self, ancestor_id: int, user_id: int) -> bool:
+        """Whether user_id is anywhere in the downline of ancestor_id"""
+        ancestor = self.get_parent(user_id)
+        while ancestor:
+            if ancestor == ancestor_id:
+                return True
+            ancestor = self.parent[ancestor]
+        return False
+
+    def get_team_size(self, user_id: int) -> int:
+        """Downline size at every depth"""
+        return self.team_size[user_id] if 0 < user_id < len(self.parent) else 0
+
+    def get_downline_counts(self, user_id: int, max_depth: int = TRACKED_LEVELS) -> Dict[int, int]:
+        """Number of referred users per level, levels 1..max_depth always present"""
+        if not 0 < user_id < len(self.parent):
+            return {depth: 0 for depth in range(1, max_depth + 1)}
+        if max_depth <= TRACKED_LEVELS:
+            return {depth: self.level_counts[depth - 1][user_id] for depth in range(1, max_depth + 1)}
+        return {depth: len(members) for depth, members in self.get_levels(user_id, max_depth).items()}
+
+    def get_levels(self, user_id: int, max_depth: int = TRACKED_LEVELS) -> Dict[int, List[int]]:
+        """Downline user ids per level, levels 1..max_depth always present"""
+        levels = {}
+        frontier = [user_id]
+        for depth in range(1, max_depth + 1):
+            frontier = [child for member in frontier for child in self.get_children(member)]
+            levels[depth] = frontier
+        return levels
+
+    def link(self, user_id: int, referrer_id: int) -> bool:
+        """
+        Place user_id (and their downline) under referrer_id. Returns False
+        when the link already exists.
+
+        Raises ValueError if the link would create a cycle.
+        """
+        if user_id == referrer_id or self.is_descendant(user_id, referrer_id):
+            raise ValueError(f"Referral cycle: user {referrer_id} is in the downline of user {user_id}")
+        if max(user_id, referrer_id) >= len(self.parent):
+            self._grow(max(user_id, referrer_id) + 1)
+
+        previous = self.parent[user_id]
+        if previous == referrer_id:
+            return False
+        if previous:
+            self._move(user_id, previous, -1)
+        else:
+            self.edges += 1
+        self.parent[user_id] = referrer_id
+        self._move(user_id, referrer_id, 1)
+
+        in_snapshot = referrer_id < len(self.child_offsets) - 1 and user_id in self.children[
+            self.child_offsets[referrer_id]:self.child_offsets[referrer_id + 1]
+        ]
+        if not in_snapshot:
+            extra = self._extra_children.setdefault(referrer_id, [])
+            # A user moved away and back keeps their earlier overlay entry
+            if user_id not in extra:
+                extra.append(user_id)
+        return True
+
+    def memory_bytes(self) -> int:
+        arrays = [self.parent, self.team_size, self.child_offsets, self.children, *self.level_counts]
+        total = sum(sys.getsizeof(values) for values in arrays)
+        total += sys.getsizeof(self._extra_children)
+        total += sum(sys.getsizeof(members) for members in self._extra_children.values())
+        return total
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    def _grow(self, size: int) -> None:
+        # Room for the ids of the next signups without growing on each one
+        size = max(size, len(self.parent) + len(self.parent) // 4)
+        extra = size - len(self.parent)
+        for values in (self.parent, self.team_size, *self.level_counts):
+            values.frombytes(bytes(ITEM_SIZE * extra))
+
+    def _move(self, user_id: int, referrer_id: int, sign: int) -> None:
+        """Add (sign=1) or remove (sign=-1) user_id's subtree from every ancestor from referrer_id up"""
+        moved = sign * (self.team_size[user_id] + 1)
+        # Members of the subtree at distance 0, 1, 2 from user_id
+        below = (sign, sign * self.level_counts[0][user_id], sign * self.level_counts[1][user_id])
+
+        ancestor = referrer_id
+        distance = 1
+        while ancestor:
+            self.team_size[ancestor] += moved
+            for level in range(distance, TRACKED_LEVELS + 1):
+                self.level_counts[level - 1][ancestor] += below[level - distance]
+            ancestor = self.parent[ancestor]
+            distance += 1
+
+    def _index(self) -> None:
+        """CSR child lists, cycle cuts and per-node counts from the parent array"""
+        parent = self.parent
+        size = len(parent)
+
+        offsets = _zeros(size + 1)
+        for user_id in range(1, size):
+            if parent[user_id]:
+                offsets[parent[user_id] + 1] += 1
+        for user_id in range(size):
+            offsets[user_id + 1] += offsets[user_id]
+
+        children = _zeros(offsets[size])
+        fill = offsets[:size]
+        for user_id in range(1, size):
+            referrer_id = parent[user_id]
+            if referrer_id:
+                children[fill[referrer_id]] = user_id
+                fill[referrer_id] += 1
+
+        self.child_offsets = offsets
+        self.children = children
+        self._extra_children = {}
+        self.edges = offsets[size]
+
+        # Breadth-first from the roots: every referrer comes before its referrals
+        order = array("i", [user_id for user_id in range(1, size) if not parent[user_id]])
+        self._extend_order(order, 0)
+        if len(order) < size - 1:
+            self._cut_cycles(order)
+
+        team_size = self.team_size
+        level_1, level_2, level_3 = self.level_counts
+        for index in range(len(order) - 1, -1, -1):
+            user_id = order[index]
+            referrer_id = parent[user_id]
+            if referrer_id:
+                team_size[referrer_id] += team_size[user_id] + 1
+                level_1[referrer_id] += 1
+                level_2[referrer_id] += level_1[user_id]
+                level_3[referrer_id] += level_2[user_id]
+
+    def _extend_order(self, order: array, start: int) -> None:
+        index = start
+        while index < len(order):
+            order.extend(self.get_children(order[index]))
+            index += 1
+
+    def _cut_cycles(self, order: array) -> None:
+        """Nodes never reached from a root hang off a cycle; cut each cycle at one node"""
+        parent = self.parent
+        state = bytearray(len(parent))  # 0 = unseen, 1 = on the current walk, 2 = placed
+        for user_id in order:
+            state[user_id] = 2
+
+        for user_id in range(1, len(parent)):
+            if state[user_id]:
+                continue
+            walk = []
+            node = user_id
+            while not state[node]:
+                state[node] = 1
+                walk.append(node)
+                node = parent[node]
+            if state[node] == 1:
+                cycle = walk[walk.index(node):]
+                self.cycles.append(cycle)
+                parent[node] = 0
+                self.edges -= 1
+                start = len(order)
+                order.append(node)
+                self._extend_order(order, start)
+                for member in order[start:]:
+                    state[member] = 2
+            for node in walk:
+                state[node] = 2
+
+
+class ReferralGraphIndex:
+    """
+    Optional per-process copy of the referral tree (REFERRAL_GRAPH_ENABLED):
+    - Loaded from the depth-1 rows of referral_closure, then kept current
+      with links made by this worker and, at most every
+      REFERRAL_GRAPH_SYNC_SECONDS, links to new users made by other
+      workers; fully reloaded every REFERRAL_GRAPH_REBUILD_SECONDS (which
+      also picks up existing users re-linked elsewhere)
+    - Serves read paths (stats, team listings, cycle audits); commission
+      attribution and link_user keep using the closure table inside their
+      transaction
+    - While a reload runs, other requests keep reading the previous graph
+    """
+
+    def __init__(self):
+        self._graph: Optional[ReferralGraph] = None
+        self._last_user_id = 0
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self._stale = False
+        self._lock = asyncio.Lock()
+        self._metrics = {
+            "rebuilds": 0,
+            "syncs": 0,
+            "links_applied": 0,
+            "link_conflicts": 0,
+            "build_seconds": 0.0,
+        }
+
+    async def get(self, db: AsyncSession) -> Optional[ReferralGraph]:
+        """Current graph, or None when the in-process graph is disabled"""
+        if not settings.REFERRAL_GRAPH_ENABLED:
+            return None
+        await self._ensure_fresh(db)
+        return self._graph
+
+    def link(self, user_id: int, referrer_id: int) -> None:
+        """Record a committed link made by this worker right away"""
+        if self._graph is None:
+            return
+        try:
+            if self._graph.link(user_id, referrer_id):
+                self._metrics["links_applied"] += 1
+        except ValueError:
+            # Out of order with the database; reload on the next read
+            self._metrics["link_conflicts"] += 1
+            self._stale = True
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """Load the whole tree from scratch; returns the number of links"""
+        async with self._lock:
+            await self._rebuild(db)
+            return self._graph.edges
+
+    def metrics(self) -> Dict[str, Any]:
+        graph = self._graph
+        return {
+            **self._metrics,
+            "enabled": settings.REFERRAL_GRAPH_ENABLED,
+            "loaded": graph is not None,
+            "users": len(graph) if graph else 0,
+            "links": graph.edges if graph else 0,
+            "memory_bytes": graph.memory_bytes() if graph else 0,
+            "cycles": graph.cycles if graph else [],
+        }
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    def _due(self) -> bool:
+        return (
+            self._graph is None
+            or self._stale
+            or time.monotonic() - self._synced_at >= settings.REFERRAL_GRAPH_SYNC_SECONDS
+        )
+
+    async def _ensure_fresh(self, db: AsyncSession) -> None:
+        if not self._due():
+            return
+        # A reload is running elsewhere: keep serving the current graph
+        if self._graph is not None and self._lock.locked():
+            return
+
+        async with self._lock:
+            if not self._due():
+                return
+            if (
+                self._graph is None
+                or self._stale
+                or time.monotonic() - self._built_at >= settings.REFERRAL_GRAPH_REBUILD_SECONDS
+            ):
+                await self._rebuild(db)
+            else:
+                await self._sync(db)
+
+    async def _rebuild(self, db: AsyncSession) -> None:
+        started = time.perf_counter()
+        max_user_id = (await db.execute(select(func.max(UserProfile.id)))).scalar() or 0
+
+        user_ids, referrer_ids = array("i"), array("i")
+        result = await db.stream(
+            select(ReferralClosure.descendant_id, ReferralClosure.ancestor_id)
+            .where(ReferralClosure.depth == 1)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for user_id, referrer_id in result:
+            user_ids.append(user_id)
+            referrer_ids.append(referrer_id)
+
+        size = max(max_user_id, max(user_ids, default=0), max(referrer_ids, default=0)) + 1
+        # Indexing a million users is CPU work; a thread keeps the event loop responsive
+        self._graph = await asyncio.to_thread(ReferralGraph.from_edges, size, zip(user_ids, referrer_ids))
+        self._last_user_id = max(user_ids, default=0)
+        self._stale = False
+        self._built_at = self._synced_at = time.monotonic()
+        self._metrics["rebuilds"] += 1
+        self._metrics["build_seconds"] += time.perf_counter() - started
+
+    async def _sync(self, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(ReferralClosure.descendant_id, ReferralClosure.ancestor_id)
+            .where(
+                ReferralClosure.descendant_id > self._last_user_id - SYNC_ID_OVERLAP,
+                ReferralClosure.depth == 1,
+            )
+            .order_by(ReferralClosure.descendant_id)
+        )
+        for user_id, referrer_id in result.all():
+            self.link(user_id, referrer_id)
+            self._last_user_id = max(self._last_user_id, user_id)
+        self._synced_at = time.monotonic()
+        self._metrics["syncs"] += 1
+
+
+# Shared by every request handled by this worker process
+referral_graph_index = ReferralGraphIndex()
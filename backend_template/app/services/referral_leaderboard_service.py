@@ -0,0 +1,172 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import String, and_, delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.config import settings
+from app.models.referrals import ReferralBalance, ReferralClosure, ReferralEarning, ReferralLeaderboardEntry
+from app.models.users import UserProfile
+
+
+LEADERBOARD_PERIODS = ("week", "month", "all_time")
+
+
+class ReferralLeaderboardService:
+    """
+    Precomputed referral leaderboard:
+    - refresh() rebuilds the top REFERRAL_LEADERBOARD_SIZE rows per period in
+      SQL (top-N aggregate, then row_number() over the N survivors)
+    - get_leaderboard() serves reads from a per-process cache that expires
+      after REFERRAL_LEADERBOARD_CACHE_SECONDS, so anonymous traffic does not
+      reach the database
+    Week and month rank earnings made in the period; all-time ranks the
+    ledger balance snapshot.
+    """
+
+    # period -> (loaded_at monotonic, payload)
+    _cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    async def refresh(self, db: AsyncSession, periods: Optional[List[str]] = None) -> Dict[str, int]:
+        """Rebuild the given periods (default all) in one transaction; returns rows per period"""
+        periods = periods or list(LEADERBOARD_PERIODS)
+        for period in periods:
+            self._check_period(period)
+
+        now = datetime.now(timezone.utc)
+        written = {}
+        for period in periods:
+            period_start = self._period_start(period, now)
+            top = self._top_earners(period, period_start)
+
+            # Only evaluated for the N ranked users
+            referred = aliased(UserProfile)
+            active_referrals = (
+                select(func.count())
+                .select_from(ReferralClosure)
+                .join(referred, referred.id == ReferralClosure.descendant_id)
+                .where(
+                    ReferralClosure.ancestor_id == top.c.user_id,
+                    ReferralClosure.depth == 1,
+                    referred.subscription_status == "active",
+                )
+                .scalar_subquery()
+            )
+            ranked = (
+                select(
+                    literal(period, String),
+                    func.row_number().over(order_by=(top.c.earnings.desc(), top.c.user_id)),
+                    top.c.user_id,
+                    UserProfile.full_name,
+                    top.c.earnings,
+                    func.coalesce(UserProfile.total_referrals, 0),
+                    active_referrals,
+                    literal(period_start, ReferralLeaderboardEntry.period_start.type),
+                    literal(now, ReferralLeaderboardEntry.refreshed_at.type),
+                )
+                .select_from(top)
+                .join(UserProfile, UserProfile.id == top.c.user_id)
+            )
+
+            # Readers keep seeing the previous rows until commit
+            await db.execute(delete(ReferralLeaderboardEntry).where(ReferralLeaderboardEntry.period == period))
+            result = await db.execute(
+                insert(ReferralLeaderboardEntry).from_select(
+                    [
+                        "period", "rank", "user_id", "user_name", "total_earnings",
+                        "total_referrals", "active_referrals", "period_start", "refreshed_at",
+                    ],
+                    ranked,
+                )
+            )
+            written[period] = result.rowcount
+
+        await db.commit()
+        for period in periods:
+            self._cache.pop(period, None)
+        return written
+
+    async def get_leaderboard(self, db: AsyncSession, period: str = "month", limit: int = 10) -> Dict[str, Any]:
+        """Top `limit` entries of a period, served from the in-process cache"""
+        self._check_period(period)
+        limit = max(1, min(limit, settings.REFERRAL_LEADERBOARD_SIZE))
+
+        cached = self._cache.get(period)
+        if cached is None or time.monotonic() - cached[0] >= settings.REFERRAL_LEADERBOARD_CACHE_SECONDS:
+            result = await db.execute(
+                select(ReferralLeaderboardEntry)
+                .where(ReferralLeaderboardEntry.period == period)
+                .order_by(ReferralLeaderboardEntry.rank)
+            )
+            rows = result.scalars().all()
+            payload = {
+                "period": period,
+                "period_start": rows[0].period_start if rows else None,
+                "refreshed_at": rows[0].refreshed_at if rows else None,
+                "entries": [
+                    {
+                        "rank": row.rank,
+                        "user_id": row.user_id,
+                        "user_name": row.user_name,
+                        "total_earnings": row.total_earnings,
+                        "total_referrals": row.total_referrals,
+                        "active_referrals": row.active_referrals,
+                    }
+                    for row in rows
+                ],
+            }
+            cached = (time.monotonic(), payload)
+            self._cache[period] = cached
+
+        payload = cached[1]
+        return {**payload, "entries": payload["entries"][:limit]}
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    def _top_earners(self, period: str, period_start: Optional[datetime]):
+        """Top-N (user_id, earnings) for a period; Postgres sorts this with a bounded heap"""
+        size = settings.REFERRAL_LEADERBOARD_SIZE
+        if period == "all_time":
+            query = (
+                select(ReferralBalance.user_id, ReferralBalance.total_earnings.label("earnings"))
+                .where(ReferralBalance.total_earnings > 0)
+                .order_by(ReferralBalance.total_earnings.desc(), ReferralBalance.user_id)
+            )
+        else:
+            earnings = func.sum(ReferralEarning.commission_amount)
+            query = (
+                select(ReferralEarning.user_id, earnings.label("earnings"))
+                .where(
+                    and_(
+                        ReferralEarning.earned_at >= period_start,
+                        ReferralEarning.status != "reversed",
+                    )
+                )
+                .group_by(ReferralEarning.user_id)
+                .having(earnings > 0)
+                .order_by(earnings.desc(), ReferralEarning.user_id)
+            )
+        return query.limit(size).subquery("top")
+
+    @staticmethod
+    def _period_start(period: str, now: datetime) -> Optional[datetime]:
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        if period == "week":
+            # Weeks start on Monday
+            return today - timedelta(days=today.weekday())
+        if period == "month":
+            return today.replace(day=1)
+        return None
+
+    @staticmethod
+    def _check_period(period: str) -> None:
+        if period not in LEADERBOARD_PERIODS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown leaderboard period '{period}'. Use one of: {', '.join(LEADERBOARD_PERIODS)}",
+            )
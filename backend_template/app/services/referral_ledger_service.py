@@ -0,0 +1,369 @@
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.referrals import (
+    ReferralBalance, ReferralEarning, ReferralLedgerEntry, ReferralPayout
+)
+from app.models.users import UserProfile
+
+
+ZERO = Decimal("0.00")
+
+# Payout statuses whose net amount has left the available balance for good
+WITHDRAWN_PAYOUT_STATUSES = ("approved", "completed")
+
+
+class ReferralLedgerService:
+    """
+    Append-only referral balance ledger with a per-user running snapshot:
+    - Every earning, reversal and payout state change appends a ledger row
+    - referral_balances is updated in the same statement-level upsert, so
+      concurrent writers for one user serialize on that row
+    - UserProfile.total_earnings / available_balance mirror the snapshot
+    - verify_balances recomputes balances from the raw tables
+    Nothing is committed here; callers commit with their own changes.
+    """
+
+    async def record_earning(self, db: AsyncSession, earning: ReferralEarning) -> ReferralLedgerEntry:
+        """Credit a new earning (flushes it first to get its id)"""
+        if earning.id is None:
+            await db.flush()
+        return await self._append(
+            db, earning.user_id, "earning",
+            earnings=Decimal(earning.commission_amount),
+            earning_id=earning.id,
+        )
+
+    async def record_earnings_bulk(
+        self, db: AsyncSession, earnings: List[Tuple[int, int, Decimal]]
+    ) -> None:
+        """Credit many earnings at once, given as (earning_id, user_id, amount)"""
+        await self._append_bulk(db, "earning", [
+            {"user_id": user_id, "earnings": amount, "earning_id": earning_id}
+            for earning_id, user_id, amount in earnings
+        ])
+
+    async def record_reversals_bulk(
+        self, db: AsyncSession, earnings: List[Tuple[int, int, Decimal]], reason: Optional[str] = None
+    ) -> None:
+        """Debit many earnings that were already marked reversed, given as (earning_id, user_id, amount)"""
+        await self._append_bulk(db, "reversal", [
+            {"user_id": user_id, "earnings": -amount, "earning_id": earning_id, "note": reason}
+            for earning_id, user_id, amount in earnings
+        ])
+
+    async def record_payouts_approved_bulk(
+        self, db: AsyncSession, payouts: List[Tuple[int, int, Decimal]]
+    ) -> None:
+        """Move many approved payouts from pending to withdrawn, given as (payout_id, user_id, net_amount)"""
+        await self._append_bulk(db, "payout_approved", [
+            {"user_id": user_id, "pending": -amount, "withdrawn": amount, "payout_id": payout_id}
+            for payout_id, user_id, amount in payouts
+        ])
+
+    async def reverse_earning(
+        self, db: AsyncSession, earning_id: int, reason: Optional[str] = None
+    ) -> ReferralLedgerEntry:
+        """Mark an earning as reversed and debit it from the balance"""
+        result = await db.execute(
+            select(ReferralEarning).where(ReferralEarning.id == earning_id).with_for_update()
+        )
+        earning = result.scalar_one_or_none()
+        if not earning:
+            raise HTTPException(status_code=404, detail="Earning not found")
+        if earning.status in ("reversed", "paid"):
+            raise HTTPException(status_code=400, detail=f"Earning is already {earning.status}")
+
+        earning.status = "reversed"
+        return await self._append(
+            db, earning.user_id, "reversal",
+            earnings=-Decimal(earning.commission_amount),
+            earning_id=earning.id,
+            note=reason,
+        )
+
+    async def record_payout_requested(self, db: AsyncSession, payout: ReferralPayout) -> ReferralLedgerEntry:
+        if payout.id is None:
+            await db.flush()
+        return await self._append(
+            db, payout.user_id, "payout_requested",
+            pending=Decimal(payout.net_amount),
+            payout_id=payout.id,
+        )
+
+    async def record_payout_rejected(self, db: AsyncSession, payout: ReferralPayout) -> ReferralLedgerEntry:
+        return await self._append(
+            db, payout.user_id, "payout_rejected",
+            pending=-Decimal(payout.net_amount),
+            payout_id=payout.id,
+            note=payout.rejected_reason,
+        )
+
+    async def record_payout_approved(self, db: AsyncSession, payout: ReferralPayout) -> ReferralLedgerEntry:
+        return await self._append(
+            db, payout.user_id, "payout_approved",
+            pending=-Decimal(payout.net_amount),
+            withdrawn=Decimal(payout.net_amount),
+            payout_id=payout.id,
+        )
+
+    async def get_balance(self, db: AsyncSession, user_id: int) -> Optional[ReferralBalance]:
+        result = await db.execute(
+            select(ReferralBalance)
+            .where(ReferralBalance.user_id == user_id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_entries(
+        self, db: AsyncSession, user_id: int, skip: int = 0, limit: int = 50
+    ) -> List[ReferralLedgerEntry]:
+        result = await db.execute(
+            select(ReferralLedgerEntry)
+            .where(ReferralLedgerEntry.user_id == user_id)
+            .order_by(ReferralLedgerEntry.id.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return result.scalars().all()
+
+    # ---------------------
+    # Consistency checks
+    # ---------------------
+
+    async def compute_balances(
+        self, db: AsyncSession, user_ids: Optional[Iterable[int]] = None
+    ) -> Dict[int, Dict[str, Decimal]]:
+        """Balances recomputed from referral_earnings and referral_payouts"""
+        user_ids = list(user_ids) if user_ids is not None else None
+
+        earnings_query = (
+            select(ReferralEarning.user_id, func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
+            .where(ReferralEarning.status != "reversed")
+            .group_by(ReferralEarning.user_id)
+        )
+        pending_sum = func.sum(ReferralPayout.net_amount).filter(ReferralPayout.status == "requested")
+        withdrawn_sum = func.sum(ReferralPayout.net_amount).filter(
+            ReferralPayout.status.in_(WITHDRAWN_PAYOUT_STATUSES)
+        )
+        payouts_query = (
+            select(
+                ReferralPayout.user_id,
+                func.coalesce(pending_sum, 0),
+                func.coalesce(withdrawn_sum, 0),
+            )
+            .group_by(ReferralPayout.user_id)
+        )
+        if user_ids is not None:
+            earnings_query = earnings_query.where(ReferralEarning.user_id.in_(user_ids))
+            payouts_query = payouts_query.where(ReferralPayout.user_id.in_(user_ids))
+
+        balances: Dict[int, Dict[str, Decimal]] = {}
+
+        def bucket(user_id: int) -> Dict[str, Decimal]:
+            return balances.setdefault(
+                user_id, {"total_earnings": ZERO, "pending_payouts": ZERO, "withdrawn": ZERO}
+            )
+
+        for user_id, total in (await db.execute(earnings_query)).all():
+            bucket(user_id)["total_earnings"] = Decimal(total)
+        for user_id, pending, withdrawn in (await db.execute(payouts_query)).all():
+            bucket(user_id)["pending_payouts"] = Decimal(pending)
+            bucket(user_id)["withdrawn"] = Decimal(withdrawn)
+
+        for values in balances.values():
+            values["available_balance"] = (
+                values["total_earnings"] - values["pending_payouts"] - values["withdrawn"]
+            )
+        return balances
+
+    async def verify_balances(
+        self, db: AsyncSession, user_ids: Optional[Iterable[int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Compare snapshots against the raw tables.
+
+        Returns one dict per user whose snapshot disagrees, with the
+        expected (raw) and actual (snapshot) values.
+        """
+        user_ids = list(user_ids) if user_ids is not None else None
+        expected = await self.compute_balances(db, user_ids)
+
+        query = select(ReferralBalance)
+        if user_ids is not None:
+            query = query.where(ReferralBalance.user_id.in_(user_ids))
+        snapshots = {
+            balance.user_id: balance
+            for balance in (await db.execute(query.execution_options(populate_existing=True))).scalars().all()
+        }
+
+        mismatches = []
+        for user_id in sorted(set(expected) | set(snapshots)):
+            want = expected.get(user_id) or {
+                "total_earnings": ZERO, "pending_payouts": ZERO, "withdrawn": ZERO, "available_balance": ZERO,
+            }
+            snapshot = snapshots.get(user_id)
+            have = {
+                field: Decimal(getattr(snapshot, field)) if snapshot else ZERO
+                for field in want
+            }
+            if have != want:
+                mismatches.append({"user_id": user_id, "expected": want, "actual": have})
+        return mismatches
+
+    async def resync_balance(self, db: AsyncSession, mismatch: Dict[str, Any]) -> ReferralLedgerEntry:
+        """Append an adjustment entry that brings a snapshot back to the raw totals"""
+        want, have = mismatch["expected"], mismatch["actual"]
+        return await self._append(
+            db, mismatch["user_id"], "adjustment",
+            earnings=want["total_earnings"] - have["total_earnings"],
+            pending=want["pending_payouts"] - have["pending_payouts"],
+            withdrawn=want["withdrawn"] - have["withdrawn"],
+            note="Consistency check resync",
+        )
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _append(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        entry_type: str,
+        earnings: Decimal = ZERO,
+        pending: Decimal = ZERO,
+        withdrawn: Decimal = ZERO,
+        earning_id: Optional[int] = None,
+        payout_id: Optional[int] = None,
+        note: Optional[str] = None,
+    ) -> ReferralLedgerEntry:
+        available = earnings - pending - withdrawn
+
+        # Atomic increment of the snapshot; the row lock taken here is held
+        # until the caller commits, so ledger order matches balance order.
+        stmt = pg_insert(ReferralBalance).values(
+            user_id=user_id,
+            total_earnings=earnings,
+            pending_payouts=pending,
+            withdrawn=withdrawn,
+            available_balance=available,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReferralBalance.user_id],
+            set_={
+                "total_earnings": ReferralBalance.total_earnings + stmt.excluded.total_earnings,
+                "pending_payouts": ReferralBalance.pending_payouts + stmt.excluded.pending_payouts,
+                "withdrawn": ReferralBalance.withdrawn + stmt.excluded.withdrawn,
+                "available_balance": ReferralBalance.available_balance + stmt.excluded.available_balance,
+                "updated_at": func.now(),
+            },
+        ).returning(ReferralBalance.total_earnings, ReferralBalance.available_balance)
+        total_earnings, balance_after = (await db.execute(stmt)).one()
+
+        # Legacy profile columns mirror the snapshot
+        await db.execute(
+            update(UserProfile)
+            .where(UserProfile.id == user_id)
+            .values(total_earnings=total_earnings, available_balance=balance_after)
+        )
+
+        entry = ReferralLedgerEntry(
+            user_id=user_id,
+            entry_type=entry_type,
+            earnings_delta=earnings,
+            pending_delta=pending,
+            withdrawn_delta=withdrawn,
+            balance_after=balance_after,
+            earning_id=earning_id,
+            payout_id=payout_id,
+            note=note,
+        )
+        db.add(entry)
+        return entry
+
+    async def _append_bulk(self, db: AsyncSession, entry_type: str, movements: List[Dict[str, Any]]) -> None:
+        """
+        Bulk variant of _append: one multi-row upsert for the snapshots, one
+        executemany for the profile mirror and one bulk INSERT for the ledger
+        rows. Users are processed in user_id order so parallel batches lock
+        snapshot rows in the same order and cannot deadlock each other.
+        """
+        if not movements:
+            return
+
+        totals: Dict[int, Dict[str, Decimal]] = {}
+        for movement in movements:
+            bucket = totals.setdefault(
+                movement["user_id"], {"earnings": ZERO, "pending": ZERO, "withdrawn": ZERO}
+            )
+            for field in bucket:
+                bucket[field] += movement.get(field, ZERO)
+
+        stmt = pg_insert(ReferralBalance).values([
+            {
+                "user_id": user_id,
+                "total_earnings": bucket["earnings"],
+                "pending_payouts": bucket["pending"],
+                "withdrawn": bucket["withdrawn"],
+                "available_balance": bucket["earnings"] - bucket["pending"] - bucket["withdrawn"],
+            }
+            for user_id, bucket in sorted(totals.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReferralBalance.user_id],
+            set_={
+                "total_earnings": ReferralBalance.total_earnings + stmt.excluded.total_earnings,
+                "pending_payouts": ReferralBalance.pending_payouts + stmt.excluded.pending_payouts,
+                "withdrawn": ReferralBalance.withdrawn + stmt.excluded.withdrawn,
+                "available_balance": ReferralBalance.available_balance + stmt.excluded.available_balance,
+                "updated_at": func.now(),
+            },
+        ).returning(ReferralBalance.user_id, ReferralBalance.total_earnings, ReferralBalance.available_balance)
+        snapshots = {
+            user_id: (total_earnings, available)
+            for user_id, total_earnings, available in (await db.execute(stmt)).all()
+        }
+
+        profiles = UserProfile.__table__
+        await db.execute(
+            update(profiles)
+            .where(profiles.c.id == bindparam("b_user_id"))
+            .values(
+                total_earnings=bindparam("b_total_earnings"),
+                available_balance=bindparam("b_available_balance"),
+            ),
+            [
+                {"b_user_id": user_id, "b_total_earnings": total_earnings, "b_available_balance": available}
+                for user_id, (total_earnings, available) in sorted(snapshots.items())
+            ],
+        )
+
+        # Replay the batch on top of the pre-batch balance for balance_after
+        running = {
+            user_id: snapshots[user_id][1] - (bucket["earnings"] - bucket["pending"] - bucket["withdrawn"])
+            for user_id, bucket in totals.items()
+        }
+        entries = []
+        for movement in movements:
+            earnings = movement.get("earnings", ZERO)
+            pending = movement.get("pending", ZERO)
+            withdrawn = movement.get("withdrawn", ZERO)
+            running[movement["user_id"]] += earnings - pending - withdrawn
+            entries.append({
+                "user_id": movement["user_id"],
+                "entry_type": entry_type,
+                "earnings_delta": earnings,
+                "pending_delta": pending,
+                "withdrawn_delta": withdrawn,
+                "balance_after": running[movement["user_id"]],
+                "earning_id": movement.get("earning_id"),
+                "payout_id": movement.get("payout_id"),
+                "note": movement.get("note"),
+            })
+        await db.execute(insert(ReferralLedgerEntry), entries)
@@ -1418,14 +1418,17 @@
 
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from app.models.referrals import ReferralEarning, ReferralPayout
 from app.models.users import UserProfile
 from app.schemas.referrals import ReferralPayoutCreate, ReferralStats
+from app.services.referral_closure_service import ReferralClosureService
+from app.services.referral_graph import referral_graph_index
+from app.services.referral_ledger_service import ReferralLedgerService
 
 
 class ReferralService:
@@ -1453,33 +1456,24 @@ class ReferralService:
         Automatically tracks commissions for up to 3 upline users.
         If user has no referrer, commission goes to L1 referrer only.
         """
-        result = await db.execute(select(UserProfile).where(UserProfile.id == user_id))
-        user = result.scalar_one_or_none()
-        if not user:
-            return  # ❌ User not found
-        
-        if not user.referred_by:
-            print(f"ℹ️ User {user_id} has no referrer, skipping commission")
-            return  # No referrer chain
-
         structure = (
             self.RECURRING_COMMISSIONS if plan_type == "recurring"
             else self.LONGTERM_COMMISSIONS
         )
 
-        current_referrer_id = user.referred_by
-
-        for level, percent in structure.items():
-            if not current_referrer_id:
-                break
+        # Whole upline in one query: {level: referrer_id}
+        upline = await ReferralClosureService().get_upline(db, user_id, max_depth=len(structure))
+        if not upline:
+            print(f"ℹ️ User {user_id} has no referrer, skipping commission")
+            return  # No referrer chain
 
+        ledger = ReferralLedgerService()
+        for level, referrer_id in upline.items():
+            percent = structure[level]
             commission_amount = plan_amount * percent
 
             earning = ReferralEarning(
-                # user_id=current_referrer_id,        # Who earned
-                # referred_user_id=user_id,           # Who made the purchase
-
-                user_id=current_referrer_id,        # ✅ The referrer who earned
+                user_id=referrer_id,                # ✅ The referrer who earned
                 referred_user_id=user_id, 
                 order_id=order_id,
                 level=level,
@@ -1488,15 +1482,8 @@ class ReferralService:
                 commission_amount=commission_amount,
                 status="pending",
             )
-
             db.add(earning)
-            await db.flush()
-
-            # Find next-level referrer
-            next_ref = await db.execute(
-                select(UserProfile.referred_by).where(UserProfile.id == current_referrer_id)
-            )
-            current_referrer_id = next_ref.scalar_one_or_none()
+            await ledger.record_earning(db, earning)
 
         await db.commit()
 
@@ -1506,55 +1493,22 @@ class ReferralService:
     async def get_user_referral_stats(self, db: AsyncSession, user_id: int) -> ReferralStats:
         """Return detailed stats for user's referrals and earnings."""
 
-        # --- Level 1 ---
-        l1_result = await db.execute(select(func.count(UserProfile.id)).where(UserProfile.referred_by == user_id))
-        l1_referrals = l1_result.scalar() or 0
-
-        # --- Level 2 ---
-        l2_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                )
-            )
-        )
-        l2_referrals = l2_result.scalar() or 0
-
-        # --- Level 3 ---
-        l3_result = await db.execute(
-            select(func.count(UserProfile.id)).where(
-                UserProfile.referred_by.in_(
-                    select(UserProfile.id).where(
-                        UserProfile.referred_by.in_(
-                            select(UserProfile.id).where(UserProfile.referred_by == user_id)
-                        )
-                    )
-                )
-            )
-        )
-        l3_referrals = l3_result.scalar() or 0
+        # --- Level 1 / 2 / 3 from the in-process graph, else one grouped closure lookup ---
+        graph = await referral_graph_index.get(db)
+        if graph is not None:
+            counts = graph.get_downline_counts(user_id, max_depth=3)
+        else:
+            counts = await ReferralClosureService().get_downline_counts(db, user_id, max_depth=3)
+        l1_referrals, l2_referrals, l3_referrals = counts[1], counts[2], counts[3]
 
         total_referrals = l1_referrals + l2_referrals + l3_referrals
 
-        total_earnings_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralEarning.commission_amount), 0))
-            .where(ReferralEarning.user_id == user_id)
-        )
-        total_earnings = Decimal(total_earnings_result.scalar() or 0)
-
-        pending_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralPayout.net_amount), 0))
-            .where(ReferralPayout.user_id == user_id, ReferralPayout.status == "requested")
-        )
-        pending_payouts = Decimal(pending_payouts_result.scalar() or 0)
-
-        completed_payouts_result = await db.execute(
-            select(func.coalesce(func.sum(ReferralPayout.net_amount), 0))
-            .where(ReferralPayout.user_id == user_id, ReferralPayout.status == "approved")
-        )
-        completed_payouts = Decimal(completed_payouts_result.scalar() or 0)
-
-        available_balance = total_earnings - (pending_payouts + completed_payouts)
+        # --- Balances from the ledger snapshot (one row) ---
+        balance = await ReferralLedgerService().get_balance(db, user_id)
+        total_earnings = Decimal(balance.total_earnings) if balance else Decimal("0")
+        pending_payouts = Decimal(balance.pending_payouts) if balance else Decimal("0")
+        completed_payouts = Decimal(balance.withdrawn) if balance else Decimal("0")
+        available_balance = Decimal(balance.available_balance) if balance else Decimal("0")
 
         return ReferralStats(
             total_referrals=total_referrals,
@@ -1609,8 +1563,9 @@ class ReferralService:
             requested_at=datetime.now(),
         )
 
-        async with db.begin():
-            db.add(payout)
+        db.add(payout)
+        await ReferralLedgerService().record_payout_requested(db, payout)
+        await db.commit()
         await db.refresh(payout)
         return payout
 
@@ -1619,7 +1574,9 @@ class ReferralService:
     # --------------------------------------------------------
     async def approve_payout(self, db: AsyncSession, payout_id: int, payment_ref: str) -> bool:
         """Admin approves a payout request."""
-        result = await db.execute(select(ReferralPayout).where(ReferralPayout.id == payout_id))
+        result = await db.execute(
+            select(ReferralPayout).where(ReferralPayout.id == payout_id).with_for_update()
+        )
         payout = result.scalar_one_or_none()
         if not payout or payout.status != "requested":
             return False
@@ -1628,13 +1585,15 @@ class ReferralService:
         payout.payment_reference = payment_ref
         payout.processed_at = datetime.now()
 
-        async with db.begin():
-            db.add(payout)
+        await ReferralLedgerService().record_payout_approved(db, payout)
+        await db.commit()
         return True
 
     async def reject_payout(self, db: AsyncSession, payout_id: int, reason: str) -> bool:
         """Admin rejects a payout request with reason."""
-        result = await db.execute(select(ReferralPayout).where(ReferralPayout.id == payout_id))
+        result = await db.execute(
+            select(ReferralPayout).where(ReferralPayout.id == payout_id).with_for_update()
+        )
         payout = result.scalar_one_or_none()
         if not payout or payout.status != "requested":
             return False
@@ -1643,39 +1602,89 @@ class ReferralService:
         payout.rejected_reason = reason
         payout.processed_at = datetime.now()
 
-        async with db.begin():
-            db.add(payout)
+        await ReferralLedgerService().record_payout_rejected(db, payout)
+        await db.commit()
         return True
 
     async def complete_payout(self, db: AsyncSession, payout_id: int) -> bool:
         """Mark payout as completed after bank transfer"""
-        result = await db.execute(select(ReferralPayout).where(ReferralPayout.id == payout_id))
-        payout = result.scalar_one_or_none()
-        if not payout or payout.status != "approved":
-            return False
+        summary = await self.bulk_complete_payouts(db, [payout_id])
+        return bool(summary["processed"])
 
-        payout.status = "completed"
-        
-        # Mark all related earnings as paid
-        await db.execute(
-            select(ReferralEarning)
-            .where(ReferralEarning.user_id == payout.user_id, ReferralEarning.status == "pending")
+    # --------------------------------------------------------
+    # ✅ Admin: Bulk Approve / Complete (quarter-end payout runs)
+    # --------------------------------------------------------
+    async def bulk_approve_payouts(
+        self, db: AsyncSession, payout_ids: List[int], payment_ref: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Approve many requested payouts in one transaction.
+        One UPDATE ... RETURNING for the payouts plus one bulk ledger write.
+        """
+        now = datetime.now()
+        values = {"status": "approved", "processed_at": now}
+        if payment_ref:
+            values["payment_reference"] = payment_ref
+
+        result = await db.execute(
+            update(ReferralPayout)
+            .where(ReferralPayout.id.in_(payout_ids), ReferralPayout.status == "requested")
+            .values(**values)
+            .returning(ReferralPayout.id, ReferralPayout.user_id, ReferralPayout.net_amount)
+            .execution_options(synchronize_session=False)
         )
-        earnings_result = await db.execute(
-            select(ReferralEarning).where(
-                ReferralEarning.user_id == payout.user_id,
-                ReferralEarning.status == "pending"
-            )
+        approved = result.all()
+
+        await ReferralLedgerService().record_payouts_approved_bulk(
+            db, [(payout_id, user_id, Decimal(net)) for payout_id, user_id, net in approved]
         )
-        earnings = earnings_result.scalars().all()
-        
-        for earning in earnings:
-            earning.status = "paid"
-            earning.paid_at = datetime.now()
+        await db.commit()
+        return self._bulk_summary("approve", payout_ids, approved)
 
-        async with db.begin():
-            db.add(payout)
-        return True
+    async def bulk_complete_payouts(self, db: AsyncSession, payout_ids: List[int]) -> Dict[str, Any]:
+        """
+        Complete many approved payouts in one transaction: one UPDATE for the
+        payouts and one UPDATE marking the users' pending earnings as paid.
+        """
+        now = datetime.now()
+        result = await db.execute(
+            update(ReferralPayout)
+            .where(ReferralPayout.id.in_(payout_ids), ReferralPayout.status == "approved")
+            .values(status="completed")
+            .returning(ReferralPayout.id, ReferralPayout.user_id, ReferralPayout.net_amount)
+            .execution_options(synchronize_session=False)
+        )
+        completed = result.all()
+
+        # Mark all related earnings as paid
+        earnings_paid = 0
+        user_ids = {user_id for _, user_id, _ in completed}
+        if user_ids:
+            earnings_result = await db.execute(
+                update(ReferralEarning)
+                .where(ReferralEarning.user_id.in_(user_ids), ReferralEarning.status == "pending")
+                .values(status="paid", paid_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            earnings_paid = earnings_result.rowcount
+
+        await db.commit()
+        summary = self._bulk_summary("complete", payout_ids, completed)
+        summary["earnings_marked_paid"] = earnings_paid
+        return summary
+
+    @staticmethod
+    def _bulk_summary(action: str, payout_ids: List[int], rows) -> Dict[str, Any]:
+        processed = sorted(payout_id for payout_id, _, _ in rows)
+        processed_set = set(processed)
+        return {
+            "action": action,
+            "requested": len(set(payout_ids)),
+            "processed": processed,
+            "skipped": sorted(set(payout_ids) - processed_set),
+            "users_affected": len({user_id for _, user_id, _ in rows}),
+            "total_net_amount": float(sum((Decimal(net) for _, _, net in rows), Decimal("0"))),
+        }
 
     async def get_user_payouts(self, db: AsyncSession, user_id: int) -> List[ReferralPayout]:
         """Get all payout requests for a user"""
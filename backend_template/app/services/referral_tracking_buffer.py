@@ -0,0 +1,393 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.affiliate import AffiliateSubscription, Referral, ReferralClick
+from app.models.referrals import ReferralClosure
+from app.models.users import UserProfile
+from app.services.affiliate_stats_service import AffiliateStatsService
+from app.services.referral_graph import referral_graph_index
+
+
+# Deepest referral level recorded in the referrals table
+MAX_REFERRAL_LEVEL = 3
+
+
+@dataclass
+class SignupEvent:
+    referral_code: str
+    referred_user_id: int
+    signup_ip: Optional[str] = None
+    user_agent: Optional[str] = None
+    # Resolved with the level-1 referral id (None if rejected) once committed
+    future: Optional[asyncio.Future] = None
+
+
+@dataclass
+class ClickEvent:
+    referral_code: str
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    landing_page: Optional[str] = None
+    clicked_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class ReferralTrackingBuffer:
+    """
+    Per-process buffer for referral click and signup tracking:
+    - Events are appended in memory and written by a background flusher every
+      REFERRAL_TRACKING_FLUSH_SECONDS, or as soon as a batch fills up
+    - A signup batch is resolved with a handful of set-based queries (codes,
+      existing referrals, referrer uplines from the closure table) and written
+      with multi-row INSERTs for each level, the closure rows, the profile
+      levels and the stats deltas, in one transaction
+    - Backpressure: at REFERRAL_TRACKING_BUFFER_SIZE queued events, signups
+      flush inline before queueing and clicks are dropped (and counted)
+    - Durability: with REFERRAL_TRACKING_SIGNUP_DURABILITY="commit" a signup
+      call returns once its batch is committed (group commit); "buffered"
+      returns at once and trades crash safety for latency
+    If a batch fails, its signups are retried one by one through
+    AffiliateService.track_referral so one bad row cannot drop the rest.
+    """
+
+    def __init__(self):
+        self._signups: Deque[SignupEvent] = deque()
+        self._clicks: Deque[ClickEvent] = deque()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._metrics = {
+            "signups_queued": 0,
+            "signups_written": 0,
+            "signups_rejected": 0,
+            "signups_retried_individually": 0,
+            "signups_failed": 0,
+            "clicks_queued": 0,
+            "clicks_written": 0,
+            "clicks_dropped": 0,
+            "batches": 0,
+            "batch_failures": 0,
+        }
+
+    async def record_signup(
+        self,
+        referral_code: str,
+        referred_user_id: int,
+        signup_ip: Optional[str] = None,
+        user_agent: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Queue a referral signup.
+
+        In "commit" durability mode returns the level-1 referral id once
+        written (None if the code or user was rejected); in "buffered" mode
+        returns None immediately.
+        """
+        self._ensure_running()
+        if self._queued() >= settings.REFERRAL_TRACKING_BUFFER_SIZE:
+            await self.flush()
+
+        future = None
+        if settings.REFERRAL_TRACKING_SIGNUP_DURABILITY == "commit":
+            future = asyncio.get_running_loop().create_future()
+        self._signups.append(SignupEvent(referral_code, referred_user_id, signup_ip, user_agent, future))
+        self._metrics["signups_queued"] += 1
+        if len(self._signups) >= settings.REFERRAL_TRACKING_BATCH_SIZE:
+            self._wake.set()
+
+        if future is None:
+            return None
+        # The event is written even if this request goes away
+        return await asyncio.shield(future)
+
+    def record_click(
+        self,
+        referral_code: str,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        landing_page: Optional[str] = None
+    ) -> bool:
+        """Queue a referral link click; False if dropped because the buffer is full"""
+        self._ensure_running()
+        if self._queued() >= settings.REFERRAL_TRACKING_BUFFER_SIZE:
+            self._metrics["clicks_dropped"] += 1
+            return False
+
+        self._clicks.append(ClickEvent(referral_code, ip_address, user_agent, landing_page))
+        self._metrics["clicks_queued"] += 1
+        if len(self._clicks) >= settings.REFERRAL_TRACKING_BATCH_SIZE:
+            self._wake.set()
+        return True
+
+    async def flush(self) -> None:
+        """Write everything queued so far, batch by batch"""
+        async with self._flush_lock:
+            while self._signups or self._clicks:
+                signups = self._take(self._signups)
+                clicks = self._take(self._clicks)
+                if signups:
+                    await self._write_signups(signups)
+                if clicks:
+                    await self._write_clicks(clicks)
+
+    async def stop(self) -> None:
+        """Stop the background flusher and drain the buffer (application shutdown)"""
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self._metrics,
+            "queued_signups": len(self._signups),
+            "queued_clicks": len(self._clicks),
+            "durability": settings.REFERRAL_TRACKING_SIGNUP_DURABILITY,
+        }
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    def _queued(self) -> int:
+        return len(self._signups) + len(self._clicks)
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.REFERRAL_TRACKING_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Referral tracking flush failed: {e}")
+
+    @staticmethod
+    def _take(queue: Deque) -> List:
+        batch = []
+        while queue and len(batch) < settings.REFERRAL_TRACKING_BATCH_SIZE:
+            batch.append(queue.popleft())
+        return batch
+
+    async def _write_signups(self, events: List[SignupEvent]) -> None:
+        self._metrics["batches"] += 1
+        results: Dict[int, Optional[int]] = {}
+        individual: List[SignupEvent] = []
+
+        async with AsyncSessionLocal() as db:
+            try:
+                results, individual, links = await self._insert_signups(db, events)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                self._metrics["batch_failures"] += 1
+                print(f"⚠️ Referral signup batch of {len(events)} failed ({e}); retrying one by one")
+                results, individual, links = {}, events, []
+
+            # In accepted order, so users referred by a signup of this batch follow it
+            for user_id, referrer_id in links:
+                referral_graph_index.link(user_id, referrer_id)
+
+            if individual:
+                from app.services.affiliate_service import AffiliateService
+                affiliate_service = AffiliateService()
+                for event in individual:
+                    self._metrics["signups_retried_individually"] += 1
+                    try:
+                        referral = await affiliate_service.track_referral(
+                            db, event.referral_code, event.referred_user_id, event.signup_ip, event.user_agent
+                        )
+                        results[id(event)] = referral.id if referral else None
+                    except Exception as e:
+                        await db.rollback()
+                        self._metrics["signups_failed"] += 1
+                        print(f"❌ Referral signup for user {event.referred_user_id} failed: {e}")
+                        if event.future is not None and not event.future.done():
+                            event.future.set_exception(e)
+
+        for event in events:
+            if id(event) not in results:
+                continue
+            referral_id = results[id(event)]
+            self._metrics["signups_written" if referral_id else "signups_rejected"] += 1
+            if event.future is not None and not event.future.done():
+                event.future.set_result(referral_id)
+
+    async def _insert_signups(self, db: AsyncSession, events: List[SignupEvent]):
+        """
+        Write one batch of signups. Returns ({id(event): level-1 referral id
+        or None}, events to process individually, (user, referrer) links to
+        apply to the referral graph once committed).
+        """
+        codes = {event.referral_code for event in events}
+        user_ids = {event.referred_user_id for event in events}
+
+        result = await db.execute(
+            select(AffiliateSubscription.referral_code, AffiliateSubscription.user_id).where(
+                AffiliateSubscription.referral_code.in_(codes),
+                AffiliateSubscription.is_active == True
+            )
+        )
+        referrer_by_code = dict(result.all())
+
+        result = await db.execute(
+            select(Referral.referred_user_id).where(Referral.referred_user_id.in_(user_ids)).distinct()
+        )
+        referred = set(result.scalars().all())
+
+        # Users with a downline of their own move it along; link_user handles that
+        result = await db.execute(
+            select(ReferralClosure.ancestor_id).where(ReferralClosure.ancestor_id.in_(user_ids)).distinct()
+        )
+        with_downline = set(result.scalars().all())
+
+        # Full upline of every referrer (cycle check and closure rows)
+        uplines: Dict[int, List[int]] = {}
+        result = await db.execute(
+            select(ReferralClosure.descendant_id, ReferralClosure.ancestor_id)
+            .where(ReferralClosure.descendant_id.in_(set(referrer_by_code.values())))
+            .order_by(ReferralClosure.descendant_id, ReferralClosure.depth)
+        )
+        for descendant_id, ancestor_id in result.all():
+            uplines.setdefault(descendant_id, []).append(ancestor_id)
+
+        results: Dict[int, Optional[int]] = {}
+        individual: List[SignupEvent] = []
+        accepted = []
+        for event in events:
+            user_id = event.referred_user_id
+            referrer_id = referrer_by_code.get(event.referral_code)
+            if referrer_id is None or user_id in referred:
+                results[id(event)] = None
+                continue
+            if user_id in with_downline:
+                referred.add(user_id)
+                individual.append(event)
+                continue
+
+            chain = [referrer_id] + uplines.get(referrer_id, [])
+            if user_id in chain:
+                results[id(event)] = None
+                continue
+
+            referred.add(user_id)
+            # Later signups in this batch under this user see the new chain
+            uplines[user_id] = chain
+            accepted.append((event, chain))
+
+        if not accepted:
+            return results, individual, []
+
+        # One multi-row INSERT per level; parents are matched by referred user
+        parent_ids: Dict[int, Optional[int]] = {event.referred_user_id: None for event, _ in accepted}
+        level_one_ids: Dict[int, int] = {}
+        stats_movements = []
+        for level in range(1, MAX_REFERRAL_LEVEL + 1):
+            rows = [
+                {
+                    "referrer_id": chain[level - 1],
+                    "referred_user_id": event.referred_user_id,
+                    "level": level,
+                    "parent_referral_id": parent_ids[event.referred_user_id],
+                    "referral_code_used": event.referral_code,
+                    "signup_ip": event.signup_ip,
+                    "signup_user_agent": event.user_agent,
+                    "has_purchased": False,
+                    "is_active": True,
+                }
+                for event, chain in accepted if len(chain) >= level
+            ]
+            if not rows:
+                break
+            result = await db.execute(
+                insert(Referral).returning(Referral.id, Referral.referred_user_id), rows
+            )
+            parent_ids.update({user_id: referral_id for referral_id, user_id in result.all()})
+            if level == 1:
+                level_one_ids = dict(parent_ids)
+            stats_movements += [
+                {"user_id": row["referrer_id"], f"total_referrals_level{level}": 1} for row in rows
+            ]
+
+        profiles = UserProfile.__table__
+        await db.execute(
+            update(profiles)
+            .where(profiles.c.id == bindparam("b_user_id"))
+            .values(
+                referred_by=bindparam("b_level_1"),
+                referral_level_2=bindparam("b_level_2"),
+                referral_level_3=bindparam("b_level_3"),
+            ),
+            [
+                {
+                    "b_user_id": event.referred_user_id,
+                    "b_level_1": chain[0],
+                    "b_level_2": chain[1] if len(chain) > 1 else None,
+                    "b_level_3": chain[2] if len(chain) > 2 else None,
+                }
+                for event, chain in accepted
+            ],
+        )
+
+        # New users have no downline: their closure rows are just their upline
+        new_user_ids = [event.referred_user_id for event, _ in accepted]
+        await db.execute(delete(ReferralClosure).where(ReferralClosure.descendant_id.in_(new_user_ids)))
+        await db.execute(
+            insert(ReferralClosure),
+            [
+                {"ancestor_id": ancestor_id, "descendant_id": event.referred_user_id, "depth": depth}
+                for event, chain in accepted
+                for depth, ancestor_id in enumerate(chain, start=1)
+            ],
+        )
+
+        await AffiliateStatsService().apply(db, stats_movements)
+
+        for event, _ in accepted:
+            results[id(event)] = level_one_ids.get(event.referred_user_id)
+        return results, individual, [(event.referred_user_id, chain[0]) for event, chain in accepted]
+
+    async def _write_clicks(self, events: List[ClickEvent]) -> None:
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(
+                    insert(ReferralClick),
+                    [
+                        {
+                            "referral_code": event.referral_code,
+                            "ip_address": event.ip_address,
+                            "user_agent": event.user_agent,
+                            "landing_page": event.landing_page,
+                            "clicked_at": event.clicked_at,
+                        }
+                        for event in events
+                    ],
+                )
+                await db.commit()
+                self._metrics["clicks_written"] += len(events)
+            except Exception as e:
+                await db.rollback()
+                self._metrics["batch_failures"] += 1
+                self._metrics["clicks_dropped"] += len(events)
+                print(f"❌ Referral click batch of {len(events)} failed: {e}")
+
+
+# Shared by every request handled by this worker process
+referral_tracking_buffer = ReferralTrackingBuffer()
@@ -0,0 +1,299 @@
+from datetime import datetime, timedelta, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, exists, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.addon import Addon
+from app.models.invoice import Invoice
+from app.models.order_addon import OrderAddon
+from app.models.plan import HostingPlan
+from app.models.server import Server
+from app.services.billing_summary_service import BillingSummaryService
+from app.services.invoice_line_item_service import InvoiceLineItemService, line_item_rows
+from app.services.order_service import BILLING_CYCLE_DISCOUNTS
+
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+GST_PERCENT = Decimal("18.00")
+
+# Normalized billing cycle → (months, HostingPlan price column for the whole cycle)
+# Cycles without a catalog price are billed as monthly_price × months
+BILLING_CYCLES: Dict[str, Tuple[int, Optional[str]]] = {
+    "monthly": (1, "monthly_price"),
+    "quarterly": (3, "quarterly_price"),
+    "semiannually": (6, None),
+    "annually": (12, "annual_price"),
+    "annual": (12, "annual_price"),
+    "biennially": (24, "biennial_price"),
+    "triennially": (36, "triennial_price"),
+}
+
+# Order addons that recur with the server
+RECURRING_ADDON_TYPES = ("monthly", "annual", "per_unit")
+
+
+def normalize_cycle(billing_cycle: Optional[str]) -> str:
+    """'Semi-Annually' / 'semi_annually' / 'semiannually' → 'semiannually'"""
+    cycle = (billing_cycle or "monthly").strip().lower().replace("-", "").replace("_", "")
+    return cycle if cycle in BILLING_CYCLES else "monthly"
+
+
+CYCLE_DISCOUNTS = {normalize_cycle(cycle): percent for cycle, percent in BILLING_CYCLE_DISCOUNTS.items()}
+
+
+def renewal_invoice_number(server_id: int, period_start: datetime) -> str:
+    """Deterministic per (server, period), so re-runs collide instead of duplicating"""
+    return f"INV-REN-{period_start:%Y%m%d}-{server_id:06d}"
+
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class RenewalInvoiceService:
+    """
+    Renewal invoices for servers about to expire:
+    - Active servers expiring within RENEWAL_INVOICE_LEAD_DAYS are walked in
+      (expiry_date, id) keyset order on idx_server_expiry, one chunk of
+      RENEWAL_INVOICE_BATCH_SIZE servers per transaction
+    - Plans and the addon catalog are loaded once per run; the recurring
+      addons of a chunk's orders are loaded with one query per chunk
+    - Pricing matches OrderService.create_order: cycle discount, then 18% GST
+      per line
+    - The billing period is [expiry_date, expiry_date + cycle); invoices are
+      multi-row inserted with ON CONFLICT DO NOTHING on
+      uq_invoice_server_period, so every period is invoiced exactly once no
+      matter how often (or how concurrently) the job runs; line items and
+      billing summaries of the new invoices are written in the same
+      transaction
+    - A run stops after RENEWAL_INVOICE_MAX_SERVERS servers; already
+      invoiced periods are skipped by the scan, so the next run continues
+    """
+
+    async def run(
+        self,
+        db: AsyncSession,
+        now: Optional[datetime] = None,
+        lead_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_servers: Optional[int] = None,
+    ) -> Dict[str, int]:
+        """Invoice every due renewal; returns servers scanned and invoices created / already present"""
+        now = now or datetime.now(timezone.utc)
+        lead_days = lead_days if lead_days is not None else settings.RENEWAL_INVOICE_LEAD_DAYS
+        batch_size = batch_size or settings.RENEWAL_INVOICE_BATCH_SIZE
+        max_servers = max_servers or settings.RENEWAL_INVOICE_MAX_SERVERS
+        horizon = now + timedelta(days=lead_days)
+
+        plans = {plan.id: plan for plan in (await db.execute(select(HostingPlan))).scalars().all()}
+        catalog = {addon.id: addon for addon in (await db.execute(select(Addon))).scalars().all()}
+
+        totals = {"scanned": 0, "created": 0, "skipped": 0}
+        after: Optional[Tuple[datetime, int]] = None
+        while totals["scanned"] < max_servers:
+            limit = min(batch_size, max_servers - totals["scanned"])
+            servers = await self._next_chunk(db, horizon, after, limit)
+            if not servers:
+                break
+            after = (servers[-1].expiry_date, servers[-1].id)
+
+            addons = await self._order_addons(db, {s.order_id for s in servers if s.order_id})
+            rows = [
+                self._invoice_row(server, plans.get(server.plan_id), addons.get(server.order_id, []), catalog, now)
+                for server in servers
+            ]
+            result = await db.execute(
+                pg_insert(Invoice).values(rows).on_conflict_do_nothing().returning(Invoice.id, Invoice.invoice_number)
+            )
+            inserted = {number: invoice_id for invoice_id, number in result.all()}
+            created = len(inserted)
+            if created:
+                await InvoiceLineItemService().write_rows(db, [
+                    line
+                    for row in rows if row["invoice_number"] in inserted
+                    for line in line_item_rows(
+                        inserted[row["invoice_number"]], row["user_id"], row["invoice_date"], row["items"]
+                    )
+                ])
+                await BillingSummaryService().refresh(db, {server.user_id for server in servers})
+            await db.commit()
+
+            totals["scanned"] += len(servers)
+            totals["created"] += created
+            totals["skipped"] += len(servers) - created
+            if len(servers) < limit:
+                break
+
+        return totals
+
+    def price_renewal(
+        self,
+        server: Server,
+        plan: Optional[HostingPlan],
+        order_addons: List[OrderAddon],
+        catalog: Dict[int, Addon],
+    ) -> Dict[str, Any]:
+        """Line items and totals for one billing cycle of a server"""
+        cycle = normalize_cycle(server.billing_cycle)
+        months, price_column = BILLING_CYCLES[cycle]
+        discount_percent = CYCLE_DISCOUNTS.get(cycle, ZERO)
+
+        if plan is not None:
+            cycle_price = getattr(plan, price_column) if price_column else None
+            plan_price = Decimal(str(cycle_price if cycle_price is not None else plan.monthly_price * months))
+            plan_name = plan.name
+        else:
+            # Plan removed from the catalog: keep billing what the server costs today
+            plan_price = Decimal(str(server.monthly_cost or 0)) * months
+            plan_name = server.plan_name or "Hosting"
+
+        items = [self._line(
+            "plan", server.plan_id,
+            f"{plan_name} - {server.server_name} renewal ({cycle.title()})", 1, plan_price, discount_percent,
+        )]
+        for order_addon in order_addons:
+            addon = catalog.get(order_addon.addon_id)
+            unit_price = Decimal(str(addon.price if addon is not None else order_addon.unit_price))
+            billing_type = addon.billing_type.value if addon is not None else (order_addon.billing_type or "").lower()
+            if billing_type not in RECURRING_ADDON_TYPES:
+                continue
+            # Annual addons are prorated to the server's cycle
+            period_price = unit_price * months / 12 if billing_type == "annual" else unit_price * months
+            items.append(self._line(
+                "addon", order_addon.addon_id,
+                f"{order_addon.addon_name} renewal", order_addon.quantity or 1, period_price, discount_percent,
+            ))
+
+        subtotal = sum((Decimal(str(item["subtotal_after_discount"])) for item in items), ZERO)
+        tax_amount = sum((Decimal(str(item["gst_amount"])) for item in items), ZERO)
+        return {
+            "months": months,
+            "items": items,
+            "subtotal": subtotal,
+            "tax_amount": tax_amount,
+            "total_amount": subtotal + tax_amount,
+        }
+
+    # ---------------------
+    # Internal Helpers
+    # ---------------------
+
+    async def _next_chunk(
+        self,
+        db: AsyncSession,
+        horizon: datetime,
+        after: Optional[Tuple[datetime, int]],
+        limit: int,
+    ) -> List[Any]:
+        """Next servers due for renewal whose current period is not invoiced yet"""
+        already_invoiced = exists().where(and_(
+            Invoice.server_id == Server.id,
+            Invoice.billing_period_start == Server.expiry_date,
+        ))
+        query = (
+            select(
+                Server.id, Server.user_id, Server.plan_id, Server.order_id, Server.server_name,
+                Server.plan_name, Server.monthly_cost, Server.billing_cycle, Server.expiry_date,
+            )
+            .where(
+                Server.server_status == "active",
+                Server.expiry_date <= horizon,
+                ~already_invoiced,
+            )
+            .order_by(Server.expiry_date, Server.id)
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(tuple_(Server.expiry_date, Server.id) > tuple_(*after))
+        return (await db.execute(query)).all()
+
+    async def _order_addons(self, db: AsyncSession, order_ids) -> Dict[int, List[OrderAddon]]:
+        if not order_ids:
+            return {}
+        result = await db.execute(
+            select(OrderAddon)
+            .where(OrderAddon.order_id.in_(order_ids), OrderAddon.is_active == 1)
+            .order_by(OrderAddon.id)
+        )
+        by_order: Dict[int, List[OrderAddon]] = {}
+        for order_addon in result.scalars().all():
+            by_order.setdefault(order_addon.order_id, []).append(order_addon)
+        return by_order
+
+    def _invoice_row(
+        self,
+        server: Any,
+        plan: Optional[HostingPlan],
+        order_addons: List[OrderAddon],
+        catalog: Dict[int, Addon],
+        now: datetime,
+    ) -> Dict[str, Any]:
+        pricing = self.price_renewal(server, plan, order_addons, catalog)
+        period_start = server.expiry_date
+        period_end = period_start + relativedelta(months=pricing["months"])
+        total = pricing["total_amount"]
+        payment_window = now + timedelta(days=settings.RENEWAL_INVOICE_PAYMENT_DAYS)
+        if period_start.tzinfo is None:
+            payment_window = payment_window.replace(tzinfo=None)
+        return {
+            "user_id": server.user_id,
+            "order_id": server.order_id,
+            "server_id": server.id,
+            "billing_period_start": period_start,
+            "billing_period_end": period_end,
+            "invoice_number": renewal_invoice_number(server.id, period_start),
+            "invoice_date": now,
+            # Customers always get the full payment window, even for late runs
+            "due_date": max(period_start, payment_window),
+            "subtotal": pricing["subtotal"],
+            "tax_amount": pricing["tax_amount"],
+            "total_amount": total,
+            "amount_paid": ZERO,
+            "balance_due": total,
+            "status": "unpaid",
+            "payment_status": "pending",
+            "currency": "INR",
+            "tax_rate": GST_PERCENT,
+            "late_fee": ZERO,
+            "days_overdue": 0,
+            "items": pricing["items"],
+            "notes": f"Renewal of {server.server_name} for {period_start:%d-%m-%Y} to {period_end:%d-%m-%Y}",
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    @staticmethod
+    def _line(
+        item_type: str,
+        ref_id: Optional[int],
+        description: str,
+        quantity: int,
+        unit_price: Decimal,
+        discount_percent: Decimal,
+    ) -> Dict[str, Any]:
+        """One invoice item, in the shape OrderService.create_order writes"""
+        amount = _money(unit_price * quantity)
+        discount_amount = _money(amount * discount_percent / Decimal("100.00"))
+        discounted = amount - discount_amount
+        gst_amount = _money(discounted * GST_PERCENT / Decimal("100.00"))
+        return {
+            "item_type": item_type,
+            "ref_id": ref_id,
+            "description": description,
+            "quantity": int(quantity),
+            "unit_price": float(_money(unit_price)),
+            "amount": float(amount),
+            "discount_percent": float(discount_percent),
+            "discount_amount": float(discount_amount),
+            "subtotal_after_discount": float(discounted),
+            "gst_percent": float(GST_PERCENT),
+            "gst_amount": float(gst_amount),
+            "total_amount": float(discounted + gst_amount),
+        }
+
@@ -9,10 +9,12 @@ from sqlalchemy.orm import selectinload
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from decimal import Decimal
+from dateutil.relativedelta import relativedelta
 
 from app.models.server import Server
 from app.models.plan import HostingPlan
 from app.models.order import Order
+from app.services.billing_summary_service import BillingSummaryService
 from app.schemas.server import ServerCreate, ServerUpdate, ServerStats
 
 
@@ -290,6 +292,7 @@ class ServerService:
         )
 
         db.add(db_server)
+        await BillingSummaryService().refresh(db, [user_id])
         await db.commit()
         await db.refresh(db_server)
         return db_server
@@ -308,6 +311,7 @@ class ServerService:
         for field, value in update_data.items():
             setattr(server, field, value)
 
+        await BillingSummaryService().refresh(db, [server.user_id])
         await db.commit()
         await db.refresh(server)
         return server
@@ -330,6 +334,7 @@ class ServerService:
         for field, value in update_data.items():
             setattr(server, field, value)
 
+        await BillingSummaryService().refresh(db, [server.user_id])
         await db.commit()
         await db.refresh(server)
         return server
@@ -354,6 +359,7 @@ class ServerService:
             return False
 
         server.server_status = new_status
+        await BillingSummaryService().refresh(db, [server.user_id])
         await db.commit()
         return True
 
@@ -381,6 +387,7 @@ class ServerService:
             return False
 
         await db.delete(server)
+        await BillingSummaryService().refresh(db, [server.user_id])
         await db.commit()
         return True
 
@@ -397,6 +404,7 @@ class ServerService:
             return False
 
         await db.delete(server)
+        await BillingSummaryService().refresh(db, [server.user_id])
         await db.commit()
         return True
 
@@ -503,9 +511,9 @@ class ServerService:
         if not server:
             return False
 
-        # Extend expiry date
+        # Extend expiry date by calendar months (same boundaries as renewal invoice periods)
         current_expiry = server.expiry_date or datetime.now()
-        server.expiry_date = current_expiry + timedelta(days=30 * months)
+        server.expiry_date = current_expiry + relativedelta(months=months)
         
         await db.commit()
         return True
@@ -276,6 +276,7 @@ from decimal import Decimal
 
 from app.models.users import UserProfile
 from app.schemas.users import UserCreate, UserUpdate, UserStats
+from app.services.referral_code_index import referral_code_index, user_ref_code
 from app.utils.security_utils import get_password_hash, verify_password
 from fastapi import HTTPException, status
 from sqlalchemy import update
@@ -320,9 +321,25 @@ class UserService:
         result = await db.execute(select(UserProfile).where(UserProfile.email == email))
         return result.scalar_one_or_none()
 
-    async def get_user_by_referral_code(self, db: AsyncSession, referral_code: str) -> Optional[UserProfile]:
+    async def get_user_by_referral_code(
+        self, db: AsyncSession, referral_code: str, use_filter: bool = True
+    ) -> Optional[UserProfile]:
+        # Unknown codes are rejected without a query; known ones reuse a cached id.
+        # use_filter=False always queries on a miss (signup: the code may have been
+        # created on another worker since the last filter sync)
+        if use_filter and not await referral_code_index.might_exist(db, referral_code):
+            return None
+        cached_id = referral_code_index.get_cached(("user", referral_code))
+        if cached_id is not None:
+            user = await db.get(UserProfile, cached_id)
+            if user and user.referral_code == referral_code:
+                return user
+
         result = await db.execute(select(UserProfile).where(UserProfile.referral_code == referral_code))
-        return result.scalar_one_or_none()
+        user = result.scalar_one_or_none()
+        if user:
+            referral_code_index.remember(("user", referral_code), user.id)
+        return user
 
 
 
@@ -354,6 +371,7 @@ class UserService:
             db.add(db_user)
             await db.commit()
             print(f"  Create_user: Commit successful, user ID: {db_user.id}")
+            referral_code_index.add(referral_code, user_ref_code(db_user.id))
             
             # Try refresh only if needed
             try:
@@ -397,6 +415,8 @@ class UserService:
 
         await db.commit()
         await db.refresh(user)
+        if "referral_code" in profile_update:
+            referral_code_index.add(user.referral_code)
         return user
 
     async def update_password(self, db: AsyncSession, user_id: int, new_password: str) -> bool:
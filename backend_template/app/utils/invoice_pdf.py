@@ -0,0 +1,123 @@
+"""
+Invoice PDF layout (reportlab).
+
+Runs inside the invoice PDF process pool (app/services/invoice_pdf_service.py),
+so it only depends on plain data: the document dict built by
+invoice_document() in the parent process.
+"""
+
+import io
+import time
+from typing import Any, Dict, Tuple
+from xml.sax.saxutils import escape
+
+
+# Bump when the layout changes so cached PDFs are rendered again
+LAYOUT_VERSION = 1
+
+BRAND = "#0891b2"
+PAID = "#10b981"
+PENDING = "#f59e0b"
+
+
+def money(value: Any) -> str:
+    # Standard PDF fonts have no rupee sign
+    return f"INR {float(value or 0):,.2f}"
+
+
+def render_invoice_pdf(document: Dict[str, Any]) -> Tuple[bytes, float]:
+    """PDF bytes for one invoice document, plus the seconds spent rendering"""
+    # Imported here so the API still boots where reportlab is not installed;
+    # only PDF rendering needs it
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    started = time.perf_counter()
+    styles = getSampleStyleSheet()
+    company = ParagraphStyle("Company", parent=styles["Title"], textColor=colors.HexColor(BRAND), fontSize=20)
+    centered = ParagraphStyle("Centered", parent=styles["Normal"], alignment=TA_CENTER)
+    right = ParagraphStyle("Right", parent=styles["Normal"], alignment=TA_RIGHT)
+    total = ParagraphStyle("Total", parent=right, fontName="Helvetica-Bold", fontSize=14, leading=18)
+    small = ParagraphStyle("Small", parent=centered, fontSize=8, textColor=colors.grey)
+
+    paid = document["payment_status"] == "paid"
+    status_color = PAID if paid else PENDING
+
+    story = [
+        Paragraph("BIDUA INDUSTRIES PVT LTD", company),
+        Paragraph("Office 201, B 158, Sector 63, Noida, UP 201301, India", centered),
+        Paragraph("Email: support@bidua.com | Phone: +91 120 416 8464", centered),
+        Spacer(1, 8 * mm),
+        Paragraph("INVOICE", styles["Heading2"]),
+        Paragraph(f"<b>Invoice Number:</b> {escape(document['invoice_number'])}", styles["Normal"]),
+        Paragraph(f"<b>Invoice Date:</b> {document['invoice_date']}", styles["Normal"]),
+        Paragraph(f"<b>Due Date:</b> {document['due_date']}", styles["Normal"]),
+        Paragraph(
+            f"<b>Status:</b> <font color='{status_color}'><b>"
+            f"{escape(document['payment_status'].upper())}</b></font>",
+            styles["Normal"],
+        ),
+        Spacer(1, 6 * mm),
+        Paragraph("Invoice Items", styles["Heading3"]),
+    ]
+
+    rows = [["Description", "Quantity", "Unit Price", "Amount"]]
+    rows += [
+        [
+            Paragraph(escape(str(item["description"])), styles["Normal"]),
+            str(item["quantity"]),
+            money(item["unit_price"]),
+            money(item["amount"]),
+        ]
+        for item in document["items"]
+    ]
+    table = Table(rows, colWidths=[85 * mm, 20 * mm, 35 * mm, 35 * mm], repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(BRAND)),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("LINEBELOW", (0, 0), (-1, -1), 0.5, colors.HexColor("#dddddd")),
+        ("TOPPADDING", (0, 0), (-1, -1), 6),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 6),
+    ]))
+    story += [table, Spacer(1, 6 * mm)]
+
+    story += [
+        Paragraph(f"<b>Subtotal:</b> {money(document['subtotal'])}", right),
+        Paragraph(f"<b>Tax (GST 18%):</b> {money(document['tax_amount'])}", right),
+        Paragraph(f"Total Amount: {money(document['total_amount'])}", total),
+    ]
+    if paid:
+        method = escape(document["payment_method"] or "Razorpay")
+        story += [
+            Paragraph(f"<font color='{PAID}'><b>Amount Paid:</b> {money(document['amount_paid'])}</font>", right),
+            Paragraph(f"<font color='{PAID}'><b>Payment Date:</b> {document['payment_date']}</font>", right),
+            Paragraph(f"<font color='{PAID}'><b>Payment Method:</b> {method}</font>", right),
+        ]
+    else:
+        story.append(
+            Paragraph(f"<font color='{PENDING}'><b>Balance Due:</b> {money(document['balance_due'])}</font>", right)
+        )
+
+    story += [
+        Spacer(1, 15 * mm),
+        Paragraph("Thank you for your business!", centered),
+        Paragraph("This is a computer-generated invoice and requires no signature.", small),
+    ]
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        title=f"Invoice {document['invoice_number']}",
+        leftMargin=15 * mm,
+        rightMargin=15 * mm,
+        topMargin=15 * mm,
+        bottomMargin=15 * mm,
+    ).build(story)
+    return buffer.getvalue(), time.perf_counter() - started
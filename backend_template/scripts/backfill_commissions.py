@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Commission recompute / backfill.
+
+    python -m scripts.backfill_commissions [--apply] [--workers 4] [--chunk-size 5000]
+                                           [--start-id N] [--end-id N] [--report report.json]
+
+Replays paid payment_transactions through the canonical commission rule in
+id-range chunks spread over a process pool, diffs the result against
+referral_earnings and, with --apply, writes the corrections in bulk (one
+transaction per chunk). Without --apply it only reports.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+
+from app.core.database import AsyncSessionLocal, engine
+from app.services.commission_backfill_service import SAMPLE_LIMIT, CommissionBackfillService
+
+
+TOTAL_KEYS = ("orders", "expected", "matched", "missing", "reversed", "paid_conflicts")
+
+
+async def _run_chunk(start_id: int, end_id: int, apply: bool):
+    try:
+        async with AsyncSessionLocal() as db:
+            return await CommissionBackfillService().reconcile_range(db, start_id, end_id, apply=apply)
+    finally:
+        # Pooled connections belong to this chunk's event loop
+        await engine.dispose()
+
+
+def run_chunk(start_id: int, end_id: int, apply: bool):
+    return asyncio.run(_run_chunk(start_id, end_id, apply))
+
+
+async def get_bounds():
+    try:
+        async with AsyncSessionLocal() as db:
+            return await CommissionBackfillService().get_id_bounds(db)
+    finally:
+        await engine.dispose()
+
+
+def main(args):
+    low, high = asyncio.run(get_bounds())
+    start_id = args.start_id if args.start_id is not None else low
+    end_id = args.end_id if args.end_id is not None else high + 1
+    if end_id <= start_id:
+        print("✅ Nothing to replay")
+        return
+
+    chunks = [(chunk_start, min(chunk_start + args.chunk_size, end_id))
+              for chunk_start in range(start_id, end_id, args.chunk_size)]
+    mode = "APPLY" if args.apply else "DRY RUN"
+    print(f"🔁 {mode}: transactions {start_id}..{end_id - 1} in {len(chunks)} chunks, {args.workers} workers")
+
+    started = time.perf_counter()
+    totals = {key: 0 for key in TOTAL_KEYS}
+    amounts = {"amount_added": Decimal("0.00"), "amount_reversed": Decimal("0.00")}
+    samples, failed = [], []
+
+    # spawn: each worker builds its own engine instead of inheriting sockets
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        futures = {pool.submit(run_chunk, chunk_start, chunk_end, args.apply): (chunk_start, chunk_end)
+                   for chunk_start, chunk_end in chunks}
+        for done, future in enumerate(as_completed(futures), 1):
+            chunk_start, chunk_end = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                failed.append((chunk_start, chunk_end, str(e)))
+                print(f"❌ Chunk {chunk_start}..{chunk_end - 1} failed: {e}")
+                continue
+
+            for key in TOTAL_KEYS:
+                totals[key] += report[key]
+            for key in amounts:
+                amounts[key] += report[key]
+            samples += report["samples"][:max(0, SAMPLE_LIMIT - len(samples))]
+            if report["missing"] or report["reversed"] or report["paid_conflicts"]:
+                print(
+                    f"  [{done}/{len(chunks)}] {chunk_start}..{chunk_end - 1}: "
+                    f"{report['missing']} missing, {report['reversed']} to reverse, "
+                    f"{report['paid_conflicts']} paid conflicts ({report['seconds']:.1f}s)"
+                )
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"✅ {mode} finished in {elapsed:.1f}s: {totals['orders']} orders, {totals['expected']} expected earnings, "
+        f"{totals['matched']} matched, {totals['missing']} missing (+₹{amounts['amount_added']}), "
+        f"{totals['reversed']} reversed (-₹{amounts['amount_reversed']}), "
+        f"{totals['paid_conflicts']} paid conflicts, {len(failed)} failed chunks"
+    )
+
+    if args.report:
+        with open(args.report, "w") as fh:
+            json.dump(
+                {
+                    "mode": mode.lower(),
+                    "start_id": start_id,
+                    "end_id": end_id,
+                    "seconds": elapsed,
+                    **totals,
+                    **{key: str(value) for key, value in amounts.items()},
+                    "failed_chunks": failed,
+                    "samples": samples,
+                },
+                fh,
+                indent=2,
+            )
+        print(f"📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute referral commissions from paid transactions")
+    parser.add_argument("--apply", action="store_true", help="Write corrections (default: dry-run report)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=5000, help="payment_transactions ids per chunk")
+    parser.add_argument("--start-id", type=int, default=None)
+    parser.add_argument("--end-id", type=int, default=None, help="Exclusive upper bound")
+    parser.add_argument("--report", default=None, help="Write a JSON report with sample differences")
+
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Backfill invoice_line_items from Invoice.items.
+
+    python -m scripts.backfill_invoice_line_items [--chunk-size 5000] [--workers 4] [--start-id 1] [--end-id 500000]
+
+Splits the invoice id range into chunks and converts them concurrently, each
+chunk in its own session and transaction. Invoices that already have line
+items are skipped, so the backfill can be stopped and run again at any time
+(and running it while new invoices are written is safe).
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.services.invoice_line_item_service import InvoiceLineItemService
+
+
+async def main(args) -> int:
+    service = InvoiceLineItemService()
+
+    async with AsyncSessionLocal() as db:
+        max_id = (await db.execute(select(func.max(Invoice.id)))).scalar() or 0
+    end_id = min(args.end_id, max_id + 1) if args.end_id else max_id + 1
+    chunks = [(start, min(start + args.chunk_size, end_id)) for start in range(args.start_id, end_id, args.chunk_size)]
+
+    started = time.perf_counter()
+    totals = {"invoices": 0, "lines": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(args.workers)
+
+    async def convert(start_id: int, stop_id: int) -> None:
+        async with semaphore:
+            try:
+                async with AsyncSessionLocal() as db:
+                    invoices, lines = await service.backfill(db, start_id, stop_id)
+                    await db.commit()
+            except Exception as e:
+                totals["failed"] += 1
+                print(f"❌ Invoices {start_id}..{stop_id - 1} failed: {e}")
+                return
+            totals["invoices"] += invoices
+            totals["lines"] += lines
+            if invoices:
+                print(f"   Invoices {start_id}..{stop_id - 1}: {invoices} converted, {lines} line item(s)")
+
+    await asyncio.gather(*[convert(start_id, stop_id) for start_id, stop_id in chunks])
+
+    print(
+        f"{'❌' if totals['failed'] else '✅'} {totals['invoices']} invoice(s) converted into {totals['lines']} "
+        f"line item(s) in {time.perf_counter() - started:.1f}s ({totals['failed']} chunk(s) failed)"
+    )
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill invoice_line_items from Invoice.items")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Invoice ids per chunk / transaction")
+    parser.add_argument("--workers", type=int, default=4, help="Chunks converted concurrently (database connections)")
+    parser.add_argument("--start-id", type=int, default=1, help="First invoice id")
+    parser.add_argument("--end-id", type=int, default=None, help="Stop before this invoice id (default: all)")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+In-process referral graph benchmark.
+
+    python -m scripts.benchmark_referral_graph [--users 1000000] [--lookups 100000] [--skip-db]
+
+Builds a synthetic referral tree of N users (each referred by an earlier
+user with probability --referred), reports the memory held by the array
+graph against a dict-of-lists tree of the same users, and times build,
+subtree counts, upline chains and descendant checks. Unless --skip-db is
+given, also times the same lookups against referral_closure on the
+configured database.
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+import tracemalloc
+
+from app.services.referral_graph import ReferralGraph
+
+
+def build_edges(count: int, referred: float):
+    rng = random.Random(42)
+    edges = []
+    for user_id in range(2, count + 1):
+        if rng.random() < referred:
+            # Recent users refer more often, which gives deep chains as well as wide teams
+            edges.append((user_id, rng.randint(max(1, user_id - 5000), user_id - 1)))
+    return edges
+
+
+def dict_tree_bytes(edges) -> int:
+    tracemalloc.start()
+    parents = {}
+    children = {}
+    for user_id, referrer_id in edges:
+        parents[user_id] = referrer_id
+        children.setdefault(referrer_id, []).append(user_id)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+def timed(label: str, lookups: int, fn, user_ids) -> None:
+    started = time.perf_counter()
+    for user_id in user_ids:
+        fn(user_id)
+    elapsed = (time.perf_counter() - started) / lookups
+    print(f"✅ {label:<28} {elapsed * 1_000_000:8.2f}µs")
+
+
+def bench_graph(args):
+    edges = build_edges(args.users, args.referred)
+    print(f"🌳 {args.users:,} users, {len(edges):,} referral links")
+
+    started = time.perf_counter()
+    graph = ReferralGraph.from_edges(args.users + 1, edges)
+    print(f"✅ Build: {time.perf_counter() - started:.2f}s")
+
+    graph_mb = graph.memory_bytes() / 1024 / 1024
+    print(f"📦 Array graph: {graph_mb:.1f} MiB ({graph.memory_bytes() / args.users:.1f} bytes/user)")
+    print(f"📦 dict-of-lists tree: {dict_tree_bytes(edges) / 1024 / 1024:.1f} MiB (parents + children only)")
+
+    rng = random.Random(7)
+    user_ids = [rng.randint(1, args.users) for _ in range(args.lookups)]
+    timed("Team size", args.lookups, graph.get_team_size, user_ids)
+    timed("Downline counts (3 levels)", args.lookups, graph.get_downline_counts, user_ids)
+    timed("Upline chain (3 levels)", args.lookups, graph.get_upline, user_ids)
+    timed("Full upline chain", args.lookups, lambda user_id: graph.get_upline(user_id, sys.maxsize), user_ids)
+    timed("Descendant check", args.lookups, lambda user_id: graph.is_descendant(1, user_id), user_ids)
+
+    started = time.perf_counter()
+    for user_id in range(args.users + 1, args.users + 1 + args.lookups):
+        graph.link(user_id, rng.randint(1, args.users))
+    print(f"✅ {'Link new user':<28} {(time.perf_counter() - started) / args.lookups * 1_000_000:8.2f}µs")
+
+
+async def bench_database(lookups: int):
+    from sqlalchemy import func, select
+
+    from app.core.database import AsyncSessionLocal
+    from app.models.referrals import ReferralClosure
+    from app.services.referral_closure_service import ReferralClosureService
+    from app.services.referral_graph import ReferralGraphIndex
+
+    service = ReferralClosureService()
+    index = ReferralGraphIndex()
+    async with AsyncSessionLocal() as db:
+        links = (await db.execute(
+            select(func.count()).select_from(ReferralClosure).where(ReferralClosure.depth == 1)
+        )).scalar() or 0
+        print(f"🗄️  referral_closure links: {links:,}")
+
+        started = time.perf_counter()
+        await index.rebuild(db)
+        print(f"✅ Load from database: {time.perf_counter() - started:.2f}s, {index.metrics()['memory_bytes'] / 1024 / 1024:.1f} MiB")
+
+        max_id = len(index._graph) - 1
+        if max_id < 1:
+            return
+        rng = random.Random(7)
+        user_ids = [rng.randint(1, max_id) for _ in range(lookups)]
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await service.get_downline_counts(db, user_id, max_depth=3)
+        print(f"✅ {'SQL downline counts':<28} {(time.perf_counter() - started) / lookups * 1_000_000:8.2f}µs")
+
+        started = time.perf_counter()
+        for user_id in user_ids:
+            await service.get_upline(db, user_id, max_depth=3)
+        print(f"✅ {'SQL upline chain':<28} {(time.perf_counter() - started) / lookups * 1_000_000:8.2f}µs")
+
+
+async def main(args):
+    bench_graph(args)
+    if not args.skip_db:
+        await bench_database(min(args.lookups, 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the in-process referral graph")
+    parser.add_argument("--users", type=int, default=1_000_000, help="Synthetic users")
+    parser.add_argument("--referred", type=float, default=0.8, help="Share of users with a referrer")
+    parser.add_argument("--lookups", type=int, default=100_000, help="Lookups timed per query type")
+    parser.add_argument("--skip-db", action="store_true", help="Only run the synthetic in-memory graph")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Referral leaderboard benchmark.
+
+    python -m scripts.benchmark_referral_leaderboard [--users 1000000] [--reads 10000] [--skip-db]
+
+Times the old in-memory path (ReferralUtils.generate_referral_leaderboard on
+N synthetic users) against the precomputed table on the configured
+database: N synthetic users with referral balances are seeded inside a
+transaction that is rolled back at the end, then one refresh plus cold and
+cached top-10 reads are timed. Week / month rank the existing
+referral_earnings rows; the seeded balances drive the all-time board.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from decimal import Decimal
+
+from sqlalchemy import func, select, text
+
+from app.utils.referral_utils import ReferralUtils
+
+
+def build_users(count: int):
+    rng = random.Random(42)
+    return [
+        {
+            "user_id": user_id,
+            "user_name": f"user{user_id}",
+            "total_earnings": Decimal(rng.randint(0, 5_000_000)) / 100,
+            "total_referrals": rng.randint(0, 500),
+            "active_referrals": rng.randint(0, 100),
+        }
+        for user_id in range(1, count + 1)
+    ]
+
+
+async def bench_python(count: int):
+    started = time.perf_counter()
+    users = build_users(count)
+    built = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await ReferralUtils.generate_referral_leaderboard(users, top_n=10)
+    print(f"🐍 In-memory sort of {count:,} users: {time.perf_counter() - started:.3f}s (+{built:.2f}s to load)")
+
+
+async def seed_balances(db, count: int) -> None:
+    """N synthetic users with random referral balances, ids above the current maximum"""
+    from app.models.users import UserProfile
+
+    first_id = ((await db.execute(select(func.max(UserProfile.id)))).scalar() or 0) + 1
+    params = {"first": first_id, "last": first_id + count - 1}
+
+    started = time.perf_counter()
+    await db.execute(
+        text(
+            "INSERT INTO users_profiles "
+            "(id, email, full_name, role, account_status, hashed_password, activation_type, total_referrals) "
+            "SELECT g, 'bench' || g || '@example.invalid', 'bench user ' || g, 'customer', 'active', "
+            "'x', 'direct', (random() * 500)::int "
+            "FROM generate_series(:first, :last) AS g"
+        ),
+        params,
+    )
+    await db.execute(
+        text(
+            "INSERT INTO referral_balances "
+            "(user_id, total_earnings, pending_payouts, withdrawn, available_balance) "
+            "SELECT g, e, 0, 0, e "
+            "FROM (SELECT g, round((random() * 50000)::numeric, 2) AS e "
+            "FROM generate_series(:first, :last) AS g) AS s"
+        ),
+        params,
+    )
+    await db.execute(text("ANALYZE users_profiles"))
+    await db.execute(text("ANALYZE referral_balances"))
+    print(f"🌱 Seeded {count:,} synthetic balances: {time.perf_counter() - started:.2f}s (rolled back afterwards)")
+
+
+async def bench_database(count: int, reads: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.core.database import engine
+    from app.models.referrals import ReferralBalance
+    from app.services.referral_leaderboard_service import LEADERBOARD_PERIODS, ReferralLeaderboardService
+
+    service = ReferralLeaderboardService()
+    async with engine.connect() as conn:
+        outer = await conn.begin()
+        # refresh() commits; with savepoints those commits stay inside the
+        # outer transaction, which is rolled back so nothing seeded persists
+        db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        try:
+            await seed_balances(db, count)
+            balances = (await db.execute(select(func.count()).select_from(ReferralBalance))).scalar() or 0
+            print(f"🗄️  referral_balances rows: {balances:,}")
+
+            started = time.perf_counter()
+            written = await service.refresh(db)
+            print(f"✅ Refresh {written}: {time.perf_counter() - started:.3f}s")
+
+            for period in LEADERBOARD_PERIODS:
+                service._cache.pop(period, None)
+                started = time.perf_counter()
+                await service.get_leaderboard(db, period, 10)
+                cold = time.perf_counter() - started
+
+                started = time.perf_counter()
+                for _ in range(reads):
+                    await service.get_leaderboard(db, period, 10)
+                cached = (time.perf_counter() - started) / reads
+                print(f"✅ {period}: cold read {cold * 1000:.2f}ms, cached read {cached * 1_000_000:.1f}µs")
+        finally:
+            await db.close()
+            await outer.rollback()
+            # Cached boards were built from the seeded rows
+            service._cache.clear()
+
+
+async def main(args):
+    await bench_python(args.users)
+    if not args.skip_db:
+        await bench_database(args.users, args.reads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the referral leaderboard")
+    parser.add_argument("--users", type=int, default=1_000_000, help="Synthetic users for both paths")
+    parser.add_argument("--reads", type=int, default=10_000, help="Cached reads per period")
+    parser.add_argument("--skip-db", action="store_true", help="Only run the in-memory path")
+
+    asyncio.run(main(parser.parse_args()))
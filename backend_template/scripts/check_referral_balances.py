@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Verify referral balance snapshots against referral_earnings / referral_payouts.
+
+    python -m scripts.check_referral_balances [--user-id 42 ...] [--fix]
+
+With --fix, every mismatching user gets an `adjustment` ledger entry that
+brings the snapshot back in line with the raw tables. Exits non-zero when
+mismatches are found and not fixed, so it can run from cron / CI.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from app.core.database import get_db
+from app.services.referral_ledger_service import ReferralLedgerService
+
+
+async def main(args) -> int:
+    service = ReferralLedgerService()
+
+    async for db in get_db():
+        mismatches = await service.verify_balances(db, args.user_id)
+        if not mismatches:
+            print("✅ All referral balances match the raw tables")
+            return 0
+
+        for mismatch in mismatches:
+            print(f"❌ User {mismatch['user_id']}")
+            for field, expected in mismatch["expected"].items():
+                actual = mismatch["actual"][field]
+                if actual != expected:
+                    print(f"   {field:<18} snapshot={actual:>12}  raw={expected:>12}")
+
+        if not args.fix:
+            return 1
+
+        for mismatch in mismatches:
+            await service.resync_balance(db, mismatch)
+        await db.commit()
+        print(f"✅ Resynced {len(mismatches)} balance(s)")
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check referral balance snapshots")
+    parser.add_argument("--user-id", type=int, action="append", default=None, help="Limit to these users")
+    parser.add_argument("--fix", action="store_true", help="Append adjustment entries for mismatches")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Background commission distributor.
+
+    python -m scripts.commission_worker [--batch-size 200] [--interval 10] [--once]
+
+Claims paid, undistributed referral payments in batches with
+FOR UPDATE SKIP LOCKED, so any number of workers can run side by side.
+Logs per-batch and cumulative throughput (logger "commission_worker",
+key=value fields so log collectors can pick them up).
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from decimal import Decimal
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.commission_service import CommissionService
+
+
+logger = logging.getLogger("commission_worker")
+
+
+async def main(args):
+    service = CommissionService()
+    interval = args.interval if args.interval is not None else settings.COMMISSION_WORKER_INTERVAL_SECONDS
+
+    started = time.perf_counter()
+    totals = {"distributed": 0, "skipped": 0, "earnings_created": 0, "amount_distributed": Decimal("0.00")}
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            metrics = await service.distribute_pending_batch(db, batch_size=args.batch_size)
+
+        for key in totals:
+            totals[key] += metrics[key]
+
+        if metrics["claimed"]:
+            elapsed = time.perf_counter() - started
+            logger.info(
+                "commission batch claimed=%d distributed=%d skipped=%d earnings_created=%d "
+                "amount_distributed=%s seconds=%.3f total_distributed=%d total_skipped=%d "
+                "total_earnings_created=%d total_amount_distributed=%s tx_per_second=%.1f",
+                metrics["claimed"], metrics["distributed"], metrics["skipped"], metrics["earnings_created"],
+                metrics["amount_distributed"], metrics["seconds"], totals["distributed"], totals["skipped"],
+                totals["earnings_created"], totals["amount_distributed"],
+                (totals["distributed"] + totals["skipped"]) / elapsed,
+            )
+
+        if args.once:
+            return totals
+        # A full batch means there is probably more waiting
+        batch_size = args.batch_size or settings.COMMISSION_WORKER_BATCH_SIZE
+        if metrics["claimed"] < batch_size:
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribute pending referral commissions")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--interval", type=int, default=None, help="Seconds to sleep when the queue is drained")
+    parser.add_argument("--once", action="store_true", help="Process a single batch and exit")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Renewal invoices for expiring servers.
+
+    python -m scripts.generate_renewal_invoices [--interval 3600] [--once] [--lead-days 7] [--batch-size 2000] [--max-servers 100000]
+
+Invoices the next billing period of every active server expiring within
+RENEWAL_INVOICE_LEAD_DAYS, priced from the plan and addon catalog. Each
+(server, billing period) is invoiced once: re-runs, overlapping runs and
+restarts only create what is missing.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.renewal_invoice_service import RenewalInvoiceService
+
+
+async def main(args):
+    service = RenewalInvoiceService()
+    interval = args.interval if args.interval is not None else settings.RENEWAL_INVOICE_INTERVAL_SECONDS
+
+    while True:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                totals = await service.run(
+                    db,
+                    lead_days=args.lead_days,
+                    batch_size=args.batch_size,
+                    max_servers=args.max_servers,
+                )
+            print(
+                f"✅ Renewal invoices: {totals['created']} created, {totals['skipped']} already invoiced "
+                f"({totals['scanned']} servers scanned) in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            print(f"❌ Renewal invoice run failed: {e}")
+            if args.once:
+                raise
+
+        if args.once:
+            break
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate renewal invoices for expiring servers")
+    parser.add_argument("--interval", type=int, default=None, help="Seconds between runs")
+    parser.add_argument("--once", action="store_true", help="Run once and exit")
+    parser.add_argument("--lead-days", type=int, default=None, help="Invoice servers expiring within this many days")
+    parser.add_argument("--batch-size", type=int, default=None, help="Servers per transaction")
+    parser.add_argument("--max-servers", type=int, default=None, help="Servers per run")
+
+    asyncio.run(main(parser.parse_args()))
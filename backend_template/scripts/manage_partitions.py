@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Monthly partition maintenance for payment_transactions and referral_earnings.
+
+    python -m scripts.manage_partitions ensure [--months-ahead 3]
+    python -m scripts.manage_partitions list
+    python -m scripts.manage_partitions detach payment_transactions 2024-01 [--no-archive]
+
+Run `ensure` from cron (e.g. daily) so next months' partitions always exist.
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+from app.core.database import get_db
+from app.services.partition_service import PartitionService
+
+
+async def main(args):
+    service = PartitionService()
+
+    async for db in get_db():
+        if args.command == "ensure":
+            created = await service.ensure_partitions(db, months_ahead=args.months_ahead)
+            if created:
+                for name in created:
+                    print(f"✅ Created partition {name}")
+            else:
+                print("✅ All partitions already exist")
+
+        elif args.command == "list":
+            for partition in await service.list_partitions(db):
+                print(
+                    f"{partition['table']:<22} {partition['partition']:<36} "
+                    f"~{partition['estimated_rows']:>10} rows  {partition['bounds']}"
+                )
+
+        elif args.command == "detach":
+            month = datetime.strptime(args.month, "%Y-%m").replace(tzinfo=timezone.utc)
+            result = await service.detach_partition(db, args.table, month, archive=not args.no_archive)
+            print(f"✅ Detached {result['partition']} -> {result['location']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage monthly table partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ensure_parser = subparsers.add_parser("ensure", help="Create upcoming monthly partitions")
+    ensure_parser.add_argument("--months-ahead", type=int, default=None)
+
+    subparsers.add_parser("list", help="List attached partitions")
+
+    detach_parser = subparsers.add_parser("detach", help="Detach (and archive) a past month")
+    detach_parser.add_argument("table")
+    detach_parser.add_argument("month", help="Month to detach, YYYY-MM")
+    detach_parser.add_argument("--no-archive", action="store_true", help="Leave the table in the public schema")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Pre-render invoice PDFs ahead of demand.
+
+    python -m scripts.prerender_invoice_pdfs [--month 2026-10] [--batch-size 200] [--workers 4] [--prune]
+
+Renders every invoice dated in the month (default: the current UTC month)
+into the content-addressed PDF cache (INVOICE_PDF_CACHE_DIR) using the
+process pool, so month-end downloads are cache hits. Invoices whose PDF is
+already cached are skipped; running it again after invoices change only
+renders the changed ones. With --prune, PDFs not read for
+INVOICE_PDF_CACHE_MAX_AGE_DAYS are deleted first.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.invoice import Invoice
+from app.services.invoice_pdf_service import invoice_pdf_service
+
+
+def month_bounds(month: str):
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+async def main(args) -> int:
+    start, end = month_bounds(args.month)
+    if args.prune:
+        print(f"🧹 Pruned {invoice_pdf_service.prune()} cached PDF(s)")
+
+    started = time.perf_counter()
+    totals = {"rendered": 0, "cached": 0, "failed": 0}
+    last_id = 0
+    try:
+        async with AsyncSessionLocal() as db:
+            while True:
+                result = await db.execute(
+                    select(Invoice)
+                    .where(Invoice.invoice_date >= start, Invoice.invoice_date < end, Invoice.id > last_id)
+                    .order_by(Invoice.id)
+                    .limit(args.batch_size)
+                )
+                invoices = result.scalars().all()
+                if not invoices:
+                    break
+                last_id = invoices[-1].id
+
+                counts = await invoice_pdf_service.prerender(invoices)
+                for key in totals:
+                    totals[key] += counts[key]
+                # Rows are only needed for their document; keep the session small
+                db.expunge_all()
+    finally:
+        invoice_pdf_service.shutdown()
+
+    metrics = invoice_pdf_service.metrics()
+    print(
+        f"{'❌' if totals['failed'] else '✅'} {args.month}: {totals['rendered']} rendered, "
+        f"{totals['cached']} already cached, {totals['failed']} failed "
+        f"in {time.perf_counter() - started:.1f}s (avg {metrics['avg_render_ms']}ms per PDF)"
+    )
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render invoice PDFs into the on-disk cache")
+    parser.add_argument("--month", default=datetime.now(timezone.utc).strftime("%Y-%m"), help="YYYY-MM (default: current month)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Invoices rendered per batch")
+    parser.add_argument("--workers", type=int, default=None, help="Render processes (default: INVOICE_PDF_WORKERS)")
+    parser.add_argument("--prune", action="store_true", help="Delete PDFs not read for INVOICE_PDF_CACHE_MAX_AGE_DAYS first")
+    args = parser.parse_args()
+
+    if args.workers:
+        settings.INVOICE_PDF_WORKERS = args.workers
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Referral leaderboard refresher.
+
+    python -m scripts.refresh_referral_leaderboard [--period week] [--interval 900] [--once]
+
+Rebuilds the precomputed top referrers (week, month, all-time) on a timer.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.referral_leaderboard_service import LEADERBOARD_PERIODS, ReferralLeaderboardService
+
+
+async def main(args):
+    service = ReferralLeaderboardService()
+    interval = args.interval if args.interval is not None else settings.REFERRAL_LEADERBOARD_REFRESH_INTERVAL_SECONDS
+    periods = [args.period] if args.period else None
+
+    while True:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                written = await service.refresh(db, periods)
+            rows = ", ".join(f"{period}: {count}" for period, count in written.items())
+            print(f"✅ Leaderboard refreshed ({rows}) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"❌ Leaderboard refresh failed: {e}")
+            if args.once:
+                raise
+
+        if args.once:
+            break
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the precomputed referral leaderboard")
+    parser.add_argument("--period", choices=LEADERBOARD_PERIODS, default=None)
+    parser.add_argument("--interval", type=int, default=None, help="Seconds between refreshes")
+    parser.add_argument("--once", action="store_true", help="Refresh once and exit")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Daily analytics rollups.
+
+    python -m scripts.rollup_analytics [--interval 300] [--once] [--batch-size 10000]
+    python -m scripts.rollup_analytics --rebuild-from 2026-01-01 [--rebuild-to 2026-01-31]
+
+Folds new referrals, commissions, payouts and referral ledger rows into the
+per-affiliate and global daily rollups on a timer. --rebuild-from recomputes
+a day range from the raw tables instead and exits.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.analytics_rollup_service import AnalyticsRollupService
+
+
+async def main(args):
+    service = AnalyticsRollupService()
+
+    if args.rebuild_from:
+        rebuild_to = args.rebuild_to or date.today()
+        async with AsyncSessionLocal() as db:
+            written = await service.rebuild(db, args.rebuild_from, rebuild_to)
+        print(f"✅ Rebuilt rollups {args.rebuild_from} .. {rebuild_to} ({written} source aggregates)")
+        return
+
+    interval = args.interval if args.interval is not None else settings.ANALYTICS_ROLLUP_INTERVAL_SECONDS
+    while True:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                processed = await service.run(db, args.batch_size)
+            rows = ", ".join(f"{source}: {count}" for source, count in processed.items())
+            print(f"✅ Rollups updated ({rows}) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            print(f"❌ Rollup run failed: {e}")
+            if args.once:
+                raise
+
+        if args.once:
+            break
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain daily analytics rollups")
+    parser.add_argument("--interval", type=int, default=None, help="Seconds between runs")
+    parser.add_argument("--once", action="store_true", help="Run once and exit")
+    parser.add_argument("--batch-size", type=int, default=None, help="Source rows per transaction")
+    parser.add_argument("--rebuild-from", type=date.fromisoformat, default=None, help="Recompute from this day (YYYY-MM-DD)")
+    parser.add_argument("--rebuild-to", type=date.fromisoformat, default=None, help="Last day to recompute (default: today)")
+
+    asyncio.run(main(parser.parse_args()))
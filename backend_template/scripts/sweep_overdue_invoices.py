@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Overdue invoice sweeper.
+
+    python -m scripts.sweep_overdue_invoices [--interval 3600] [--once] [--batch-size 5000]
+
+Marks open invoices past their due date as overdue and refreshes
+days_overdue and late_fee, one set-based UPDATE per batch. Invoices reaching
+a dunning stage (INVOICE_DUNNING_STAGE_DAYS) get a row in
+invoice_dunning_events for the notifier.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services.overdue_invoice_service import OverdueInvoiceService
+
+
+async def main(args):
+    service = OverdueInvoiceService()
+    interval = args.interval if args.interval is not None else settings.INVOICE_OVERDUE_INTERVAL_SECONDS
+
+    while True:
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                totals = await service.sweep(db, batch_size=args.batch_size)
+            print(
+                f"✅ Overdue sweep: {totals['updated']} invoice(s) updated, "
+                f"{totals['events']} dunning event(s) in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            print(f"❌ Overdue sweep failed: {e}")
+            if args.once:
+                raise
+
+        if args.once:
+            break
+        await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mark overdue invoices and emit dunning events")
+    parser.add_argument("--interval", type=int, default=None, help="Seconds between sweeps")
+    parser.add_argument("--once", action="store_true", help="Sweep once and exit")
+    parser.add_argument("--batch-size", type=int, default=None, help="Invoices per UPDATE")
+
+    asyncio.run(main(parser.parse_args()))
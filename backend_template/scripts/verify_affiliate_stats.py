@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Verify affiliate_stats against referrals / commissions / payouts.
+
+    python -m scripts.verify_affiliate_stats [--user-id 42 ...] [--batch-size 5000] [--fix]
+
+Stats rows are maintained incrementally by each event; this recomputes them
+from the raw tables in user-id batches. With --fix, every drifted row is
+rewritten from the raw tables. Exits non-zero when mismatches are found and
+not fixed, so it can run from cron / CI.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.users import UserProfile
+from app.services.affiliate_stats_service import AffiliateStatsService
+
+
+async def main(args) -> int:
+    service = AffiliateStatsService()
+    mismatched = fixed = 0
+
+    async with AsyncSessionLocal() as db:
+        if args.user_id:
+            batches = [(args.user_id, None, None)]
+        else:
+            max_id = (await db.execute(select(func.max(UserProfile.id)))).scalar() or 0
+            batches = [(None, start, start + args.batch_size) for start in range(0, max_id + 1, args.batch_size)]
+
+        for user_ids, start_id, end_id in batches:
+            mismatches = await service.verify_stats(db, user_ids, start_id, end_id)
+            await db.rollback()
+            mismatched += len(mismatches)
+
+            for mismatch in mismatches:
+                print(f"❌ Affiliate {mismatch['user_id']}")
+                for field, expected in mismatch["expected"].items():
+                    actual = mismatch["actual"][field]
+                    if actual != expected:
+                        print(f"   {field:<24} stored={actual:>12}  raw={expected:>12}")
+
+                if args.fix:
+                    await service.resync_stats(db, mismatch["user_id"])
+                    await db.commit()
+                    fixed += 1
+
+    if not mismatched:
+        print("✅ All affiliate stats match the raw tables")
+        return 0
+    if args.fix:
+        print(f"✅ Resynced {fixed} affiliate stats row(s)")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check incrementally maintained affiliate stats")
+    parser.add_argument("--user-id", type=int, action="append", default=None, help="Limit to these affiliates")
+    parser.add_argument("--batch-size", type=int, default=5000, help="User ids verified per batch")
+    parser.add_argument("--fix", action="store_true", help="Rewrite drifted rows from the raw tables")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
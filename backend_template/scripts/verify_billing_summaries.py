@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Verify billing_summaries against invoices / servers.
+
+    python -m scripts.verify_billing_summaries [--user-id 42 ...] [--batch-size 5000] [--fix]
+
+Summary rows are refreshed by every invoice and server change made through
+the services; this recomputes them from the raw tables in user-id batches to
+catch writes that bypassed them. With --fix, every drifted or missing row is
+rewritten (which also backfills rows after the table is first created).
+Exits non-zero when mismatches are found and not fixed, so it can run from
+cron / CI.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.users import UserProfile
+from app.services.billing_summary_service import BillingSummaryService
+
+
+async def main(args) -> int:
+    service = BillingSummaryService()
+    mismatched = fixed = 0
+
+    async with AsyncSessionLocal() as db:
+        if args.user_id:
+            batches = [(args.user_id, None, None)]
+        else:
+            max_id = (await db.execute(select(func.max(UserProfile.id)))).scalar() or 0
+            batches = [(None, start, start + args.batch_size) for start in range(0, max_id + 1, args.batch_size)]
+
+        for user_ids, start_id, end_id in batches:
+            mismatches = await service.verify_summaries(db, user_ids, start_id, end_id)
+            await db.rollback()
+            mismatched += len(mismatches)
+
+            for mismatch in mismatches:
+                if mismatch["actual"] is None:
+                    print(f"❌ User {mismatch['user_id']}: no summary row")
+                else:
+                    print(f"❌ User {mismatch['user_id']}")
+                    for field, expected in mismatch["expected"].items():
+                        actual = mismatch["actual"][field]
+                        if actual != expected:
+                            print(f"   {field:<20} stored={actual!s:>26}  raw={expected!s:>26}")
+
+            if args.fix and mismatches:
+                await service.refresh(db, [mismatch["user_id"] for mismatch in mismatches])
+                await db.commit()
+                fixed += len(mismatches)
+
+    if not mismatched:
+        print("✅ All billing summaries match invoices and servers")
+        return 0
+    if args.fix:
+        print(f"✅ Refreshed {fixed} billing summary row(s)")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check materialized billing summaries")
+    parser.add_argument("--user-id", type=int, action="append", default=None, help="Limit to these users")
+    parser.add_argument("--batch-size", type=int, default=5000, help="User ids verified per batch")
+    parser.add_argument("--fix", action="store_true", help="Rewrite drifted or missing rows from the raw tables")
+
+    sys.exit(asyncio.run(main(parser.parse_args())))